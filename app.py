@@ -1,16 +1,29 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
+import json
 import os
 from bot import Bot
+from knowledge_base_store import knowledge_base_settings
+from llm_client import configure
+
+# Load .env and create the LLM clients before reading settings
+configure()
 
 app = Flask(__name__)
 
-# Global bot instance
-bot = Bot()
+# Global bot instance; set KB_RELOAD_INTERVAL (seconds) to hot-reload the knowledge base,
+# and KB_AUTO_BUILD=0 to serve an index prebuilt with `python -m knowledge_base_store build`.
+# The other KB_* settings are shared with that command, so both see the same index
+bot = Bot(
+    kb_reload_interval=float(os.getenv('KB_RELOAD_INTERVAL', '0')) or None,
+    kb_auto_build=os.getenv('KB_AUTO_BUILD', '1') != '0',
+    kb_options=knowledge_base_settings()
+)
 
 def initialize_bot():
     """Initialize the bot with workflows"""
     bot.load_workflow("edibility_determination", "workflows/edibility_determination.yaml")
-    bot.load_workflow("good_pet_determination", "workflows/good_pet_determination.yaml")
+    # Pet questions never need cooking instructions
+    bot.load_workflow("good_pet_determination", "workflows/good_pet_determination.yaml", kb_namespaces=["general"])
     
     # Add greeting message
     bot.get_greeting_message()
@@ -100,6 +113,56 @@ def generate_response():
         print(f"Error in generate_response: {error_trace}")
         return jsonify({'error': f'Failed to process bot response: {str(e)}'}), 500
 
+@app.route('/api/generate_response_stream', methods=['GET'])
+def generate_response_stream():
+    """
+    Process bot response as a Server-Sent Events stream.
+    
+    "token" events carry the reply text as the LLM generates it; the final "done"
+    event carries the same payload as /api/generate_response ("error" on failure).
+    """
+    import asyncio
+    import queue
+    import threading
+    
+    if not any(msg.role == 'user' for msg in bot.messages):
+        return jsonify({'error': 'No user message to process'}), 400
+    
+    events = queue.Queue()
+    
+    def run():
+        try:
+            bot_messages = asyncio.run(bot.generate_response(
+                on_text=lambda text: events.put(('token', {'text': text}))
+            ))
+            events.put(('done', {
+                'bot_messages': [msg.to_dict() for msg in bot_messages],
+                'current_options': list(bot.active_node.options.keys()) if bot.active_node else [],
+                'active_sidebars': bot.get_active_sidebars(),
+                'can_go_back': bot.can_go_back(),
+                'current_workflow': bot.get_current_workflow_name(),
+                'knowledge_snippets': bot.last_knowledge_snippets
+            }))
+        except Exception as e:
+            import traceback
+            print(f"Error in generate_response_stream: {traceback.format_exc()}")
+            events.put(('error', {'error': f'Failed to process bot response: {str(e)}'}))
+    
+    # Generate in a worker thread so tokens can be sent while the LLM is still running
+    threading.Thread(target=run, daemon=True).start()
+    
+    def stream():
+        while True:
+            event, data = events.get()
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            if event != 'token':
+                return
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/go_back', methods=['POST'])
 def go_back():
     """Go back one step in the conversation"""
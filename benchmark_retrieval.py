@@ -0,0 +1,250 @@
+"""
+Retrieval benchmark over synthetic corpora.
+
+Generates deterministic random embeddings offline (no API calls), builds the
+exact retriever and each optimized retriever over them, and reports build
+time, index memory, single-query latency percentiles and recall@k against
+exact search as JSON.
+
+Usage:
+    python -m benchmark_retrieval --sizes 1000,100000 --output report.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from knowledge_base_store import (
+    IVFIndex, NumpyEmbeddingRetriever, QuantizedEmbeddings, normalize_rows, recall_at_k
+)
+
+
+def make_corpus(
+    num_rows: int,
+    dimension: int = 256,
+    num_topics: int = 256,
+    seed: int = 0,
+    block_size: int = 65536
+) -> np.ndarray:
+    """
+    Generate a normalized synthetic embedding matrix with topic structure.
+
+    Rows are noisy copies of random topic centers, so nearest neighbours are
+    meaningful for clustering indexes. Per-dimension variance decays, so that
+    leading dimensions carry most of the signal as in text-embedding-3 vectors.
+
+    Args:
+        num_rows: Number of chunks
+        dimension: Embedding size
+        num_topics: Number of topic centers
+        seed: Random seed
+        block_size: Rows generated at a time
+
+    Returns:
+        Float32 matrix of shape (num_rows, dimension) with unit-norm rows
+    """
+    rng = np.random.default_rng(seed)
+    scale = np.linspace(2.0, 0.25, dimension).astype(np.float32)
+    centers = rng.normal(size=(num_topics, dimension)).astype(np.float32) * scale
+
+    embeddings = np.empty((num_rows, dimension), dtype=np.float32)
+    for start in range(0, num_rows, block_size):
+        count = min(block_size, num_rows - start)
+        topics = rng.integers(num_topics, size=count)
+        noise = rng.normal(scale=0.6, size=(count, dimension)).astype(np.float32) * scale
+        embeddings[start:start + count] = normalize_rows(centers[topics] + noise)
+    return embeddings
+
+
+def make_queries(embeddings: np.ndarray, num_queries: int = 200, seed: int = 1) -> np.ndarray:
+    """Generate queries as perturbed copies of random corpus rows."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(embeddings.shape[0], size=min(num_queries, embeddings.shape[0]), replace=False)
+    noise = rng.normal(scale=0.3 / np.sqrt(embeddings.shape[1]), size=(len(rows), embeddings.shape[1]))
+    return normalize_rows(embeddings[rows] + noise.astype(np.float32))
+
+
+def index_nbytes(retriever: Any) -> int:
+    """Bytes held by a retriever's own arrays, excluding the shared full-precision matrix."""
+    total = 0
+    quantized = getattr(retriever, 'quantized', None)
+    if quantized is not None:
+        total += quantized.codes.nbytes + (quantized.scales.nbytes if quantized.scales is not None else 0)
+    coarse = getattr(retriever, 'coarse', None)
+    if coarse is not None:
+        total += coarse.nbytes
+    if isinstance(retriever, IVFIndex):
+        total += retriever.centroids.nbytes + retriever.list_offsets.nbytes + retriever.list_rows.nbytes
+    return total
+
+
+def retriever_builders(
+    rescore_candidates: int = 100,
+    coarse_dimensions: int = 64,
+    ivf_nprobe: int = 8
+) -> Dict[str, Callable[[np.ndarray], Any]]:
+    """Return the optimized retriever configurations to compare against exact search."""
+    def quantized(dtype: str) -> Callable[[np.ndarray], NumpyEmbeddingRetriever]:
+        return lambda embeddings: NumpyEmbeddingRetriever(
+            embeddings,
+            normalized=True,
+            quantized=QuantizedEmbeddings.quantize(embeddings, dtype),
+            rescore_candidates=rescore_candidates
+        )
+
+    return {
+        'float16_rescore': quantized("float16"),
+        'int8_rescore': quantized("int8"),
+        'coarse': lambda embeddings: NumpyEmbeddingRetriever(
+            embeddings,
+            normalized=True,
+            rescore_candidates=rescore_candidates,
+            coarse_dimensions=coarse_dimensions
+        ),
+        'ivf': lambda embeddings: IVFIndex.build(embeddings, nprobe=ivf_nprobe)
+    }
+
+
+def measure_latency(retriever: Any, queries: np.ndarray, top_k: int) -> Dict[str, float]:
+    """Time single-query searches and return latency percentiles in milliseconds."""
+    retriever.search(queries[0], top_k=top_k)  # warm up
+    latencies = []
+    for query in queries:
+        start_time = time.perf_counter()
+        retriever.search(query, top_k=top_k)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(np.mean(latencies))
+    }
+
+
+def benchmark_size(
+    num_rows: int,
+    dimension: int = 256,
+    num_queries: int = 200,
+    top_k: int = 10,
+    retrievers: Optional[List[str]] = None,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Benchmark exact search and the optimized retrievers on one synthetic corpus.
+
+    Args:
+        num_rows: Number of chunks
+        dimension: Embedding size
+        num_queries: Number of timed queries
+        top_k: Results per query
+        retrievers: Names of optimized retrievers to run (default: all)
+        seed: Random seed for the corpus and queries
+
+    Returns:
+        Report with corpus size, generation time and per-retriever results
+    """
+    start_time = time.perf_counter()
+    embeddings = make_corpus(num_rows, dimension, seed=seed)
+    queries = make_queries(embeddings, num_queries, seed=seed + 1)
+    report = {
+        'num_rows': num_rows,
+        'dimension': dimension,
+        'num_queries': len(queries),
+        'top_k': top_k,
+        'corpus_bytes': embeddings.nbytes,
+        'generate_seconds': time.perf_counter() - start_time,
+        'retrievers': {}
+    }
+
+    exact = NumpyEmbeddingRetriever(embeddings, normalized=True)
+    exact_indices, _ = exact.search_batch(queries, top_k=top_k)
+    report['retrievers']['exact'] = {
+        'build_seconds': 0.0,
+        'index_bytes': 0,
+        'recall': 1.0,
+        **measure_latency(exact, queries, top_k)
+    }
+
+    builders = retriever_builders()
+    for name in retrievers or builders:
+        start_time = time.perf_counter()
+        retriever = builders[name](embeddings)
+        build_seconds = time.perf_counter() - start_time
+
+        indices, _ = retriever.search_batch(queries, top_k=top_k)
+        report['retrievers'][name] = {
+            'build_seconds': build_seconds,
+            'index_bytes': index_nbytes(retriever),
+            'recall': recall_at_k(indices, exact_indices),
+            **measure_latency(retriever, queries, top_k)
+        }
+        print(f"{num_rows} rows, {name}: recall {report['retrievers'][name]['recall']:.3f}, "
+              f"p50 {report['retrievers'][name]['p50_ms']:.2f}ms", file=sys.stderr)
+
+    return report
+
+
+def run_benchmark(
+    sizes: List[int],
+    dimension: int = 256,
+    num_queries: int = 200,
+    top_k: int = 10,
+    retrievers: Optional[List[str]] = None,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """Benchmark every corpus size and return the full report."""
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine()
+        },
+        'results': [
+            benchmark_size(size, dimension, num_queries, top_k, retrievers, seed)
+            for size in sizes
+        ]
+    }
+
+
+def parse_sizes(value: str) -> List[int]:
+    """Parse a comma-separated size list; accepts k/M suffixes (e.g. "1k,100k,1M")."""
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    sizes = []
+    for item in value.split(','):
+        item = item.strip().lower()
+        multiplier = multipliers.get(item[-1:], 1)
+        sizes.append(int(float(item[:-1] if multiplier > 1 else item) * multiplier))
+    return sizes
+
+
+def main(argv: Optional[List[str]] = None):
+    """Command-line entry point: `python -m benchmark_retrieval [options]`."""
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark_retrieval",
+        description="Benchmark retrievers on synthetic corpora and print a JSON report."
+    )
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("1k,100k,1M"),
+                        help="Comma-separated corpus sizes, e.g. 1k,100k,1M")
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--retrievers", type=lambda value: value.split(','), default=None,
+                        help=f"Subset of {','.join(retriever_builders())}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the report here instead of stdout")
+
+    args = parser.parse_args(argv)
+    report = run_benchmark(args.sizes, args.dimension, args.queries, args.top_k, args.retrievers, args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
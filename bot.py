@@ -1,4 +1,4 @@
-from typing import Dict, Optional, Any, List
+from typing import Callable, Dict, Optional, Any, List
 from datetime import datetime
 from dataclasses import dataclass
 import asyncio
@@ -35,6 +35,13 @@ class Bot:
         embedding_model: str = "text-embedding-3-small", 
         knowledge_base_dir: str = "knowledge_base", 
         cache_dir: str = ".cache", 
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        embedding_dimensions: Optional[int] = None,
+        kb_reload_interval: Optional[float] = None,
+        kb_auto_build: bool = True,
+        kb_namespaces: Optional[Dict[str, List[str]]] = None,
+        kb_options: Optional[Dict[str, Any]] = None,
         context_messages_count: int = 5, 
         relevance_model: str = "gpt-4.1-mini", 
         relevance_messages_count: int = 5, 
@@ -49,6 +56,8 @@ class Bot:
         
         # Bot functionality
         self.workflows: Dict[str, Workflow] = {}
+        # Knowledge base namespaces searched while a workflow is active (None searches everything)
+        self.workflow_namespaces: Dict[str, Optional[List[str]]] = {}
         self.context_messages_count = context_messages_count
         
         # Relevance filtering parameters
@@ -61,12 +70,22 @@ class Bot:
         # Query rewriting parameters
         self.rewriter_model = rewriter_model
         
-        # Knowledge base
-        self.knowledge_base = KnowledgeBaseStore(
-            knowledge_base_dir=knowledge_base_dir,
-            cache_dir=cache_dir,
-            model_name=embedding_model
-        )
+        # Knowledge base; kb_options are further KnowledgeBaseStore arguments, e.g. the
+        # shared knowledge_base_settings(), and take precedence over the ones above
+        self.knowledge_base = KnowledgeBaseStore(**{
+            'knowledge_base_dir': knowledge_base_dir,
+            'cache_dir': cache_dir,
+            'model_name': embedding_model,
+            'chunk_size': chunk_size,
+            'chunk_overlap': chunk_overlap,
+            'embedding_dimensions': embedding_dimensions,
+            'auto_build': kb_auto_build,
+            'namespaces': kb_namespaces,
+            **(kb_options or {})
+        })
+        # Pick up knowledge base edits without a restart
+        if kb_reload_interval:
+            self.knowledge_base.start_watcher(kb_reload_interval)
         self.last_knowledge_snippets: List[Dict[str, Any]] = []
     
     # Former ConversationState methods
@@ -149,9 +168,10 @@ class Bot:
             "relevant information along the way. To get started, please select or start a workflow."
         )
     
-    def load_workflow(self, name: str, file_path: str):
-        """Load a workflow for use"""
+    def load_workflow(self, name: str, file_path: str, kb_namespaces: Optional[List[str]] = None):
+        """Load a workflow for use, optionally restricting knowledge base retrieval to some namespaces"""
         self.workflows[name] = Workflow(name, file_path)
+        self.workflow_namespaces[name] = kb_namespaces
     
     def start_workflow(self, workflow_name: str) -> Message:
         """Start a new workflow"""
@@ -184,8 +204,13 @@ class Bot:
         for bot_msg in bot_messages:
             yield bot_msg
     
-    async def generate_response(self) -> List[Message]:
-        """Process bot response based on the last user message, with tool calling support"""
+    async def generate_response(self, on_text: Optional[Callable[[str], None]] = None) -> List[Message]:
+        """
+        Process bot response based on the last user message, with tool calling support.
+        
+        Args:
+            on_text: Optional callback receiving the reply text as it streams from the LLM
+        """
         # Get context for LLM decision
         available_workflows = list(self.workflows.keys())
         
@@ -207,7 +232,8 @@ class Bot:
                 self.active_node, 
                 context, 
                 self.generator_model,
-                tools=tools
+                tools=tools,
+                on_text=on_text
             )
             
             # Check if there are tool calls to execute
@@ -326,7 +352,9 @@ class Bot:
         
         # Use query rewriter to generate an effective search query from the entire conversation
         try:
-            query_string = await rewrite_query_for_search(self.messages, self.rewriter_model)
+            query_string = await rewrite_query_for_search(
+                self.messages, self.rewriter_model, max_history_messages=self.context_messages_count
+            )
         except Exception as e:
             print(f"Error rewriting query: {e}")
             # Fallback: use the last user message
@@ -343,20 +371,21 @@ class Bot:
         
         try:
             # Retrieve potential snippets from knowledge base
-            snippets = self.knowledge_base.retrieve_snippets(query_string, top_k=3)
+            # Inside a workflow, only search the namespaces it declared
+            namespace = self.workflow_namespaces.get(self.get_current_workflow_name())
+            snippets = await self.knowledge_base.retrieve_snippets_async(query_string, top_k=3, namespace=namespace)
             
             if not snippets:
                 return ""
             
-            # Get messages for relevance evaluation (last n messages)
-            relevance_messages = self.messages[-self.relevance_messages_count:]
-            
-            # Run all relevance checks in parallel
+            # Run all relevance checks in parallel, each seeing the last n messages
+            # (the budgeter keeps tool calls and their results together)
             relevance_tasks = [
                 is_relevant(
-                    messages=relevance_messages,
+                    messages=self.messages,
                     snippet=snippet['content'],
-                    model=self.relevance_model
+                    model=self.relevance_model,
+                    max_history_messages=self.relevance_messages_count
                 )
                 for snippet in snippets
             ]
@@ -0,0 +1,136 @@
+"""
+Micro-batching of concurrent async embedding requests.
+
+Texts requested by concurrent coroutines within a short window are sent to the
+API as one batched call, and the vectors are fanned back out to each waiting
+caller. A text that is already waiting or in flight is not requested twice.
+asyncio futures belong to one event loop, so pending state is kept per loop
+(app.py runs each request in a fresh loop).
+"""
+
+import asyncio
+import weakref
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Texts are batched per (model, dimensions)
+BatchKey = Tuple[str, Optional[int]]
+
+
+class _LoopState:
+    """Pending and in-flight requests of one event loop."""
+
+    def __init__(self):
+        self.futures: Dict[Tuple[str, Optional[int], str], asyncio.Future] = {}
+        self.queues: Dict[BatchKey, List[str]] = {}
+        self.timers: Dict[BatchKey, asyncio.TimerHandle] = {}
+        self.tasks = set()
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into batched API calls.
+
+    A batch is sent max_wait seconds after its first text arrives, or as soon
+    as it holds max_batch_size texts, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        create_embeddings: Callable[[List[str], str, Optional[int]], Awaitable[List[List[float]]]],
+        max_wait: float = 0.005,
+        max_batch_size: int = 64
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            create_embeddings: Coroutine function embedding a list of texts (texts, model, dimensions)
+            max_wait: Seconds to wait for more texts before sending a batch
+            max_batch_size: Maximum texts per API call
+        """
+        self.create_embeddings = create_embeddings
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self.batches_sent = 0
+        self.texts_sent = 0
+        self.texts_requested = 0
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+
+    async def embed(self, texts: List[str], model: str, dimensions: Optional[int] = None) -> List[List[float]]:
+        """
+        Embed texts as part of the current batch.
+
+        Args:
+            texts: Texts to embed
+            model: Embedding model to use
+            dimensions: Optional shortened embedding size
+
+        Returns:
+            List of embedding vectors in input order; raises the batch's error if its API call failed
+        """
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState()
+
+        group = (model, dimensions)
+        futures = []
+        for text in texts:
+            self.texts_requested += 1
+            future = state.futures.get((model, dimensions, text))
+            if future is None:
+                future = state.futures[(model, dimensions, text)] = loop.create_future()
+                queue = state.queues.setdefault(group, [])
+                queue.append(text)
+                if len(queue) >= self.max_batch_size:
+                    self._flush(state, group)
+                elif group not in state.timers:
+                    state.timers[group] = loop.call_later(self.max_wait, self._flush, state, group)
+            futures.append(future)
+
+        # Shielded, so a cancelled caller does not cancel the result for other callers
+        return list(await asyncio.shield(asyncio.gather(*futures)))
+
+    def _flush(self, state: _LoopState, group: BatchKey):
+        """Send the queued texts of a group as one API call."""
+        timer = state.timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        texts = state.queues.pop(group, [])
+        if texts:
+            task = asyncio.ensure_future(self._send(state, group, texts))
+            state.tasks.add(task)
+            task.add_done_callback(state.tasks.discard)
+
+    async def _send(self, state: _LoopState, group: BatchKey, texts: List[str]):
+        model, dimensions = group
+        self.batches_sent += 1
+        self.texts_sent += len(texts)
+        futures = [state.futures[(model, dimensions, text)] for text in texts]
+        error: Optional[BaseException] = None
+        try:
+            embeddings = await self.create_embeddings(texts, model, dimensions)
+            if len(embeddings) != len(texts):
+                raise ValueError(f"Embedding API returned {len(embeddings)} embeddings for {len(texts)} texts")
+            for future, embedding in zip(futures, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+        except Exception as e:
+            error = e
+        except BaseException:
+            # Cancelled, e.g. at loop shutdown: still release every waiter before propagating
+            error = RuntimeError("Embedding batch was cancelled")
+            raise
+        finally:
+            for text, future in zip(texts, futures):
+                state.futures.pop((model, dimensions, text), None)
+                if error is not None and not future.done():
+                    future.set_exception(error)
+
+    def stats(self) -> Dict[str, int]:
+        """Counts of texts requested by callers versus texts and batches sent to the API."""
+        return {
+            'texts_requested': self.texts_requested,
+            'texts_sent': self.texts_sent,
+            'batches_sent': self.batches_sent
+        }
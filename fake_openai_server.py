@@ -0,0 +1,317 @@
+"""
+Local stand-in for the OpenAI API, for offline load and latency testing.
+
+Implements /v1/chat/completions (including tool calls and streaming) and
+/v1/embeddings with deterministic responses: the same request always gets the
+same content, tool call or embedding. Latency follows a lognormal distribution
+and a configurable fraction of requests fail with 500 or 429 errors.
+
+Point the app at it with the OPENAI_BASE_URL setting:
+
+    python -m fake_openai_server --port 8001 --latency-ms 400 --error-rate 0.01
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=fake python app.py
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import numpy as np
+from flask import Flask, Response, jsonify, request
+
+# Embedding sizes of known models (others default to 1536)
+EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536
+}
+
+FILLER_WORDS = (
+    "pokemon", "trainer", "berry", "safe", "care", "food", "habitat", "gentle", "wild", "type",
+    "friendly", "evolve", "health", "diet", "sleep", "play", "water", "fire", "grass", "electric"
+)
+
+# Keys of a JSON template in a prompt, with the start of their example value
+TEMPLATE_FIELD = re.compile(r'"(\w+)"\s*:\s*([^\n,}]*)')
+
+
+@dataclass
+class FakeServerConfig:
+    """Behaviour of the fake server; latencies are in milliseconds."""
+    latency_ms: float = 300.0
+    latency_sigma: float = 0.5
+    token_latency_ms: float = 20.0
+    embedding_latency_ms: float = 50.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    tool_call_rate: float = 0.0
+    completion_words: int = 30
+    seed: int = 0
+
+
+def request_digest(payload: Any) -> bytes:
+    """Stable hash of a request, from which its deterministic response is derived."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).digest()
+
+
+def digest_fraction(digest: bytes) -> float:
+    """Map a digest to a number in [0, 1)."""
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+
+def fake_text(digest: bytes, messages: List[Dict[str, Any]], num_words: int) -> str:
+    """Deterministic reply text: a reference to the last user message plus filler words."""
+    last_user = next((str(m.get('content') or '') for m in reversed(messages) if m.get('role') == 'user'), '')
+    rng = random.Random(digest)
+    words = " ".join(rng.choice(FILLER_WORDS) for _ in range(num_words))
+    return f"Reply to \"{last_user[:60]}\": {words}."
+
+
+def fake_json_content(prompt: str, text: str) -> str:
+    """
+    Fill the JSON template described in a prompt.
+
+    Fields whose example value is true/false become true, numeric examples
+    become 0.5, examples ending in "or null" become null, and everything else
+    gets the reply text.
+    """
+    result = {}
+    for key, example in TEMPLATE_FIELD.findall(prompt):
+        example = example.strip()
+        if key in result:
+            continue
+        if example.startswith("true"):
+            result[key] = True
+        elif example[:1].isdigit():
+            result[key] = 0.5
+        elif example.endswith("or null"):
+            result[key] = None
+        else:
+            result[key] = text
+    return json.dumps(result)
+
+
+def fake_arguments(parameters: Dict[str, Any]) -> str:
+    """Arguments for a tool call that satisfy the required parameters of its schema."""
+    defaults = {"string": "1", "integer": 1, "number": 1.0, "boolean": True, "array": [], "object": {}}
+    properties = parameters.get("properties", {})
+    return json.dumps({
+        name: defaults.get(properties.get(name, {}).get("type"), "1")
+        for name in parameters.get("required", [])
+    })
+
+
+def fake_embedding(text: str, model: str, dimensions: int) -> np.ndarray:
+    """Deterministic unit-norm embedding of a text."""
+    seed = int.from_bytes(hashlib.sha256(f"{model}\n{text}".encode('utf-8')).digest()[:8], 'big')
+    vector = np.random.default_rng(seed).normal(size=dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def create_app(config: Optional[FakeServerConfig] = None) -> Flask:
+    """
+    Build the fake OpenAI Flask app.
+
+    Args:
+        config: Server behaviour (defaults to FakeServerConfig())
+
+    Returns:
+        Flask app serving the /v1 endpoints
+    """
+    config = config or FakeServerConfig()
+    app = Flask(__name__)
+    rng = random.Random(config.seed)
+    rng_lock = threading.Lock()
+
+    def draw_latency(median_ms: float) -> float:
+        """Lognormal latency in seconds with the given median."""
+        if median_ms <= 0:
+            return 0.0
+        with rng_lock:
+            return median_ms / 1000 * math.exp(rng.gauss(0, config.latency_sigma))
+
+    def injected_error() -> Optional[Response]:
+        with rng_lock:
+            draw = rng.random()
+        if draw < config.rate_limit_rate:
+            response = jsonify({'error': {'message': 'Rate limit reached (fake)', 'type': 'rate_limit_error'}})
+            response.status_code = 429
+            response.headers['Retry-After'] = '1'
+            return response
+        if draw < config.rate_limit_rate + config.error_rate:
+            response = jsonify({'error': {'message': 'Internal server error (fake)', 'type': 'server_error'}})
+            response.status_code = 500
+            return response
+        return None
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        body = request.get_json()
+        error = injected_error()
+        if error is not None:
+            return error
+
+        messages = body.get('messages', [])
+        model = body.get('model', 'gpt-4o')
+        tools = body.get('tools') or []
+        digest = request_digest([messages, model, tools])
+        completion_id = f"chatcmpl-fake-{digest.hex()[:16]}"
+
+        message: Dict[str, Any] = {'role': 'assistant', 'content': None}
+        answered_tool = bool(messages) and messages[-1].get('role') == 'tool'
+        if tools and not answered_tool and digest_fraction(digest) < config.tool_call_rate:
+            function = tools[0]['function']
+            message['tool_calls'] = [{
+                'id': f"call_{digest.hex()[16:32]}",
+                'type': 'function',
+                'function': {'name': function['name'], 'arguments': fake_arguments(function.get('parameters', {}))}
+            }]
+            finish_reason = 'tool_calls'
+        else:
+            text = fake_text(digest, messages, config.completion_words)
+            system_prompt = str(messages[0].get('content') or '') if messages else ''
+            message['content'] = fake_json_content(system_prompt, text) if 'JSON' in system_prompt else text
+            finish_reason = 'stop'
+
+        prompt_tokens = count_tokens(json.dumps(messages))
+        completion_tokens = count_tokens(json.dumps(message))
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+
+        time.sleep(draw_latency(config.latency_ms))
+        if not body.get('stream'):
+            return jsonify({
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason}],
+                'usage': usage
+            })
+
+        include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+
+        def chunk(delta: Dict[str, Any], finish: Optional[str] = None, chunk_usage=None) -> str:
+            data = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [] if chunk_usage else [{'index': 0, 'delta': delta, 'finish_reason': finish}]
+            }
+            if chunk_usage:
+                data['usage'] = chunk_usage
+            return f"data: {json.dumps(data)}\n\n"
+
+        def stream():
+            yield chunk({'role': 'assistant', 'content': ''})
+            if message.get('tool_calls'):
+                call = message['tool_calls'][0]
+                yield chunk({'tool_calls': [{
+                    'index': 0, 'id': call['id'], 'type': 'function',
+                    'function': {'name': call['function']['name'], 'arguments': ''}
+                }]})
+                yield chunk({'tool_calls': [{'index': 0, 'function': {'arguments': call['function']['arguments']}}]})
+            else:
+                for token in re.findall(r'\S+\s*|\s+', message['content']):
+                    time.sleep(draw_latency(config.token_latency_ms))
+                    yield chunk({'content': token})
+            yield chunk({}, finish_reason)
+            if include_usage:
+                yield chunk({}, chunk_usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return Response(stream(), mimetype='text/event-stream')
+
+    @app.route('/v1/embeddings', methods=['POST'])
+    def embeddings():
+        body = request.get_json()
+        error = injected_error()
+        if error is not None:
+            return error
+
+        model = body.get('model', 'text-embedding-3-small')
+        texts = body.get('input', [])
+        if isinstance(texts, str):
+            texts = [texts]
+        dimensions = body.get('dimensions') or EMBEDDING_DIMENSIONS.get(model, 1536)
+
+        data = []
+        for index, text in enumerate(texts):
+            vector = fake_embedding(str(text), model, dimensions)
+            if body.get('encoding_format') == 'base64':
+                embedding = base64.b64encode(vector.astype('<f4').tobytes()).decode('ascii')
+            else:
+                embedding = vector.tolist()
+            data.append({'object': 'embedding', 'index': index, 'embedding': embedding})
+
+        tokens = sum(count_tokens(str(text)) for text in texts)
+        time.sleep(draw_latency(config.embedding_latency_ms))
+        return jsonify({
+            'object': 'list',
+            'data': data,
+            'model': model,
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+        })
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None):
+    """Command-line entry point: `python -m fake_openai_server [options]`."""
+    defaults = FakeServerConfig()
+    parser = argparse.ArgumentParser(
+        prog="python -m fake_openai_server",
+        description="Serve a fake OpenAI API for offline load and latency testing."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms,
+                        help="Median completion latency (time to first token when streaming)")
+    parser.add_argument("--latency-sigma", type=float, default=defaults.latency_sigma,
+                        help="Spread of the lognormal latency distribution (0 for constant latency)")
+    parser.add_argument("--token-latency-ms", type=float, default=defaults.token_latency_ms,
+                        help="Median delay between streamed tokens")
+    parser.add_argument("--embedding-latency-ms", type=float, default=defaults.embedding_latency_ms)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate,
+                        help="Fraction of requests failing with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate,
+                        help="Fraction of requests failing with HTTP 429")
+    parser.add_argument("--tool-call-rate", type=float, default=defaults.tool_call_rate,
+                        help="Fraction of requests with tools that answer with a tool call")
+    parser.add_argument("--completion-words", type=int, default=defaults.completion_words)
+    parser.add_argument("--seed", type=int, default=defaults.seed,
+                        help="Seed for latencies and injected errors")
+
+    args = parser.parse_args(argv)
+    config = FakeServerConfig(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        token_latency_ms=args.token_latency_ms,
+        embedding_latency_ms=args.embedding_latency_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        tool_call_rate=args.tool_call_rate,
+        completion_words=args.completion_words,
+        seed=args.seed
+    )
+    print(f"Fake OpenAI API on http://{args.host}:{args.port}/v1")
+    create_app(config).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
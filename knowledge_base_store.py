@@ -1,30 +1,1123 @@
 
 """
-Knowledge Base Store using Haystack for vector storage and retrieval.
+Knowledge Base Store with NumPy vector storage and retrieval.
+
+Embeddings are cached on disk as a contiguous float32 matrix (embeddings.npy,
+memory-mapped at startup) plus a JSON sidecar with chunk contents and metadata.
+Rows are L2-normalized before they are stored, so cosine similarity is a plain
+matrix-vector product.
 """
 
 import os
+import argparse
+import asyncio
+import copy
+import fnmatch
 import json
 import hashlib
 import pickle
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Dict, Any
-from haystack import Document
-from haystack.components.retrievers.in_memory import InMemoryEmbeddingRetriever
-from haystack.document_stores.in_memory import InMemoryDocumentStore
-from llm_client import get_embedding
+from typing import Callable, List, Dict, Any, Iterable, Optional, Sequence, Tuple, Union
+import numpy as np
+from dotenv import load_dotenv
+from llm_client import get_embedding, get_embedding_async, get_embeddings_batched
+
+
+# Bump when chunk_text changes how text is split, so cached indexes are re-chunked
+CHUNKER_VERSION = 2
+
+
+def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[Tuple[int, int, str]]:
+    """
+    Split text into overlapping chunks, preferring paragraph, line and word boundaries.
+    
+    Args:
+        text: Text to split
+        chunk_size: Maximum chunk length in characters
+        chunk_overlap: Number of characters shared between consecutive chunks
+        
+    Returns:
+        List of (start_offset, end_offset, chunk_text) tuples, where
+        text[start_offset:end_offset] == chunk_text
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    if not 0 <= chunk_overlap < chunk_size:
+        raise ValueError(f"chunk_overlap must be in [0, chunk_size), got {chunk_overlap}")
+    
+    chunks = []
+    text_length = len(text)
+    start = 0
+    
+    while start < text_length:
+        end = min(start + chunk_size, text_length)
+        
+        # Break on the last natural boundary in the second half of the window
+        if end < text_length:
+            for separator in ("\n\n", "\n", " "):
+                position = text.rfind(separator, start + chunk_size // 2, end)
+                if position != -1:
+                    end = position + len(separator)
+                    break
+        
+        # Trim surrounding whitespace so offsets point at the chunk content exactly
+        chunk_start, chunk_end = start, end
+        while chunk_start < chunk_end and text[chunk_start].isspace():
+            chunk_start += 1
+        while chunk_end > chunk_start and text[chunk_end - 1].isspace():
+            chunk_end -= 1
+        
+        if chunk_start < chunk_end:
+            chunks.append((chunk_start, chunk_end, text[chunk_start:chunk_end]))
+        
+        if end >= text_length:
+            break
+        
+        # Step back by the overlap, but always make progress, then move forward to the
+        # next whitespace so the next chunk does not open on a word fragment
+        overlap_start = max(end - chunk_overlap, start + 1)
+        if not text[overlap_start - 1].isspace():
+            boundary = next((i for i in range(overlap_start, end) if text[i].isspace()), end)
+            overlap_start = boundary
+        start = overlap_start
+    
+    return chunks
+
+
+def unique_temp_path(path: Path) -> Path:
+    """
+    Return a temporary path next to path, unique to this writer.
+    
+    Writers save to it and then os.replace it over path, so concurrent workers
+    never write into the same temporary file. The suffix is kept because
+    np.save/np.savez append one when it is missing.
+    """
+    return path.with_name(f"{path.stem}.{uuid.uuid4().hex}.tmp{path.suffix}")
+
+
+def hash_file(file_path: str) -> str:
+    """Return the MD5 hex digest of a file's contents."""
+    with open(file_path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def load_file_records(
+    file_path: str,
+    chunk_size: int,
+    chunk_overlap: int
+) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+    """
+    Read and chunk one knowledge base file into chunk records.
+    
+    Module-level (and exception-free) so it can run in a process pool.
+    
+    Returns:
+        Tuple of (records, error); records is None if the file could not be read
+    """
+    path = Path(file_path)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except (UnicodeDecodeError, IOError) as e:
+        return None, str(e)
+    
+    # Split into chunks; empty files produce no chunks
+    records = []
+    for chunk_index, (start_offset, end_offset, chunk) in enumerate(
+        chunk_text(content, chunk_size, chunk_overlap)
+    ):
+        records.append({
+            "content": chunk,
+            "meta": {
+                "file_name": path.name,
+                "file_path": str(path),
+                "chunk_index": chunk_index,
+                "start_offset": start_offset,
+                "end_offset": end_offset
+            }
+        })
+    return records, None
+
+
+# Fixed-size metadata of one chunk; text_offset/text_length locate its UTF-8 text in the blob
+CHUNK_DTYPE = np.dtype([
+    ('file_id', '<i4'),
+    ('chunk_index', '<i4'),
+    ('start_offset', '<i8'),
+    ('end_offset', '<i8'),
+    ('text_offset', '<i8'),
+    ('text_length', '<i8')
+])
+
+
+class ChunkTable:
+    """
+    Chunk records in columnar form: one fixed-size metadata row per chunk, and
+    the text of every chunk in one contiguous UTF-8 blob.
+    
+    Both arrays are memory-mapped from the cache, so loading an index reads no
+    chunk text and creates no per-chunk Python objects; text is decoded only
+    for the rows that are asked for (e.g. the top-k hits of a search).
+    """
+    
+    def __init__(self, files: List[Tuple[str, str]], rows: np.ndarray, text: np.ndarray):
+        """
+        Initialize from prebuilt arrays.
+        
+        Args:
+            files: (file_name, file_path) of every source file, indexed by the rows' file_id
+            rows: Structured array of CHUNK_DTYPE, one row per chunk
+            text: uint8 array with the UTF-8 text of all chunks
+        """
+        self.files = files
+        self.rows = rows
+        self.text = text
+    
+    def __len__(self) -> int:
+        return self.rows.shape[0]
+    
+    @classmethod
+    def empty(cls) -> 'ChunkTable':
+        return cls([], np.zeros(0, dtype=CHUNK_DTYPE), np.zeros(0, dtype=np.uint8))
+    
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> 'ChunkTable':
+        """Build a table from chunk records as produced by load_file_records."""
+        file_ids: Dict[str, int] = {}
+        files = []
+        rows = np.zeros(len(records), dtype=CHUNK_DTYPE)
+        encoded = [record['content'].encode('utf-8') for record in records]
+        for row, record in enumerate(records):
+            meta = record['meta']
+            file_name = meta.get('file_name', 'unknown')
+            if file_name not in file_ids:
+                file_ids[file_name] = len(files)
+                files.append((file_name, meta.get('file_path', 'unknown')))
+            rows[row] = (
+                file_ids[file_name],
+                meta.get('chunk_index', 0),
+                meta.get('start_offset', 0),
+                meta.get('end_offset', len(record['content'])),
+                0,
+                len(encoded[row])
+            )
+        rows['text_offset'] = np.cumsum(rows['text_length']) - rows['text_length']
+        return cls(files, rows, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    
+    def content(self, row: int) -> str:
+        """Decode the text of one chunk."""
+        offset, length = int(self.rows[row]['text_offset']), int(self.rows[row]['text_length'])
+        return self.text[offset:offset + length].tobytes().decode('utf-8')
+    
+    def contents(self, rows: Optional[Iterable[int]] = None) -> List[str]:
+        """Decode the texts of the given chunks (all chunks by default), for index builds."""
+        return [self.content(row) for row in (range(len(self)) if rows is None else rows)]
+    
+    def record(self, row: int) -> Dict[str, Any]:
+        """Return one chunk as a record dict with 'content' and 'meta'."""
+        fields = self.rows[row]
+        file_name, file_path = self.files[int(fields['file_id'])]
+        return {
+            'content': self.content(row),
+            'meta': {
+                'file_name': file_name,
+                'file_path': file_path,
+                'chunk_index': int(fields['chunk_index']),
+                'start_offset': int(fields['start_offset']),
+                'end_offset': int(fields['end_offset'])
+            }
+        }
+    
+    def file_ids(self, file_names: Iterable[str]) -> np.ndarray:
+        """Ids of those of the given files that have chunks in the table."""
+        file_names = set(file_names)
+        return np.array([file_id for file_id, (name, _) in enumerate(self.files) if name in file_names], dtype=np.int32)
+    
+    def take(self, rows: np.ndarray) -> 'ChunkTable':
+        """Return a new in-memory table with only the given rows, dropping files left without chunks."""
+        selected = np.array(self.rows[rows])
+        used_files, selected['file_id'] = np.unique(selected['file_id'], return_inverse=True)
+        text = np.concatenate([self.text[offset:offset + length] for offset, length in zip(
+            selected['text_offset'], selected['text_length']
+        )]) if len(selected) else np.zeros(0, dtype=np.uint8)
+        selected['text_offset'] = np.cumsum(selected['text_length']) - selected['text_length']
+        return ChunkTable([self.files[file_id] for file_id in used_files], selected, text)
+    
+    def concat(self, other: 'ChunkTable') -> 'ChunkTable':
+        """Return a new in-memory table with the rows of other appended."""
+        other_rows = np.array(other.rows)
+        other_rows['file_id'] += len(self.files)
+        other_rows['text_offset'] += self.text.shape[0]
+        return ChunkTable(
+            self.files + other.files,
+            np.concatenate([self.rows, other_rows]),
+            np.concatenate([self.text, other.text])
+        )
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Return a float32 copy of matrix with every row scaled to unit L2 norm (zero rows stay zero)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_rows(scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Select the top_k highest scores in each row of a score matrix.
+    
+    Args:
+        scores: Score matrix of shape (num_queries, num_items)
+        top_k: Number of items to select per row
+        
+    Returns:
+        Tuple of (indices, scores), both of shape (num_queries, min(top_k, num_items)),
+        sorted by descending score
+    """
+    top_k = min(top_k, scores.shape[1])
+    if top_k <= 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(scores.dtype)
+    
+    # argpartition finds the unordered top_k in linear time; only those get sorted
+    if top_k < scores.shape[1]:
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    
+    indices = np.take_along_axis(candidates, order, axis=1)
+    return indices, np.take_along_axis(candidate_scores, order, axis=1)
+
+
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+
+
+class QuantizedEmbeddings:
+    """
+    Compact row-wise quantized copy of a normalized embedding matrix, used for candidate search.
+    
+    float16 halves memory; int8 uses symmetric per-row scales and quarters it.
+    Scoring converts small blocks of rows into a reused float32 buffer that
+    stays in CPU cache, so BLAS does the matrix products. The trade-off is
+    that every scan pays that conversion: a float16 scan runs several times
+    slower than a float32 one (CPUs convert float16 slowly), while int8 stays
+    close to float32. Prefer int8, or float32 when memory is not the limit.
+    """
+    
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray] = None, block_size: int = 256):
+        """
+        Initialize from quantized codes.
+        
+        Args:
+            codes: float16 or int8 matrix of shape (num_items, dimension)
+            scales: Per-row float32 scales (int8 only)
+            block_size: Rows converted to float32 at a time while scoring; small enough to stay in cache
+        """
+        self.codes = codes
+        self.scales = scales
+        self.block_size = block_size
+    
+    @property
+    def dtype(self) -> str:
+        return self.codes.dtype.name
+    
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+    
+    @classmethod
+    def quantize(cls, embeddings: np.ndarray, dtype: str, block_size: int = 256) -> 'QuantizedEmbeddings':
+        """Quantize an embedding matrix to float16 or int8, reading it in blocks."""
+        if dtype == "float16":
+            return cls(np.asarray(embeddings, dtype=np.float16), block_size=block_size)
+        if dtype != "int8":
+            raise ValueError(f"Unsupported quantization dtype: {dtype}")
+        
+        codes = np.empty(embeddings.shape, dtype=np.int8)
+        scales = np.empty(embeddings.shape[0], dtype=np.float32)
+        for start in range(0, embeddings.shape[0], block_size):
+            block = np.asarray(embeddings[start:start + block_size], dtype=np.float32)
+            block_scales = np.abs(block).max(axis=1) / 127.0
+            block_scales[block_scales == 0] = 1.0
+            codes[start:start + block_size] = np.round(block / block_scales[:, np.newaxis])
+            scales[start:start + block_size] = block_scales
+        return cls(codes, scales, block_size=block_size)
+    
+    def dot(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Approximate dot products between queries and (a subset of) the quantized rows.
+        
+        Args:
+            queries: Float32 query matrix of shape (num_queries, dimension)
+            rows: Optional row indices to score instead of all rows
+            
+        Returns:
+            Float32 score matrix of shape (num_queries, num_rows)
+        """
+        num_rows = self.codes.shape[0] if rows is None else len(rows)
+        scores = np.empty((queries.shape[0], num_rows), dtype=np.float32)
+        buffer = np.empty((min(self.block_size, num_rows), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, num_rows, self.block_size):
+            if rows is None:
+                codes = self.codes[start:start + self.block_size]
+            else:
+                codes = self.codes[rows[start:start + self.block_size]]
+            block = buffer[:len(codes)]
+            np.copyto(block, codes)
+            np.matmul(queries, block.T, out=scores[:, start:start + len(codes)])
+        
+        if self.scales is not None:
+            scores *= self.scales if rows is None else self.scales[rows]
+        return scores
+    
+    def save(self, path: Path, index_id: str):
+        """Save the codes, tagged with the id of the embedding cache they were built from."""
+        tmp_path = unique_temp_path(path)
+        arrays = {'codes': self.codes, 'index_id': np.array(index_id)}
+        if self.scales is not None:
+            arrays['scales'] = self.scales
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: Path, index_id: str, num_rows: int) -> Optional['QuantizedEmbeddings']:
+        """Load saved codes, or return None if missing or built from other embeddings."""
+        if not path.exists():
+            return None
+        
+        try:
+            with np.load(path) as data:
+                if str(data['index_id']) != index_id or data['codes'].shape[0] != num_rows:
+                    return None
+                scales = data['scales'] if 'scales' in data.files else None
+                return cls(data['codes'], scales)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Failed to load quantized embeddings: {e}")
+            return None
+
+
+def rescore_rows(
+    embeddings: np.ndarray,
+    query: np.ndarray,
+    rows: np.ndarray,
+    top_k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rank candidate rows of one query by exact similarity against the full-precision matrix.
+    
+    Returns:
+        Tuple of (row indices, cosine scores) of the best top_k candidates
+    """
+    rows = np.sort(rows)  # ascending row order keeps memmap reads sequential
+    exact_scores = np.asarray(embeddings[rows] @ query, dtype=np.float32)
+    best, best_scores = top_k_rows(exact_scores[np.newaxis, :], top_k)
+    return rows[best[0]], best_scores[0]
+
+
+def dot_rows(embeddings: np.ndarray, queries: np.ndarray, rows: np.ndarray, block_size: int = 65536) -> np.ndarray:
+    """Exact dot products between queries and the given rows of the matrix, gathering the rows in blocks."""
+    scores = np.empty((queries.shape[0], len(rows)), dtype=np.float32)
+    for start in range(0, len(rows), block_size):
+        block = np.asarray(embeddings[rows[start:start + block_size]], dtype=np.float32)
+        scores[:, start:start + block_size] = queries @ block.T
+    return scores
+
+
+# Embedding models trained so that a renormalized prefix of each vector is itself a
+# usable embedding, with the prefix length used for coarse first-pass search
+COARSE_DIMENSIONS = {
+    "text-embedding-3-small": 256,
+    "text-embedding-3-large": 256
+}
+
+
+def truncate_embeddings(embeddings: np.ndarray, dimensions: int, block_size: int = 65536) -> np.ndarray:
+    """Return the first `dimensions` columns of each row, renormalized to unit length, reading in blocks."""
+    truncated = np.empty((embeddings.shape[0], dimensions), dtype=np.float32)
+    for start in range(0, embeddings.shape[0], block_size):
+        truncated[start:start + block_size] = normalize_rows(
+            np.asarray(embeddings[start:start + block_size, :dimensions], dtype=np.float32)
+        )
+    return truncated
+
+
+class NumpyEmbeddingRetriever:
+    """
+    Cosine-similarity retriever over an embedding matrix.
+    
+    Scores all rows with one matrix product and selects the top k with argpartition.
+    With quantized embeddings the scan runs over the compact codes, optionally
+    followed by exact rescoring of the best candidates against the full-precision
+    (typically memory-mapped) matrix. With coarse_dimensions the scan runs over a
+    truncated low-dimensional copy instead, and its candidates are always rescored.
+    A subset retriever (see `subset`) searches only some rows of the shared matrices.
+    """
+    
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        normalized: bool = False,
+        quantized: Optional[QuantizedEmbeddings] = None,
+        rescore_candidates: int = 0,
+        coarse_dimensions: int = 0
+    ):
+        """
+        Initialize the retriever.
+        
+        Args:
+            embeddings: Matrix of shape (num_items, dimension); may be a memmap
+            normalized: Whether rows already have unit norm (avoids an in-memory copy)
+            quantized: Optional quantized copy of the embeddings to scan instead
+            rescore_candidates: Number of quantized-scan candidates to rescore exactly (0 disables)
+            coarse_dimensions: Scan a renormalized prefix of this many dimensions first
+                (0 disables); rescores rescore_candidates, or 10 * top_k if that is 0
+        """
+        self.embeddings = embeddings if normalized else normalize_rows(embeddings)
+        self.quantized = quantized
+        self.rescore_candidates = rescore_candidates
+        self.coarse_dimensions = coarse_dimensions
+        self.coarse = None
+        if coarse_dimensions and coarse_dimensions < self.embeddings.shape[1]:
+            self.coarse = truncate_embeddings(self.embeddings, coarse_dimensions)
+        # Sorted global rows searched by a subset retriever (None searches every row)
+        self.rows: Optional[np.ndarray] = None
+    
+    def __len__(self) -> int:
+        return self.embeddings.shape[0] if self.rows is None else len(self.rows)
+    
+    def subset(self, rows: np.ndarray) -> 'NumpyEmbeddingRetriever':
+        """
+        Retriever over some rows of this one, sharing its matrices instead of copying them.
+        
+        Args:
+            rows: Ascending row indices to search
+            
+        Returns:
+            Retriever whose result indices are positions in rows
+        """
+        retriever = copy.copy(self)
+        retriever.rows = rows
+        return retriever
+    
+    def search(self, query_embedding: List[float], top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the rows most similar to a single query.
+        
+        Returns:
+            Tuple of (row indices, cosine scores), sorted by descending score
+        """
+        indices, scores = self.search_batch([query_embedding], top_k)
+        return indices[0], scores[0]
+    
+    def search_batch(self, query_embeddings: List[List[float]], top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the rows most similar to each of many queries with a single matrix product.
+        
+        Returns:
+            Tuple of (row indices, cosine scores), each of shape (num_queries, top_k)
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        if len(self) == 0:
+            return top_k_rows(np.zeros((queries.shape[0], 0), dtype=np.float32), top_k)
+        
+        if self.coarse is not None:
+            coarse = self.coarse if self.rows is None else self.coarse[self.rows]
+            scores = normalize_rows(queries[:, :self.coarse_dimensions]) @ coarse.T
+            num_candidates = max(top_k, self.rescore_candidates or 10 * top_k)
+        elif self.quantized is not None:
+            scores = self.quantized.dot(queries, rows=self.rows)
+            if not self.rescore_candidates:
+                return top_k_rows(scores, top_k)
+            num_candidates = max(top_k, self.rescore_candidates)
+        elif self.rows is None:
+            return top_k_rows(queries @ self.embeddings.T, top_k)
+        else:
+            return top_k_rows(dot_rows(self.embeddings, queries, self.rows), top_k)
+        
+        candidates, _ = top_k_rows(scores, num_candidates)
+        if self.rows is not None:
+            candidates = self.rows[candidates]
+        results = [
+            rescore_rows(self.embeddings, query, query_candidates, top_k)
+            for query, query_candidates in zip(queries, candidates)
+        ]
+        indices = np.stack([rows for rows, _ in results])
+        if self.rows is not None:
+            indices = np.searchsorted(self.rows, indices)
+        return indices, np.stack([scores for _, scores in results])
+
+
+def same_rows(data: Any, rows: Optional[np.ndarray]) -> bool:
+    """Whether a saved index (an open .npz) covers exactly the given rows, or the whole cache if rows is None."""
+    if rows is None:
+        return 'rows' not in data.files
+    return 'rows' in data.files and np.array_equal(data['rows'], rows)
+
+
+class IVFIndex:
+    """
+    Approximate nearest neighbour index with an inverted file (IVF) layout.
+    
+    Rows are clustered with spherical k-means; a query scores the centroids,
+    then exactly scores only the rows in its nprobe closest clusters. Raising
+    nprobe trades latency for recall (nprobe == nlist is exact search).
+    An index built over a subset of rows keeps them in `rows`; its inverted
+    lists and results hold positions in rows, while the matrices stay shared.
+    """
+    
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+        nprobe: int = 8,
+        quantized: Optional[QuantizedEmbeddings] = None,
+        rescore_candidates: int = 0,
+        rows: Optional[np.ndarray] = None
+    ):
+        """
+        Initialize the index from prebuilt cluster data.
+        
+        Args:
+            embeddings: Normalized embedding matrix the index was built over
+            centroids: Normalized cluster centroids, shape (nlist, dimension)
+            list_offsets: Start of each cluster's rows in list_rows, shape (nlist + 1,)
+            list_rows: Row indices grouped by cluster
+            nprobe: Number of closest clusters to scan per query
+            quantized: Optional quantized copy of the embeddings to score candidates with
+            rescore_candidates: Number of quantized candidates to rescore exactly (0 disables)
+            rows: Ascending rows of embeddings the index covers (None for all rows)
+        """
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.nprobe = nprobe
+        self.quantized = quantized
+        self.rescore_candidates = rescore_candidates
+        self.rows = rows
+    
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+    
+    def __len__(self) -> int:
+        return self.embeddings.shape[0] if self.rows is None else len(self.rows)
+    
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        iterations: int = 10,
+        max_training_rows: int = 100_000,
+        seed: int = 0,
+        rows: Optional[np.ndarray] = None
+    ) -> 'IVFIndex':
+        """
+        Cluster a normalized embedding matrix and build the inverted lists.
+        
+        Args:
+            embeddings: Normalized embedding matrix of shape (num_items, dimension)
+            nlist: Number of clusters (defaults to about 4 * sqrt(num_items))
+            nprobe: Number of closest clusters to scan per query
+            iterations: k-means iterations
+            max_training_rows: Rows sampled to train the centroids
+            seed: Random seed for sampling and initialization
+            rows: Ascending rows to index instead of the whole matrix
+        """
+        num_rows = embeddings.shape[0] if rows is None else len(rows)
+        if nlist is None:
+            nlist = int(4 * np.sqrt(num_rows))
+        nlist = max(1, min(nlist, num_rows))
+        
+        rng = np.random.default_rng(seed)
+        training_rows = np.sort(rng.choice(num_rows, size=min(num_rows, max_training_rows), replace=False))
+        if rows is not None:
+            training_rows = rows[training_rows]
+        training_data = np.asarray(embeddings[training_rows], dtype=np.float32)
+        
+        # Spherical k-means: assign to the most similar centroid, re-normalize the means
+        centroids = training_data[rng.choice(len(training_data), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = cls._assign(training_data, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, training_data)
+            counts = np.bincount(assignments, minlength=nlist)
+            
+            # Re-seed empty clusters with random training rows
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                sums[empty] = training_data[rng.choice(len(training_data), size=len(empty))]
+            centroids = normalize_rows(sums)
+        
+        # Assign every row and group row ids by cluster
+        assignments = cls._assign(embeddings, centroids, rows=rows)
+        list_rows = np.argsort(assignments, kind='stable')
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=list_offsets[1:])
+        
+        return cls(embeddings, centroids, list_offsets, list_rows, nprobe=nprobe, rows=rows)
+    
+    @staticmethod
+    def _assign(
+        data: np.ndarray,
+        centroids: np.ndarray,
+        rows: Optional[np.ndarray] = None,
+        block_size: int = 65536
+    ) -> np.ndarray:
+        """Return the index of the most similar centroid for every row (or the given rows), in memory-bounded blocks."""
+        num_rows = data.shape[0] if rows is None else len(rows)
+        assignments = np.empty(num_rows, dtype=np.int64)
+        for start in range(0, num_rows, block_size):
+            block_rows = slice(start, start + block_size) if rows is None else rows[start:start + block_size]
+            block = np.asarray(data[block_rows], dtype=np.float32)
+            assignments[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+    
+    def search(self, query_embedding: List[float], top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the rows most similar to a single query among the probed clusters.
+        
+        Returns:
+            Tuple of (row indices, cosine scores), sorted by descending score
+        """
+        indices, scores = self.search_batch([query_embedding], top_k)
+        return indices[0], scores[0]
+    
+    def search_batch(self, query_embeddings: List[List[float]], top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the rows most similar to each query among its probed clusters.
+        
+        Returns:
+            Tuple of (row indices, cosine scores), each of shape (num_queries, top_k);
+            rows are padded with -1 and -inf if the probed clusters hold fewer than top_k rows
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        top_k = min(top_k, len(self))
+        
+        # Score centroids for all queries at once
+        probes, _ = top_k_rows(queries @ self.centroids.T, self.nprobe)
+        
+        indices = np.full((queries.shape[0], top_k), -1, dtype=np.int64)
+        scores = np.full((queries.shape[0], top_k), -np.inf, dtype=np.float32)
+        for query_index, (query, clusters) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([
+                self.list_rows[self.list_offsets[cluster]:self.list_offsets[cluster + 1]]
+                for cluster in clusters
+            ])
+            if self.rows is not None:
+                candidates = self.rows[candidates]
+            
+            if self.quantized is None:
+                best_rows, best_scores = rescore_rows(self.embeddings, query, candidates, top_k)
+            else:
+                candidate_scores = self.quantized.dot(query[np.newaxis, :], rows=candidates)
+                if self.rescore_candidates:
+                    best, _ = top_k_rows(candidate_scores, max(top_k, self.rescore_candidates))
+                    best_rows, best_scores = rescore_rows(self.embeddings, query, candidates[best[0]], top_k)
+                else:
+                    best, best_scores = top_k_rows(candidate_scores, top_k)
+                    best_rows, best_scores = candidates[best[0]], best_scores[0]
+            
+            if self.rows is not None:
+                best_rows = np.searchsorted(self.rows, best_rows)
+            found = len(best_rows)
+            indices[query_index, :found] = best_rows
+            scores[query_index, :found] = best_scores
+        
+        return indices, scores
+    
+    def save(self, path: Path, index_id: str):
+        """Save the cluster data, tagged with the id of the embedding cache it was built from."""
+        tmp_path = unique_temp_path(path)
+        arrays = {
+            'centroids': self.centroids,
+            'list_offsets': self.list_offsets,
+            'list_rows': self.list_rows,
+            'index_id': np.array(index_id)
+        }
+        if self.rows is not None:
+            arrays['rows'] = self.rows
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(
+        cls,
+        path: Path,
+        embeddings: np.ndarray,
+        index_id: str,
+        nprobe: int = 8,
+        rows: Optional[np.ndarray] = None
+    ) -> Optional['IVFIndex']:
+        """Load a saved index, or return None if it is missing or was built from other embeddings or rows."""
+        if not path.exists():
+            return None
+        
+        try:
+            with np.load(path) as data:
+                num_rows = embeddings.shape[0] if rows is None else len(rows)
+                if (
+                    str(data['index_id']) != index_id
+                    or data['list_rows'].shape[0] != num_rows
+                    or not same_rows(data, rows)
+                ):
+                    return None
+                return cls(
+                    embeddings,
+                    data['centroids'],
+                    data['list_offsets'],
+                    data['list_rows'],
+                    nprobe=nprobe,
+                    rows=rows
+                )
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Failed to load IVF index: {e}")
+            return None
+
+
+def recall_at_k(approximate_indices: np.ndarray, exact_indices: np.ndarray) -> float:
+    """Fraction of the exact top-k rows that the approximate search also returned, averaged over queries."""
+    if exact_indices.size == 0:
+        return 1.0
+    hits = sum(
+        len(np.intersect1d(approximate_row, exact_row))
+        for approximate_row, exact_row in zip(approximate_indices, exact_indices)
+    )
+    return hits / exact_indices.size
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens for lexical search."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 lexical index over chunk contents.
+    
+    Postings are stored compactly in CSR layout: for each vocabulary term, a
+    slice of ascending row ids and the term's frequency in each row. The
+    sorted vocabulary is one UTF-8 byte blob plus offsets, looked up by binary
+    search, so no per-term Python objects are built when an index is loaded.
+    """
+    
+    def __init__(
+        self,
+        vocabulary: np.ndarray,
+        vocabulary_offsets: np.ndarray,
+        term_offsets: np.ndarray,
+        posting_rows: np.ndarray,
+        posting_counts: np.ndarray,
+        document_lengths: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75
+    ):
+        """
+        Initialize the index from prebuilt postings.
+        
+        Args:
+            vocabulary: Sorted terms, UTF-8 encoded and concatenated (uint8)
+            vocabulary_offsets: Start of each term in vocabulary, shape (num_terms + 1,)
+            term_offsets: Start of each term's postings, shape (num_terms + 1,)
+            posting_rows: Row ids of all postings, ascending within each term
+            posting_counts: Term frequency of each posting
+            document_lengths: Token count of every row
+            k1: BM25 term frequency saturation
+            b: BM25 length normalization
+        """
+        self.vocabulary = vocabulary
+        self.vocabulary_offsets = vocabulary_offsets
+        self.term_offsets = term_offsets
+        self.posting_rows = posting_rows
+        self.posting_counts = posting_counts
+        self.document_lengths = document_lengths
+        self.k1 = k1
+        self.b = b
+        
+        self.num_documents = len(document_lengths)
+        average_length = document_lengths.mean() if self.num_documents else 1.0
+        # Per-row length normalization term of the BM25 denominator, precomputed
+        self._length_norms = (k1 * (1 - b + b * document_lengths / max(average_length, 1.0))).astype(np.float32)
+    
+    def __len__(self) -> int:
+        return self.num_documents
+    
+    @classmethod
+    def build(cls, texts: List[str], k1: float = 1.5, b: float = 0.75) -> 'BM25Index':
+        """Tokenize texts and build the inverted index."""
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        document_lengths = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            document_lengths[row] = len(tokens)
+            for term, count in Counter(tokens).items():
+                postings.setdefault(term, []).append((row, count))
+        
+        # Code point order is UTF-8 byte order, which the binary search in _term_id relies on
+        terms = sorted(postings)
+        encoded = [term.encode('utf-8') for term in terms]
+        vocabulary = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        vocabulary_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=vocabulary_offsets[1:])
+        
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(postings[term]) for term in terms], out=term_offsets[1:])
+        posting_rows = np.fromiter(
+            (row for term in terms for row, _ in postings[term]), dtype=np.int32, count=term_offsets[-1]
+        )
+        posting_counts = np.fromiter(
+            (count for term in terms for _, count in postings[term]), dtype=np.float32, count=term_offsets[-1]
+        )
+        return cls(
+            vocabulary, vocabulary_offsets, term_offsets, posting_rows, posting_counts, document_lengths, k1=k1, b=b
+        )
+    
+    def _term_id(self, term: str) -> Optional[int]:
+        """Binary-search the sorted vocabulary for a term; None if it is not in it."""
+        key = term.encode('utf-8')
+        low, high = 0, len(self.vocabulary_offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self.vocabulary[self.vocabulary_offsets[middle]:self.vocabulary_offsets[middle + 1]].tobytes()
+            if candidate == key:
+                return middle
+            if candidate < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+    
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, counts) of a term, empty if it is not in the vocabulary."""
+        term_id = self._term_id(term)
+        if term_id is None:
+            return self.posting_rows[:0], self.posting_counts[:0]
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        return self.posting_rows[start:end], self.posting_counts[start:end]
+    
+    def idf(self, term: str) -> float:
+        """BM25 inverse document frequency of a term (0 for unknown terms)."""
+        document_frequency = len(self._postings(term)[0])
+        if not document_frequency:
+            return 0.0
+        return float(np.log1p((self.num_documents - document_frequency + 0.5) / (document_frequency + 0.5)))
+    
+    def search(self, query: str, top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score rows containing any query term.
+        
+        Returns:
+            Tuple of (row indices, BM25 scores) of the best matching rows, sorted
+            by descending score; rows with no matching term are never returned
+        """
+        scores = np.zeros(self.num_documents, dtype=np.float32)
+        for term in set(tokenize(query)):
+            rows, counts = self._postings(term)
+            if len(rows):
+                scores[rows] += self.idf(term) * counts * (self.k1 + 1) / (counts + self._length_norms[rows])
+        
+        indices, top_scores = top_k_rows(scores[np.newaxis, :], top_k)
+        matched = top_scores[0] > 0
+        return indices[0][matched], top_scores[0][matched]
+    
+    def matched_idf_fraction(self, query: str, row: int) -> float:
+        """
+        Share of the query's total IDF weight carried by terms that occur in the given row.
+        
+        Terms missing from the vocabulary count with the weight of the rarest
+        possible term, so queries with unknown words are never considered covered.
+        """
+        unknown_idf = float(np.log1p((self.num_documents + 0.5) / 0.5))
+        total = matched = 0.0
+        for term in set(tokenize(query)):
+            rows, _ = self._postings(term)
+            idf = self.idf(term) if len(rows) else unknown_idf
+            total += idf
+            position = np.searchsorted(rows, row)
+            if position < len(rows) and rows[position] == row:
+                matched += idf
+        return matched / total if total else 0.0
+    
+    def save(self, path: Path, index_id: str, rows: Optional[np.ndarray] = None):
+        """
+        Save the postings, tagged with the id of the embedding cache they were built from.
+        
+        Args:
+            path: Destination .npz file
+            index_id: Id of the embedding cache
+            rows: Global rows of the chunks, for an index over a subset of the cache
+        """
+        tmp_path = unique_temp_path(path)
+        arrays = {
+            'vocabulary': self.vocabulary,
+            'vocabulary_offsets': self.vocabulary_offsets,
+            'term_offsets': self.term_offsets,
+            'posting_rows': self.posting_rows,
+            'posting_counts': self.posting_counts,
+            'document_lengths': self.document_lengths,
+            'index_id': np.array(index_id)
+        }
+        if rows is not None:
+            arrays['rows'] = rows
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(
+        cls,
+        path: Path,
+        index_id: str,
+        num_rows: int,
+        k1: float = 1.5,
+        b: float = 0.75,
+        rows: Optional[np.ndarray] = None
+    ) -> Optional['BM25Index']:
+        """Load saved postings, or return None if missing or built from another cache or other rows."""
+        if not path.exists():
+            return None
+        
+        try:
+            with np.load(path) as data:
+                if (
+                    str(data['index_id']) != index_id
+                    or data['document_lengths'].shape[0] != num_rows
+                    or not same_rows(data, rows)
+                ):
+                    return None
+                return cls(
+                    data['vocabulary'],
+                    data['vocabulary_offsets'],
+                    data['term_offsets'],
+                    data['posting_rows'],
+                    data['posting_counts'],
+                    data['document_lengths'],
+                    k1=k1,
+                    b=b
+                )
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Failed to load BM25 index: {e}")
+            return None
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuse several rankings of row ids with reciprocal rank fusion.
+    
+    Args:
+        rankings: Row id arrays, each sorted best first
+        k: RRF damping constant
+        
+    Returns:
+        Tuple of (row ids, fused scores), sorted by descending fused score
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (k + rank + 1)
+    
+    rows = sorted(fused, key=lambda row: -fused[row])
+    return np.array(rows, dtype=np.int64), np.array([fused[row] for row in rows], dtype=np.float32)
+
+
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+
+# Namespace of files that match none of the configured namespace patterns
+DEFAULT_NAMESPACE = "general"
+
+
+@dataclass(frozen=True)
+class IndexPartition:
+    """
+    Sub-index over a subset of chunk rows; result rows are local and map to global rows via `rows`.
+    
+    The retrievers search the snapshot's shared matrices restricted to `rows`;
+    only the BM25 postings (and an IVF index, for large partitions) are its own.
+    """
+    rows: np.ndarray
+    exact_retriever: NumpyEmbeddingRetriever
+    retriever: Union[NumpyEmbeddingRetriever, IVFIndex]
+    bm25: Optional[BM25Index] = None
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """Immutable view of a built index; retrieval reads one snapshot so it never sees a half-built store."""
+    chunks: ChunkTable
+    embeddings: np.ndarray
+    index_id: str
+    exact_retriever: NumpyEmbeddingRetriever
+    retriever: Union[NumpyEmbeddingRetriever, IVFIndex]
+    bm25: Optional[BM25Index] = None
+    quantized: Optional[QuantizedEmbeddings] = None
+    # Full-scan retriever (quantized/coarse as configured) that small sub-indexes restrict to their rows
+    flat_retriever: Optional[NumpyEmbeddingRetriever] = None
+    # Sub-indexes keyed by sorted namespace tuples; multi-namespace filters are added on first use
+    partitions: Dict[Tuple[str, ...], IndexPartition] = field(default_factory=dict)
+
+
+@dataclass
+class RetrievalPlan:
+    """Lexical stage of a batch retrieval, plus the queries that still need an embedding."""
+    snapshot: IndexSnapshot
+    index: Union[IndexSnapshot, IndexPartition]
+    queries: List[str]
+    mode: str
+    top_k: int
+    candidates: int
+    lexical_results: List[Optional[Tuple[np.ndarray, np.ndarray]]]
+    vector_queries: List[int]
+    
+    @property
+    def vector_texts(self) -> List[str]:
+        return [self.queries[i] for i in self.vector_queries]
 
 
 class KnowledgeBaseStore:
     """
-    Knowledge base store with vector indexing, caching, and retrieval using Haystack.
+    Knowledge base store with vector indexing, caching, and retrieval using NumPy.
     """
     
     def __init__(
         self,
         knowledge_base_dir: str,
         cache_dir: str,
-        model_name: str = "text-embedding-3-small"
+        model_name: str = "text-embedding-3-small",
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        ann_index: Optional[str] = None,
+        ivf_nlist: Optional[int] = None,
+        ivf_nprobe: int = 8,
+        ann_min_rows: int = 10_000,
+        embedding_concurrency: int = 4,
+        embedding_dtype: str = "float32",
+        rescore_candidates: int = 0,
+        ingest_workers: int = 1,
+        auto_build: bool = True,
+        retrieval_mode: str = "hybrid",
+        fusion_candidates: int = 50,
+        lexical_confidence: float = 0.9,
+        lexical_max_df: float = 0.05,
+        namespaces: Optional[Dict[str, List[str]]] = None,
+        embedding_dimensions: Optional[int] = None,
+        coarse_search: bool = False,
+        coarse_dimensions: Optional[int] = None
     ):
         """
         Initialize the knowledge base store.
@@ -33,210 +1126,1105 @@ class KnowledgeBaseStore:
             knowledge_base_dir: Directory containing knowledge base text files
             cache_dir: Directory for storing cached embeddings and index
             model_name: Embedding model to use
+            chunk_size: Maximum chunk length in characters
+            chunk_overlap: Number of characters shared between consecutive chunks
+            ann_index: Approximate index to use ("ivf"), or None for exact search only
+            ivf_nlist: Number of IVF clusters (defaults to about 4 * sqrt(num_chunks))
+            ivf_nprobe: Number of IVF clusters scanned per query
+            ann_min_rows: Below this many chunks exact search is used even if ann_index is set
+            embedding_concurrency: Maximum embedding requests in flight while building
+            embedding_dtype: In-memory search precision: "float32", "float16" or "int8"
+            rescore_candidates: With a quantized dtype, rescore this many candidates
+                against the full-precision embeddings (0 disables rescoring)
+            ingest_workers: Processes used to hash, read and chunk files (1 reads in-process)
+            auto_build: Embed new or changed files on startup; if False, only load a
+                prebuilt index (see `python -m knowledge_base_store build`)
+            retrieval_mode: "vector", "lexical" (BM25 only) or "hybrid" (both, fused with RRF)
+            fusion_candidates: Candidates taken from each ranking before hybrid fusion
+            lexical_confidence: In hybrid mode, skip the embedding call when the best BM25
+                chunk contains query terms carrying at least this share of the query's IDF
+                weight, including a rare term
+            lexical_max_df: Maximum fraction of chunks a term may occur in to count as rare
+            namespaces: Mapping of namespace to file name patterns (e.g. {"recipes": ["*_recipe.txt"]});
+                files are tagged with the first matching namespace, or DEFAULT_NAMESPACE.
+                Each namespace gets its own sub-index so filtered retrieval only scans it
+            embedding_dimensions: Request shortened embeddings of this size from the API
+                (text-embedding-3-* only); None uses the model's full size
+            coarse_search: Find candidates on truncated embeddings, then rerank them with
+                the full vectors (rescore_candidates per query, or 10 * top_k if 0)
+            coarse_dimensions: Truncated size for coarse_search; defaults to the model's
+                entry in COARSE_DIMENSIONS
         """
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError(f"chunk_overlap must be in [0, chunk_size), got {chunk_overlap}")
+        if ann_index not in (None, "ivf"):
+            raise ValueError(f"Unsupported ann_index: {ann_index}")
+        if embedding_dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unsupported embedding_dtype: {embedding_dtype}")
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unsupported retrieval_mode: {retrieval_mode}")
+        if coarse_search and coarse_dimensions is None:
+            if model_name not in COARSE_DIMENSIONS:
+                raise ValueError(f"No coarse_dimensions configured for model: {model_name}")
+            coarse_dimensions = COARSE_DIMENSIONS[model_name]
+        
         self.knowledge_base_dir = Path(knowledge_base_dir)
         self.cache_dir = Path(cache_dir) / model_name
         self.model_name = model_name
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.ann_index = ann_index
+        self.ivf_nlist = ivf_nlist
+        self.ivf_nprobe = ivf_nprobe
+        self.ann_min_rows = ann_min_rows
+        self.embedding_concurrency = embedding_concurrency
+        self.embedding_dtype = embedding_dtype
+        self.rescore_candidates = rescore_candidates
+        self.ingest_workers = ingest_workers
+        self.auto_build = auto_build
+        self.retrieval_mode = retrieval_mode
+        self.fusion_candidates = fusion_candidates
+        self.lexical_confidence = lexical_confidence
+        self.lexical_max_df = lexical_max_df
+        self.namespaces = namespaces or {}
+        self.embedding_dimensions = embedding_dimensions
+        self.coarse_dimensions = coarse_dimensions if coarse_search else 0
+        # Queries answered by the lexical fast path without an embedding call
+        self.lexical_fast_path_hits = 0
         
         # Create cache directory if it doesn't exist
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         
         # File paths for caching
-        self.hash_file = self.cache_dir / "files_hash.json"
+        self.manifest_file = self.cache_dir / "manifest.json"
+        # Embedding matrix, chunk metadata rows and chunk text blob (all memory-mapped)
+        # are saved per build as e.g. embeddings.<index_id>.npy; the sources file
+        # names the current index_id, so replacing it switches all three at once
+        self.embeddings_file = self.cache_dir / "embeddings.npy"
+        self.chunks_file = self.cache_dir / "chunks.npy"
+        self.chunk_text_file = self.cache_dir / "chunk_text.npy"
+        self.chunk_sources_file = self.cache_dir / "chunk_sources.json"
+        self.ivf_file = self.cache_dir / "ivf_index.npz"
+        self.quantized_file = self.cache_dir / f"embeddings_{embedding_dtype}.npz"
+        self.bm25_file = self.cache_dir / "bm25_index.npz"
+        # Completed embedding batches of an unfinished build
+        self.checkpoint_dir = self.cache_dir / "build_checkpoint"
+        # Legacy pickle and JSON caches, only read to migrate to the current format
         self.document_store_file = self.cache_dir / "document_store.pkl"
+        self.records_file = self.cache_dir / "documents.json"
         
-        # Initialize Haystack components
-        self.document_store = InMemoryDocumentStore()
-        self.retriever = InMemoryEmbeddingRetriever(document_store=self.document_store)
+        # Working state of the index being built: chunks (text and metadata) and
+        # their embeddings, row-aligned. Retrieval never reads these directly.
+        self.chunks = ChunkTable.empty()
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        # Identifies the saved embedding cache so derived indexes can detect staleness
+        self.index_id = ''
+        
+        # Published index used for retrieval, replaced atomically after each (re)build
+        self._snapshot = self._make_snapshot(NumpyEmbeddingRetriever(self.embeddings, normalized=True))
+        
+        # Serializes rebuilds; the watcher thread polls the directory for changes
+        self._build_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
         
         # Initialize the knowledge base
         self._setup_knowledge_base()
     
+    @property
+    def retriever(self) -> Union[NumpyEmbeddingRetriever, IVFIndex]:
+        """Retriever of the currently published index (approximate if configured)."""
+        return self._snapshot.retriever
+    
+    @property
+    def exact_retriever(self) -> NumpyEmbeddingRetriever:
+        """Exact retriever of the currently published index."""
+        return self._snapshot.exact_retriever
+    
+    def refresh(self):
+        """
+        Re-scan the knowledge base directory and apply changes off the request path.
+        
+        The new index is published with a single reference swap, so concurrent
+        retrieval keeps using the previous index until the new one is complete.
+        """
+        with self._build_lock:
+            self._setup_knowledge_base()
+    
+    def start_watcher(self, interval: float = 5.0):
+        """
+        Start a background thread that polls file sizes and mtimes and refreshes on change.
+        
+        Args:
+            interval: Seconds between polls
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(
+            target=self._watch,
+            args=(interval, self._get_directory_signature()),
+            name="knowledge-base-watcher",
+            daemon=True
+        )
+        self._watcher.start()
+    
+    def stop_watcher(self):
+        """Stop the background watcher thread."""
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+    
+    def _watch(self, interval: float, signature: Dict[str, Tuple[int, int]]):
+        """Watcher loop: refresh whenever the directory signature changes."""
+        while not self._stop_watching.wait(interval):
+            try:
+                current_signature = self._get_directory_signature()
+                if current_signature != signature:
+                    print("Knowledge base files changed, refreshing index...")
+                    self.refresh()
+                    signature = current_signature
+            except Exception as e:
+                # Keep serving the previous index; retry on the next poll
+                print(f"Knowledge base refresh failed: {e}")
+    
+    def _get_directory_signature(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Return (size, mtime_ns) of every knowledge base file, without reading contents.
+        
+        A store serving a prebuilt index watches the cache manifest instead, so it
+        reloads when an offline build finishes.
+        """
+        if self.auto_build:
+            return self._get_file_stats()
+        
+        if not self.manifest_file.exists():
+            return {}
+        stat = self.manifest_file.stat()
+        return {self.manifest_file.name: (stat.st_size, stat.st_mtime_ns)}
+    
+    def _get_file_stats(self) -> Dict[str, Tuple[int, int]]:
+        """Return (size, mtime_ns) of every knowledge base file."""
+        stats = {}
+        for file_path in self.knowledge_base_dir.glob("*.txt"):
+            stat = file_path.stat()
+            stats[file_path.name] = (stat.st_size, stat.st_mtime_ns)
+        return stats
+    
     def _setup_knowledge_base(self):
         """
-        Setup knowledge base by loading from cache or creating new embeddings.
+        Setup knowledge base by loading from cache and embedding only new or changed files.
         """
+        if not self.auto_build:
+            self._load_prebuilt_index()
+            return
+        
         if not self.knowledge_base_dir.exists():
             raise ValueError(f"Knowledge base directory does not exist: {self.knowledge_base_dir}")
         
-        # Calculate current files hash
-        current_hash = self._get_files_hash()
-        cached_hash = self._get_cached_hash()
+        # Stat every file first; only files whose size or mtime changed are read and hashed
+        current_stats = self._get_file_stats()
+        manifest = self._load_manifest()
+        
+        if manifest is None or not self._load_from_cache() or not self._manifest_matches_cache(manifest):
+            print("Cache miss, creating embeddings for all files...")
+            self.index_id = ''
+            self.chunks = ChunkTable.empty()
+            self.embeddings = np.zeros((0, 0), dtype=np.float32)
+            manifest = {}
+        
+        cached_hashes = manifest.get('files', {})
+        cached_stats = {name: tuple(stat) for name, stat in manifest.get('stats', {}).items()}
+        current_hashes, racy_files = self._get_file_hashes(
+            current_stats, cached_hashes, cached_stats, manifest.get('stat_time_ns', 0)
+        )
+        
+        changed_files = sorted(
+            name for name, file_hash in current_hashes.items()
+            if cached_hashes.get(name) != file_hash
+        )
+        removed_files = sorted(name for name in cached_hashes if name not in current_hashes)
         
-        # Try to load from cache if hash matches
-        if current_hash == cached_hash and self._load_from_cache():
+        if not changed_files and not removed_files:
+            # Record new stats of touched-but-unchanged files, and rewrite the manifest after
+            # hashing racily clean files: its newer mtime lets the next start trust them
+            if racy_files or {name: current_stats[name] for name in cached_hashes} != cached_stats:
+                self._save_manifest(cached_hashes, current_stats)
+            self._build_retriever()
             print("Loaded knowledge base from cache")
             return
         
-        # Need to recreate embeddings
-        print("Cache miss or files changed, creating embeddings...")
-        self._create_embeddings()
-        self._save_cache()
-        self._save_hash(current_hash)
+        print(f"Updating knowledge base: {len(changed_files)} new or changed, {len(removed_files)} removed files")
+        
+        # Drop chunks of removed files and stale chunks of changed files
+        num_chunks = len(self.chunks)
+        self._delete_file_documents([name for name in changed_files + removed_files if name in cached_hashes])
+        num_deleted = num_chunks - len(self.chunks)
+        
+        # Embed new and changed files; files that fail to load are retried next time
+        num_chunks = len(self.chunks)
+        embedded_files = self._create_embeddings(changed_files)
+        num_added = len(self.chunks) - num_chunks
+        
+        manifest_hashes = {name: cached_hashes[name] for name in cached_hashes if name in current_hashes}
+        for name in changed_files:
+            manifest_hashes.pop(name, None)
+            if name in embedded_files:
+                manifest_hashes[name] = current_hashes[name]
+        
+        # Only a changed set of chunks gets a new cache (and index_id): rewriting it
+        # when nothing changed, e.g. because a file keeps failing to load, would
+        # force the derived indexes to rebuild on every start
+        # The manifest must keep describing the cache on disk, so it is only
+        # updated once the changed chunks were saved
+        if not (num_deleted or num_added) or self._save_cache():
+            self._save_manifest(manifest_hashes, current_stats)
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+        self._build_retriever()
         print("Knowledge base setup complete")
     
-    def _get_files_hash(self) -> str:
-        """Calculate hash of all files in knowledge base directory."""
-        hash_md5 = hashlib.md5()
-        text_files = sorted(self.knowledge_base_dir.glob("*.txt"))
+    def _load_prebuilt_index(self):
+        """Load the cached index as-is, without reading knowledge base files or embedding."""
+        manifest = self._load_manifest()
+        if manifest is None or not self._load_from_cache() or not self._manifest_matches_cache(manifest):
+            raise RuntimeError(
+                f"No prebuilt knowledge base index in {self.cache_dir}; "
+                f"run `python -m knowledge_base_store build` first"
+            )
+        self._build_retriever()
+        print("Loaded prebuilt knowledge base index")
+    
+    def _map_files(self, function: Callable, *iterables: Iterable) -> List[Any]:
+        """Apply a module-level function over file arguments, in a process pool if configured."""
+        arguments = [list(iterable) for iterable in iterables]
+        if self.ingest_workers <= 1 or len(arguments[0]) <= 1:
+            return list(map(function, *arguments))
         
-        for file_path in text_files:
-            hash_md5.update(str(file_path.name).encode())
-            with open(file_path, 'rb') as f:
-                hash_md5.update(f.read())
+        chunksize = max(1, len(arguments[0]) // (self.ingest_workers * 4))
+        with ProcessPoolExecutor(max_workers=self.ingest_workers) as executor:
+            return list(executor.map(function, *arguments, chunksize=chunksize))
+    
+    def _get_file_hashes(
+        self,
+        file_stats: Dict[str, Tuple[int, int]],
+        cached_hashes: Dict[str, str],
+        cached_stats: Dict[str, Tuple[int, int]],
+        cached_stat_time_ns: int
+    ) -> Tuple[Dict[str, str], List[str]]:
+        """
+        Return the content hash of each knowledge base file, reading only files whose stat changed.
         
-        return hash_md5.hexdigest()
+        A cached hash is reused when the file's (size, mtime_ns) matches the manifest
+        and the file was last modified before the manifest was written. Like git's
+        index, a file modified in the same timestamp tick as the manifest is racily
+        clean: it could have changed without a visible mtime change, so it is hashed.
+        
+        Args:
+            file_stats: Current (size, mtime_ns) of each file
+            cached_hashes: Content hashes recorded in the manifest
+            cached_stats: (size, mtime_ns) recorded in the manifest
+            cached_stat_time_ns: mtime of the manifest file
+            
+        Returns:
+            Mapping of file name to content hash, and the racily clean files that were hashed
+        """
+        unchanged_stats = {
+            name: stat for name, stat in file_stats.items()
+            if name in cached_hashes and cached_stats.get(name) == stat
+        }
+        file_hashes = {
+            name: cached_hashes[name]
+            for name, stat in unchanged_stats.items()
+            if stat[1] < cached_stat_time_ns
+        }
+        racy_files = sorted(name for name in unchanged_stats if name not in file_hashes)
+        
+        names_to_hash = sorted(name for name in file_stats if name not in file_hashes)
+        if names_to_hash:
+            hashes = self._map_files(hash_file, [str(self.knowledge_base_dir / name) for name in names_to_hash])
+            file_hashes.update(zip(names_to_hash, hashes))
+        return file_hashes, racy_files
     
-    def _get_cached_hash(self) -> str:
-        """Load cached hash or return empty string."""
-        if self.hash_file.exists():
-            try:
-                with open(self.hash_file, 'r') as f:
-                    data = json.load(f)
-                    return data.get('hash', '')
-            except (json.JSONDecodeError, KeyError):
-                pass
-        return ''
-    
-    def _save_hash(self, files_hash: str):
-        """Save current files hash."""
-        with open(self.hash_file, 'w') as f:
-            json.dump({'hash': files_hash, 'model': self.model_name}, f)
+    def _load_manifest(self) -> Optional[Dict[str, Any]]:
+        """
+        Load the manifest of the cached index.
+        
+        Returns:
+            Manifest with the per-file content hashes ('files'), their stats ('stats')
+            and the manifest file's mtime ('stat_time_ns'), or None if there is no
+            usable manifest for the current model and chunking settings
+        """
+        if not self.manifest_file.exists():
+            return None
+        
+        try:
+            with open(self.manifest_file, 'r') as f:
+                data = json.load(f)
+                # Compared with file mtimes, so it is taken from the same filesystem clock
+                data['stat_time_ns'] = os.fstat(f.fileno()).st_mtime_ns
+        except json.JSONDecodeError:
+            return None
+        
+        settings = (
+            data.get('model'), data.get('dimensions'), data.get('chunk_size'),
+            data.get('chunk_overlap'), data.get('chunker_version')
+        )
+        if settings != (self.model_name, self.embedding_dimensions, self.chunk_size, self.chunk_overlap, CHUNKER_VERSION):
+            return None
+        
+        data.setdefault('files', {})
+        return data
+    
+    def _manifest_matches_cache(self, manifest: Dict[str, Any]) -> bool:
+        """Check that the manifest was written for the loaded cache (manifests predating index_id match any)."""
+        if manifest.get('index_id', self.index_id) != self.index_id:
+            print("Cache loading failed: manifest and cache are from different builds")
+            return False
+        return True
+    
+    def _save_manifest(
+        self,
+        file_hashes: Dict[str, str],
+        file_stats: Dict[str, Tuple[int, int]]
+    ):
+        """Save the per-file hashes and stats together with the settings and index_id they were built with."""
+        manifest_tmp = unique_temp_path(self.manifest_file)
+        with open(manifest_tmp, 'w') as f:
+            json.dump({
+                'model': self.model_name,
+                'dimensions': self.embedding_dimensions,
+                'chunk_size': self.chunk_size,
+                'chunk_overlap': self.chunk_overlap,
+                'chunker_version': CHUNKER_VERSION,
+                'index_id': self.index_id,
+                'files': file_hashes,
+                'stats': {name: list(file_stats[name]) for name in file_hashes if name in file_stats}
+            }, f, indent=2)
+        os.replace(manifest_tmp, self.manifest_file)
+    
+    def _delete_file_documents(self, file_names: List[str]):
+        """Remove all chunks belonging to the given files from the chunk table and embeddings."""
+        if not file_names:
+            return
+        
+        keep_rows = np.flatnonzero(~np.isin(self.chunks.rows['file_id'], self.chunks.file_ids(file_names)))
+        self.chunks = self.chunks.take(keep_rows)
+        self.embeddings = self.embeddings[keep_rows]
+    
+    def _build_retriever(self):
+        """Create the exact retriever and, if configured, the quantized/approximate retriever, then publish them."""
+        exact_retriever = NumpyEmbeddingRetriever(self.embeddings, normalized=True)
+        
+        quantized = None
+        if self.embedding_dtype != "float32" and self.embeddings.shape[0]:
+            quantized = QuantizedEmbeddings.load(self.quantized_file, self.index_id, self.embeddings.shape[0])
+            if quantized is None:
+                print(f"Quantizing {self.embeddings.shape[0]} embeddings to {self.embedding_dtype}...")
+                quantized = QuantizedEmbeddings.quantize(self.embeddings, self.embedding_dtype)
+                if self.index_id:
+                    quantized.save(self.quantized_file, self.index_id)
+        
+        flat_retriever = retriever = NumpyEmbeddingRetriever(
+            self.embeddings,
+            normalized=True,
+            quantized=quantized,
+            rescore_candidates=self.rescore_candidates,
+            coarse_dimensions=self.coarse_dimensions
+        )
+        
+        if self.ann_index == "ivf" and self.embeddings.shape[0] >= self.ann_min_rows:
+            ivf = IVFIndex.load(self.ivf_file, self.embeddings, self.index_id, nprobe=self.ivf_nprobe)
+            if ivf is None or (self.ivf_nlist is not None and ivf.nlist != self.ivf_nlist):
+                print(f"Building IVF index over {self.embeddings.shape[0]} chunks...")
+                ivf = IVFIndex.build(self.embeddings, nlist=self.ivf_nlist, nprobe=self.ivf_nprobe)
+                if self.index_id:
+                    ivf.save(self.ivf_file, self.index_id)
+            ivf.quantized = quantized
+            ivf.rescore_candidates = self.rescore_candidates
+            retriever = ivf
+        
+        bm25 = None
+        if self.retrieval_mode != "vector":
+            bm25 = BM25Index.load(self.bm25_file, self.index_id, len(self.chunks))
+            if bm25 is None:
+                bm25 = BM25Index.build(self.chunks.contents())
+                if self.index_id:
+                    bm25.save(self.bm25_file, self.index_id)
+        
+        # Single reference assignment: readers see either the old or the new index
+        self._snapshot = self._make_snapshot(exact_retriever, retriever, bm25, quantized, flat_retriever)
+    
+    def _make_snapshot(
+        self,
+        exact_retriever: NumpyEmbeddingRetriever,
+        retriever: Optional[Union[NumpyEmbeddingRetriever, IVFIndex]] = None,
+        bm25: Optional[BM25Index] = None,
+        quantized: Optional[QuantizedEmbeddings] = None,
+        flat_retriever: Optional[NumpyEmbeddingRetriever] = None
+    ) -> IndexSnapshot:
+        """Freeze the current working state into a snapshot for retrieval, with one sub-index per namespace."""
+        snapshot = IndexSnapshot(
+            chunks=self.chunks,
+            embeddings=self.embeddings,
+            index_id=self.index_id,
+            exact_retriever=exact_retriever,
+            retriever=retriever or exact_retriever,
+            bm25=bm25,
+            quantized=quantized,
+            flat_retriever=flat_retriever or exact_retriever
+        )
+        
+        # Namespaces are per file, so rows are grouped through their file ids
+        file_namespaces = np.array([self.get_namespace(file_name) for file_name, _ in snapshot.chunks.files], dtype=object)
+        row_namespaces = file_namespaces[snapshot.chunks.rows['file_id']]
+        for namespace in sorted(set(file_namespaces)):
+            key = (namespace,)
+            rows = np.flatnonzero(row_namespaces == namespace)
+            snapshot.partitions[key] = self._make_partition(snapshot, key, rows)
+        return snapshot
+    
+    def _make_partition(self, snapshot: IndexSnapshot, key: Tuple[str, ...], rows: np.ndarray) -> IndexPartition:
+        """
+        Build the sub-index of a namespace key over the given rows of a snapshot.
+        
+        Vector search runs over the snapshot's memory-mapped embeddings and
+        quantized codes restricted to the rows, so nothing is copied. The
+        partition's own BM25 and IVF indexes are saved next to the global ones
+        and reloaded while the embedding cache is unchanged.
+        """
+        if len(rows) == len(snapshot.chunks):
+            # One namespace holds every chunk: share the full index instead of copying it
+            return IndexPartition(
+                rows=rows,
+                exact_retriever=snapshot.exact_retriever,
+                retriever=snapshot.retriever,
+                bm25=snapshot.bm25
+            )
+        
+        retriever = snapshot.flat_retriever.subset(rows)
+        
+        # Large partitions get their own IVF index
+        if self.ann_index == "ivf" and len(rows) >= self.ann_min_rows:
+            ivf_file = self._partition_file(self.ivf_file, key)
+            ivf = IVFIndex.load(ivf_file, snapshot.embeddings, snapshot.index_id, nprobe=self.ivf_nprobe, rows=rows)
+            if ivf is None or (self.ivf_nlist is not None and ivf.nlist != self.ivf_nlist):
+                print(f"Building IVF index over {len(rows)} chunks of {'+'.join(key)}...")
+                ivf = IVFIndex.build(snapshot.embeddings, nlist=self.ivf_nlist, nprobe=self.ivf_nprobe, rows=rows)
+                if snapshot.index_id:
+                    ivf.save(ivf_file, snapshot.index_id)
+            ivf.quantized = snapshot.quantized
+            ivf.rescore_candidates = self.rescore_candidates
+            retriever = ivf
+        
+        bm25 = None
+        if snapshot.bm25 is not None:
+            bm25_file = self._partition_file(self.bm25_file, key)
+            bm25 = BM25Index.load(bm25_file, snapshot.index_id, len(rows), rows=rows)
+            if bm25 is None:
+                bm25 = BM25Index.build(snapshot.chunks.contents(rows))
+                if snapshot.index_id:
+                    bm25.save(bm25_file, snapshot.index_id, rows=rows)
+        
+        return IndexPartition(
+            rows=rows,
+            exact_retriever=snapshot.exact_retriever.subset(rows),
+            retriever=retriever,
+            bm25=bm25
+        )
+    
+    @staticmethod
+    def _partition_file(path: Path, key: Tuple[str, ...]) -> Path:
+        """Path of a namespace sub-index file next to the global index file (e.g. bm25_index.recipes.npz)."""
+        name = re.sub(r'[^\w+-]', '_', '+'.join(key))
+        return path.with_name(f"{path.stem}.{name}{path.suffix}")
+    
+    def get_namespace(self, file_name: str) -> str:
+        """Return the namespace of a knowledge base file: the first namespace with a matching pattern."""
+        for namespace, patterns in self.namespaces.items():
+            if any(fnmatch.fnmatch(file_name, pattern) for pattern in patterns):
+                return namespace
+        return DEFAULT_NAMESPACE
+    
+    def _get_partition(
+        self,
+        snapshot: IndexSnapshot,
+        namespace: Optional[Union[str, Sequence[str]]]
+    ) -> Optional[IndexPartition]:
+        """Return the sub-index for a namespace filter, or None to search the whole snapshot."""
+        if namespace is None:
+            return None
+        
+        key = (namespace,) if isinstance(namespace, str) else tuple(sorted(set(namespace)))
+        partition = snapshot.partitions.get(key)
+        if partition is None:
+            parts = [snapshot.partitions[(name,)].rows for name in key if (name,) in snapshot.partitions]
+            rows = np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+            # Benign race: concurrent first uses may both build the same partition
+            partition = snapshot.partitions.setdefault(key, self._make_partition(snapshot, key, rows))
+        return partition
+    
+    def _cache_files(self, index_id: str) -> Tuple[Path, Path, Path]:
+        """Paths of the embedding matrix, chunk rows and chunk text saved for one index_id."""
+        return tuple(
+            path.with_name(f"{path.stem}.{index_id}{path.suffix}")
+            for path in (self.embeddings_file, self.chunks_file, self.chunk_text_file)
+        )
     
     def _load_from_cache(self) -> bool:
-        """Try to load documents from cache and recreate document store."""
+        """Try to memory-map the embedding matrix and the chunk table of the current index_id from cache."""
+        if not self.chunk_sources_file.exists():
+            return self._migrate_json_cache() or self._migrate_pickle_cache()
+        
+        try:
+            with open(self.chunk_sources_file, 'r', encoding='utf-8') as f:
+                sources = json.load(f)
+            index_id = sources['index_id']
+            embeddings_file, chunks_file, chunk_text_file = self._cache_files(index_id)
+            embeddings = np.load(embeddings_file, mmap_mode='r')
+            rows = np.load(chunks_file, mmap_mode='r')
+            text = np.load(chunk_text_file, mmap_mode='r')
+            
+            if embeddings.ndim != 2 or embeddings.shape[0] != rows.shape[0] or rows.dtype != CHUNK_DTYPE:
+                print("Cache loading failed: embeddings and chunks are out of sync")
+                return False
+            
+            self.chunks = ChunkTable([tuple(source) for source in sources['files']], rows, text)
+            self.embeddings = embeddings
+            self.index_id = index_id
+            
+            print(f"Loaded {len(self.chunks)} chunks from cache")
+            return True
+            
+        except (json.JSONDecodeError, KeyError, ValueError, OSError) as e:
+            print(f"Cache loading failed: {e}")
+            return False
+    
+    def _migrate_json_cache(self) -> bool:
+        """Load a legacy documents.json cache and rewrite its records as a chunk table."""
+        if not self.records_file.exists() or not self.embeddings_file.exists():
+            return False
+        
+        try:
+            with open(self.records_file, 'r', encoding='utf-8') as f:
+                records = json.load(f)['records']
+            embeddings = np.load(self.embeddings_file, mmap_mode='r')
+            if embeddings.ndim != 2 or embeddings.shape[0] != len(records):
+                print("Cache loading failed: embeddings and records are out of sync")
+                return False
+        except (json.JSONDecodeError, KeyError, ValueError, OSError) as e:
+            print(f"Cache loading failed: {e}")
+            return False
+        
+        self.chunks = ChunkTable.from_records(records)
+        self.embeddings = embeddings
+        if not self._save_cache():
+            return False
+        self.records_file.unlink(missing_ok=True)
+        self.embeddings_file.unlink(missing_ok=True)
+        print(f"Migrated {len(self.chunks)} chunks from JSON cache")
+        return True
+    
+    def _migrate_pickle_cache(self) -> bool:
+        """Load a legacy pickle cache and rewrite it in the NumPy format."""
         if not self.document_store_file.exists():
             return False
         
         try:
             with open(self.document_store_file, 'rb') as f:
                 cached_data = pickle.load(f)
-                
-            # Recreate document store and load cached documents
-            self.document_store = InMemoryDocumentStore()
-            cached_documents = cached_data['documents']
-            
-            # Recreate Document objects from cached data
-            documents = []
-            for doc_data in cached_documents:
-                doc = Document(
-                    content=doc_data['content'],
-                    meta=doc_data['meta']
-                )
-                doc.embedding = doc_data['embedding']
-                documents.append(doc)
             
-            # Write documents to store
-            self.document_store.write_documents(documents)
-            self.retriever = InMemoryEmbeddingRetriever(document_store=self.document_store)
-            
-            print(f"Loaded {len(documents)} documents from cache")
-            return True
+            cached_documents = cached_data['documents']
+            self.chunks = ChunkTable.from_records([
+                {'content': doc_data['content'], 'meta': doc_data['meta']}
+                for doc_data in cached_documents
+            ])
+            self.embeddings = normalize_rows(np.asarray(
+                [doc_data['embedding'] for doc_data in cached_documents], dtype=np.float32
+            ).reshape(len(cached_documents), -1))
             
-        except (pickle.PickleError, KeyError, FileNotFoundError) as e:
+        except (pickle.PickleError, KeyError, ValueError, FileNotFoundError) as e:
             print(f"Cache loading failed: {e}")
             return False
+        
+        if not self._save_cache():
+            return False
+        print(f"Migrated {len(self.chunks)} chunks from pickle cache")
+        return True
     
-    def _save_cache(self):
-        """Save document data to cache."""
+    def _save_cache(self) -> bool:
+        """
+        Save the embedding matrix and the chunk table to cache.
+        
+        The arrays go to new files named by a fresh index_id, and replacing the
+        sources file then switches readers to them in one step, so a crash or
+        a concurrent reader never pairs embeddings and chunks of different builds.
+        
+        Returns:
+            True if the cache was saved
+        """
         try:
-            # Extract serializable data from documents
-            documents_data = []
-            for doc in self.document_store.filter_documents():
-                doc_data = {
-                    'content': doc.content,
-                    'meta': doc.meta,
-                    'embedding': doc.embedding
-                }
-                documents_data.append(doc_data)
-            
-            cached_data = {
-                'documents': documents_data,
-                'model': self.model_name
-            }
+            index_id = uuid.uuid4().hex
+            embeddings_file, chunks_file, chunk_text_file = self._cache_files(index_id)
+            np.save(embeddings_file, np.ascontiguousarray(self.embeddings, dtype=np.float32))
+            np.save(chunks_file, np.ascontiguousarray(self.chunks.rows))
+            np.save(chunk_text_file, np.ascontiguousarray(self.chunks.text))
             
-            with open(self.document_store_file, 'wb') as f:
-                pickle.dump(cached_data, f)
-                
-        except pickle.PickleError as e:
+            sources_tmp = unique_temp_path(self.chunk_sources_file)
+            with open(sources_tmp, 'w', encoding='utf-8') as f:
+                json.dump(
+                    {'model': self.model_name, 'index_id': index_id, 'files': self.chunks.files},
+                    f, ensure_ascii=False, separators=(',', ':')
+                )
+            os.replace(sources_tmp, self.chunk_sources_file)
+            
+            # Reopen memory-mapped so the matrix and texts live in the page cache, not the heap
+            self.embeddings = np.load(embeddings_file, mmap_mode='r')
+            self.chunks = ChunkTable(
+                self.chunks.files,
+                np.load(chunks_file, mmap_mode='r'),
+                np.load(chunk_text_file, mmap_mode='r')
+            )
+            self.index_id = index_id
+            
+        except OSError as e:
             print(f"Failed to save cache: {e}")
+            # The in-memory index matches no saved one, so no derived index may be loaded for it
+            self.index_id = ''
+            return False
+        
+        # Remove the files of earlier builds, and of builds that crashed before switching
+        current_files = {embeddings_file, chunks_file, chunk_text_file}
+        for path in (self.embeddings_file, self.chunks_file, self.chunk_text_file):
+            for stale_file in self.cache_dir.glob(f"{path.stem}.*{path.suffix}"):
+                if stale_file not in current_files:
+                    try:
+                        stale_file.unlink()
+                    except OSError:
+                        pass
+        return True
     
-    def _create_embeddings(self):
-        """Load documents, create embeddings, and store in document store."""
-        # Load all text files
-        documents = []
-        text_files = list(self.knowledge_base_dir.glob("*.txt"))
+    def _create_embeddings(self, file_names: List[str]) -> List[str]:
+        """
+        Load and chunk the given files, create embeddings, and append them to the embedding matrix.
         
-        print(f"Loading {len(text_files)} documents from {self.knowledge_base_dir}")
+        Args:
+            file_names: Names of files in the knowledge base directory to embed
+            
+        Returns:
+            Names of files that were loaded successfully
+        """
+        records = []
+        loaded_files = []
         
-        for file_path in text_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                
-                if content:  # Only add non-empty files
-                    document = Document(
-                        content=content,
-                        meta={
-                            "file_name": file_path.name,
-                            "file_path": str(file_path)
-                        }
-                    )
-                    documents.append(document)
-                    
-            except (UnicodeDecodeError, IOError) as e:
-                print(f"Error reading {file_path}: {e}")
-        
-        if not documents:
-            print("No documents found in knowledge base directory")
-            return
+        print(f"Loading {len(file_names)} documents from {self.knowledge_base_dir}")
+        
+        file_paths = [str(self.knowledge_base_dir / file_name) for file_name in file_names]
+        results = self._map_files(
+            load_file_records,
+            file_paths,
+            [self.chunk_size] * len(file_paths),
+            [self.chunk_overlap] * len(file_paths)
+        )
+        for file_name, file_path, (file_records, error) in zip(file_names, file_paths, results):
+            if error is not None:
+                print(f"Error reading {file_path}: {error}")
+                continue
+            records.extend(file_records)
+            loaded_files.append(file_name)
         
-        # Create embeddings for documents
-        print(f"Creating embeddings for {len(documents)} documents...")
+        if not records:
+            print("No new chunks to embed")
+            return loaded_files
         
-        # Get embeddings for all document contents
-        doc_contents = [doc.content for doc in documents]
-        embeddings = get_embedding(doc_contents, model=self.model_name)
+        # Create embeddings for chunks
+        print(f"Creating embeddings for {len(records)} chunks...")
         
-        # Set embeddings on documents
-        for doc, embedding in zip(documents, embeddings):
-            doc.embedding = embedding
+        # Get embeddings for all chunk contents, checkpointing finished batches
+        embeddings = get_embeddings_batched(
+            [record["content"] for record in records],
+            model=self.model_name,
+            dimensions=self.embedding_dimensions,
+            max_concurrency=self.embedding_concurrency,
+            checkpoint_dir=self.checkpoint_dir
+        )
+        new_embeddings = normalize_rows(embeddings)
         
-        # Clear existing documents and add new ones
-        self.document_store.delete_documents([])
-        self.document_store.write_documents(documents)
+        # Append new rows to the embedding matrix
+        if self.embeddings.shape[0]:
+            self.embeddings = np.vstack([self.embeddings, new_embeddings])
+        else:
+            self.embeddings = new_embeddings
+        self.chunks = self.chunks.concat(ChunkTable.from_records(records))
         
-        print(f"Created embeddings for {len(documents)} documents")
+        print(f"Created embeddings for {len(records)} chunks")
+        return loaded_files
     
-    def retrieve_snippets(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    def retrieve_snippets(
+        self,
+        query: str,
+        top_k: int = 5,
+        exact: bool = False,
+        mode: Optional[str] = None,
+        namespace: Optional[Union[str, Sequence[str]]] = None
+    ) -> List[Dict[str, Any]]:
         """
-        Retrieve relevant snippets for a given query.
+        Retrieve relevant chunks for a given query.
         
         Args:
             query: Query string to search for
             top_k: Number of top snippets to return
+            exact: Bypass the approximate index and score every chunk
+            mode: Override the store's retrieval_mode for this call
+            namespace: Only search chunks in this namespace (or any of these namespaces)
+            
+        Returns:
+            List of snippet dictionaries with chunk content, source file and
+            character offsets of the chunk within that file
+        """
+        return self.retrieve_snippets_batch(
+            [query], top_k=top_k, exact=exact, mode=mode, namespace=namespace
+        )[0]
+    
+    def retrieve_snippets_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        exact: bool = False,
+        mode: Optional[str] = None,
+        namespace: Optional[Union[str, Sequence[str]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve relevant chunks for many queries with one embedding call and one matrix product.
+        
+        In hybrid mode, queries whose terms confidently pin down a chunk lexically
+        are answered from the BM25 index alone and never embedded.
+        
+        Args:
+            queries: Query strings to search for
+            top_k: Number of top snippets to return per query
+            exact: Bypass the approximate index and score every chunk
+            mode: Override the store's retrieval_mode for this call
+            namespace: Only search the sub-index of this namespace (or of any of these namespaces)
             
         Returns:
-            List of snippet dictionaries with content and metadata
+            One list of snippet dictionaries per query, in query order
         """
-        # Create query embedding
-        query_embedding = get_embedding(query, model=self.model_name)
+        if not queries:
+            return []
         
-        # Retrieve documents
-        result = self.retriever.run(
-            query_embedding=query_embedding,
-            top_k=top_k
+        plan = self._plan_retrieval(queries, top_k, mode, namespace)
+        query_embeddings = get_embedding(plan.vector_texts, model=self.model_name, dimensions=self.embedding_dimensions) if plan.vector_texts else []
+        return self._finish_retrieval(plan, query_embeddings, exact)
+    
+    async def retrieve_snippets_async(
+        self,
+        query: str,
+        top_k: int = 5,
+        exact: bool = False,
+        mode: Optional[str] = None,
+        namespace: Optional[Union[str, Sequence[str]]] = None
+    ) -> List[Dict[str, Any]]:
+        """Async variant of retrieve_snippets; see retrieve_snippets_batch_async."""
+        results = await self.retrieve_snippets_batch_async(
+            [query], top_k=top_k, exact=exact, mode=mode, namespace=namespace
         )
+        return results[0]
+    
+    async def retrieve_snippets_batch_async(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        exact: bool = False,
+        mode: Optional[str] = None,
+        namespace: Optional[Union[str, Sequence[str]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Async variant of retrieve_snippets_batch that never blocks the event loop.
         
-        # Format and return results
-        snippets = []
-        for doc in result["documents"]:
-            snippet = {
-                "content": doc.content,
-                "score": getattr(doc, 'score', None),
-                "file_name": doc.meta.get("file_name", "unknown"),
-                "file_path": doc.meta.get("file_path", "unknown")
-            }
-            snippets.append(snippet)
+        Queries are embedded with the async OpenAI client, and the CPU-bound
+        lexical and vector scoring runs in the loop's default thread pool, so
+        concurrent retrievals on one loop overlap.
+        """
+        if not queries:
+            return []
+        
+        loop = asyncio.get_running_loop()
+        plan = await loop.run_in_executor(None, self._plan_retrieval, queries, top_k, mode, namespace)
+        query_embeddings = []
+        if plan.vector_texts:
+            query_embeddings = await get_embedding_async(
+                plan.vector_texts, model=self.model_name, dimensions=self.embedding_dimensions
+            )
+        return await loop.run_in_executor(None, self._finish_retrieval, plan, query_embeddings, exact)
+    
+    def _plan_retrieval(
+        self,
+        queries: List[str],
+        top_k: int,
+        mode: Optional[str],
+        namespace: Optional[Union[str, Sequence[str]]]
+    ) -> RetrievalPlan:
+        """Pick the index to search, run the lexical stage and decide which queries need vectors."""
+        mode = mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unsupported retrieval mode: {mode}")
+        
+        snapshot = self._snapshot
+        if mode != "vector" and snapshot.bm25 is None:
+            raise ValueError(f"Retrieval mode {mode!r} needs the BM25 index; construct the store with it enabled")
+        
+        # Search either the whole index or a namespace sub-index (whose rows are local)
+        index = self._get_partition(snapshot, namespace) or snapshot
+        candidates = top_k if mode == "vector" else max(top_k, self.fusion_candidates)
+        plan = RetrievalPlan(snapshot, index, list(queries), mode, top_k, candidates, [None] * len(queries), [])
+        if isinstance(index, IndexPartition) and not len(index.rows):
+            return plan
+        
+        # Lexical rankings, and the queries that still need an embedding
+        if mode == "vector":
+            plan.vector_queries = list(range(len(queries)))
+        else:
+            for query_index, query in enumerate(queries):
+                plan.lexical_results[query_index] = index.bm25.search(query, candidates)
+                if mode == "hybrid" and not self._is_confident_lexical_match(index.bm25, query, plan.lexical_results[query_index]):
+                    plan.vector_queries.append(query_index)
+        return plan
+    
+    def _finish_retrieval(
+        self,
+        plan: RetrievalPlan,
+        query_embeddings: List[List[float]],
+        exact: bool
+    ) -> List[List[Dict[str, Any]]]:
+        """Score the embedded queries, fuse them with the lexical rankings and build snippets."""
+        index = plan.index
+        if isinstance(index, IndexPartition) and not len(index.rows):
+            return [[] for _ in plan.queries]
         
-        return snippets 
+        # Score all embedded queries in one batch
+        vector_results = {}
+        if plan.vector_queries:
+            retriever = index.exact_retriever if exact else index.retriever
+            indices, scores = retriever.search_batch(query_embeddings, top_k=plan.candidates)
+            for query_index, query_rows, query_scores in zip(plan.vector_queries, indices, scores):
+                valid = query_rows >= 0
+                vector_results[query_index] = (query_rows[valid], query_scores[valid])
+        
+        results = []
+        for query_index in range(len(plan.queries)):
+            vector_result = vector_results.get(query_index)
+            lexical_result = plan.lexical_results[query_index]
+            
+            if lexical_result is None:
+                rows, _ = vector_result
+                retrieval = "vector"
+            elif vector_result is None:
+                rows, _ = lexical_result
+                retrieval = "lexical"
+                if plan.mode == "hybrid":
+                    self.lexical_fast_path_hits += 1
+            else:
+                rows, _ = reciprocal_rank_fusion([vector_result[0], lexical_result[0]])
+                retrieval = "hybrid"
+            
+            vector_scores = dict(zip(*vector_result)) if vector_result is not None else {}
+            lexical_scores = dict(zip(*lexical_result)) if lexical_result is not None else {}
+            results.append([
+                self._format_snippet(
+                    plan.snapshot,
+                    index.rows[row] if isinstance(index, IndexPartition) else row,
+                    vector_scores.get(row),
+                    lexical_scores.get(row),
+                    retrieval
+                )
+                for row in rows[:plan.top_k]
+            ])
+        
+        return results
+    
+    def _is_confident_lexical_match(
+        self,
+        bm25: BM25Index,
+        query: str,
+        lexical_result: Tuple[np.ndarray, np.ndarray]
+    ) -> bool:
+        """Whether the best BM25 chunk matches a rare query term and most of the query's IDF weight."""
+        rows, _ = lexical_result
+        if not len(rows):
+            return False
+        
+        max_document_frequency = max(1, int(self.lexical_max_df * len(bm25)))
+        has_rare_term = any(
+            0 < len(bm25._postings(term)[0]) <= max_document_frequency
+            for term in set(tokenize(query))
+        )
+        return has_rare_term and bm25.matched_idf_fraction(query, int(rows[0])) >= self.lexical_confidence
+    
+    def measure_recall(self, queries: List[str], top_k: int = 5) -> Dict[str, float]:
+        """
+        Compare the configured retriever against exact search.
+        
+        Args:
+            queries: Sample query strings
+            top_k: Number of results per query to compare
+            
+        Returns:
+            Dict with recall@k and mean per-query latency (ms) of both searches
+        """
+        query_embeddings = get_embedding(list(queries), model=self.model_name, dimensions=self.embedding_dimensions)
+        snapshot = self._snapshot
+        
+        start_time = time.perf_counter()
+        approximate_indices, _ = snapshot.retriever.search_batch(query_embeddings, top_k=top_k)
+        approximate_ms = (time.perf_counter() - start_time) * 1000 / len(queries)
+        
+        start_time = time.perf_counter()
+        exact_indices, _ = snapshot.exact_retriever.search_batch(query_embeddings, top_k=top_k)
+        exact_ms = (time.perf_counter() - start_time) * 1000 / len(queries)
+        
+        return {
+            'recall': recall_at_k(approximate_indices, exact_indices),
+            'approximate_ms': approximate_ms,
+            'exact_ms': exact_ms
+        }
+    
+    def _format_snippet(
+        self,
+        snapshot: IndexSnapshot,
+        row: int,
+        score: Optional[float],
+        bm25_score: Optional[float] = None,
+        retrieval: str = "vector"
+    ) -> Dict[str, Any]:
+        """Build the snippet dictionary for one chunk row of a snapshot, decoding only its text."""
+        record = snapshot.chunks.record(row)
+        meta = record['meta']
+        return {
+            "content": record['content'],
+            "score": float(score) if score is not None else None,
+            "bm25_score": float(bm25_score) if bm25_score is not None else None,
+            "retrieval": retrieval,
+            "file_name": meta.get("file_name", "unknown"),
+            "file_path": meta.get("file_path", "unknown"),
+            "namespace": self.get_namespace(meta.get("file_name", "")),
+            "chunk_index": meta.get("chunk_index", 0),
+            "start_offset": meta.get("start_offset", 0),
+            "end_offset": meta.get("end_offset", len(record['content']))
+        }
+
+
+def parse_namespaces(entries: Iterable[str]) -> Dict[str, List[str]]:
+    """Parse "NAME=GLOB" entries (e.g. "recipes=*_recipe.txt") into a namespace mapping; a repeated NAME collects patterns."""
+    namespaces: Dict[str, List[str]] = {}
+    for entry in entries:
+        if not entry.strip():
+            continue
+        name, _, pattern = entry.partition('=')
+        if not name.strip() or not pattern.strip():
+            raise ValueError(f"Namespace must be given as NAME=GLOB, got: {entry!r}")
+        namespaces.setdefault(name.strip(), []).append(pattern.strip())
+    return namespaces
+
+
+def knowledge_base_settings() -> Dict[str, Any]:
+    """
+    Read the knowledge base settings from the environment (see the README).
+    
+    app.py serves with these and `python -m knowledge_base_store build` uses them
+    as its defaults, so an index built offline matches the server that loads it.
+    
+    Returns:
+        KnowledgeBaseStore keyword arguments
+    """
+    def optional_int(name: str) -> Optional[int]:
+        value = os.getenv(name)
+        return int(value) if value else None
+    
+    return {
+        'knowledge_base_dir': os.getenv('KB_DIR', 'knowledge_base'),
+        'cache_dir': os.getenv('KB_CACHE_DIR', '.cache'),
+        'model_name': os.getenv('KB_EMBEDDING_MODEL', 'text-embedding-3-small'),
+        'embedding_dimensions': optional_int('KB_EMBEDDING_DIMENSIONS'),
+        'chunk_size': int(os.getenv('KB_CHUNK_SIZE', '1000')),
+        'chunk_overlap': int(os.getenv('KB_CHUNK_OVERLAP', '200')),
+        'namespaces': parse_namespaces(os.getenv('KB_NAMESPACES', 'recipes=*_recipe.txt').split(',')) or None,
+        'retrieval_mode': os.getenv('KB_RETRIEVAL_MODE', 'hybrid'),
+        'ann_index': os.getenv('KB_ANN_INDEX') or None,
+        'ivf_nlist': optional_int('KB_IVF_NLIST'),
+        'embedding_dtype': os.getenv('KB_EMBEDDING_DTYPE', 'float32'),
+        'coarse_search': os.getenv('KB_COARSE_SEARCH', '0') != '0',
+        'coarse_dimensions': optional_int('KB_COARSE_DIMENSIONS')
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    """Command-line entry point: `python -m knowledge_base_store build [options]`."""
+    # Options default to the KB_* settings the server reads, including those in .env
+    load_dotenv()
+    settings = knowledge_base_settings()
+    
+    parser = argparse.ArgumentParser(
+        prog="python -m knowledge_base_store",
+        description="Manage the knowledge base index."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    build_parser = subparsers.add_parser(
+        "build", help="Read, chunk and embed the knowledge base and write the cache artifacts"
+    )
+    build_parser.add_argument("--knowledge-base-dir", default=settings['knowledge_base_dir'])
+    build_parser.add_argument("--cache-dir", default=settings['cache_dir'])
+    build_parser.add_argument("--model", default=settings['model_name'])
+    build_parser.add_argument("--dimensions", type=int, default=settings['embedding_dimensions'],
+                              help="Request shortened embeddings of this size (text-embedding-3-* only)")
+    build_parser.add_argument("--chunk-size", type=int, default=settings['chunk_size'])
+    build_parser.add_argument("--chunk-overlap", type=int, default=settings['chunk_overlap'])
+    build_parser.add_argument("--namespace", action="append", dest="namespaces", metavar="NAME=GLOB",
+                              help="Tag files matching GLOB with namespace NAME; repeatable, replaces KB_NAMESPACES")
+    build_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                              help="Processes for hashing, reading and chunking files")
+    build_parser.add_argument("--embedding-concurrency", type=int, default=4,
+                              help="Embedding requests in flight")
+    build_parser.add_argument("--ann-index", choices=["ivf"], default=settings['ann_index'])
+    build_parser.add_argument("--ivf-nlist", type=int, default=settings['ivf_nlist'])
+    build_parser.add_argument("--embedding-dtype", choices=EMBEDDING_DTYPES, default=settings['embedding_dtype'])
+    build_parser.add_argument("--retrieval-mode", choices=RETRIEVAL_MODES, default=settings['retrieval_mode'],
+                              help="Build the BM25 index too unless this is \"vector\"")
+    build_parser.add_argument("--coarse-search", action=argparse.BooleanOptionalAction,
+                              default=settings['coarse_search'])
+    build_parser.add_argument("--coarse-dimensions", type=int, default=settings['coarse_dimensions'])
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == "build":
+        try:
+            namespaces = parse_namespaces(args.namespaces) if args.namespaces else settings['namespaces']
+        except ValueError as e:
+            build_parser.error(str(e))
+        
+        start_time = time.time()
+        store = KnowledgeBaseStore(
+            knowledge_base_dir=args.knowledge_base_dir,
+            cache_dir=args.cache_dir,
+            model_name=args.model,
+            embedding_dimensions=args.dimensions,
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            ann_index=args.ann_index,
+            ivf_nlist=args.ivf_nlist,
+            embedding_concurrency=args.embedding_concurrency,
+            embedding_dtype=args.embedding_dtype,
+            ingest_workers=args.workers,
+            retrieval_mode=args.retrieval_mode,
+            namespaces=namespaces,
+            coarse_search=args.coarse_search,
+            coarse_dimensions=args.coarse_dimensions
+        )
+        print(f"Built index of {len(store.chunks)} chunks in {store.cache_dir} "
+              f"({time.time() - start_time:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+Caches for LLM API results.
+"""
+
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for cache lookups: collapse whitespace and ignore case."""
+    return " ".join(text.split()).lower()
+
+
+class EmbeddingCache:
+    """
+    Size-bounded LRU cache of embeddings keyed by model and normalized text.
+
+    Entries are kept in memory as float32 arrays. If a path is given, entries are
+    also persisted to a SQLite database so they survive restarts; the database
+    evicts its least recently used rows once it exceeds max_disk_entries.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        path: Optional[str] = None,
+        max_disk_entries: int = 1_000_000
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of embeddings kept in memory
+            path: Optional SQLite file for persistence across restarts
+            max_disk_entries: Maximum number of embeddings kept on disk
+        """
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        self._disk_entries = 0
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, embedding BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._db.commit()
+            self._disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Build the cache key for a model and text."""
+        return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Return the cached embedding, or None on a miss."""
+        key = self.make_key(model, text)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute("SELECT embedding FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    embedding = np.frombuffer(row[0], dtype=np.float32)
+                    self._db.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self._remember(key, embedding)
+
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return embedding.tolist()
+
+    def put(self, model: str, text: str, embedding: List[float]):
+        """Store an embedding in memory and, if configured, on disk."""
+        self.put_many(model, {text: embedding})
+
+    def put_many(self, model: str, embeddings: Dict[str, List[float]]):
+        """Store the embeddings of many texts, writing them to disk in a single transaction."""
+        now = time.time()
+        with self._lock:
+            for text, embedding in embeddings.items():
+                key = self.make_key(model, text)
+                array = np.asarray(embedding, dtype=np.float32)
+                self._remember(key, array)
+                if self._db is not None:
+                    # Count only new keys: a replaced row must not grow the entry count
+                    inserted = self._db.execute(
+                        "INSERT OR IGNORE INTO embeddings (key, embedding, last_used) VALUES (?, ?, ?)",
+                        (key, array.tobytes(), now)
+                    ).rowcount
+                    if not inserted:
+                        self._db.execute(
+                            "UPDATE embeddings SET embedding = ?, last_used = ? WHERE key = ?",
+                            (array.tobytes(), now, key)
+                        )
+                    self._disk_entries += inserted
+            if self._db is not None:
+                self._evict_disk()
+                self._db.commit()
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        """Insert into the in-memory LRU, evicting the least recently used entries."""
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _evict_disk(self):
+        """Delete least recently used rows once the database grows past its bound."""
+        if self._disk_entries <= self.max_disk_entries:
+            return
+        # Trim 10% below the bound so eviction does not run on every insert
+        self._disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._disk_entries - int(self.max_disk_entries * 0.9)
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            self._disk_entries -= excess
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the hit rate since startup."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._entries),
+                'disk_entries': self._disk_entries
+            }
+
+    def clear(self):
+        """Drop all entries and reset statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+                self._disk_entries = 0
+
+
+class CompletionCache:
+    """
+    Size-bounded LRU cache of chat completion results with per-call-type TTLs.
+
+    Only call types listed in ttls are cached, and only at or below
+    max_temperature, where repeated requests are expected to get the same
+    answer. Keys hash the model, messages, tools, tool choice and temperature.
+    If a path is given, entries are also persisted to a SQLite database.
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        max_entries: int = 10_000,
+        path: Optional[str] = None,
+        max_disk_entries: int = 100_000,
+        max_temperature: float = 0.3
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            ttls: Seconds each call type's entries stay valid; call types not listed are not cached
+            max_entries: Maximum number of completions kept in memory
+            path: Optional SQLite file for persistence across restarts
+            max_disk_entries: Maximum number of completions kept on disk
+            max_temperature: Calls with a higher temperature are never cached
+        """
+        self.ttls = dict(ttls or {})
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_temperature = max_temperature
+        self._entries: OrderedDict[str, Tuple[Dict[str, Any], float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        self._disk_entries = 0
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions "
+                "(key TEXT PRIMARY KEY, result TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+            self._db.commit()
+            self._disk_entries = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    def enabled_for(self, call_type: str, temperature: float) -> bool:
+        """Whether calls of this type and temperature are cached."""
+        return call_type in self.ttls and temperature <= self.max_temperature
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None
+    ) -> str:
+        """Build a stable cache key for a completion request."""
+        request = json.dumps(
+            [model, messages, temperature, tools, tool_choice],
+            sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str
+        )
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute(
+                    "SELECT result, expires_at FROM completions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+                    self._db.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, entry)
+
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    self._delete(key)
+                self.misses += 1
+                return None
+            self.hits += 1
+        return copy.deepcopy(entry[0])
+
+    def put(self, key: str, call_type: str, result: Dict[str, Any]):
+        """Store a result for its call type's TTL."""
+        now = time.time()
+        entry = (copy.deepcopy(result), now + self.ttls[call_type])
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                # Count only new keys: a replaced row must not grow the entry count
+                inserted = self._db.execute(
+                    "INSERT OR IGNORE INTO completions (key, result, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(result), entry[1], now)
+                ).rowcount
+                if not inserted:
+                    self._db.execute(
+                        "UPDATE completions SET result = ?, expires_at = ?, last_used = ? WHERE key = ?",
+                        (json.dumps(result), entry[1], now, key)
+                    )
+                self._disk_entries += inserted
+                self._evict_disk(now)
+                self._db.commit()
+
+    def _remember(self, key: str, entry: Tuple[Dict[str, Any], float]):
+        """Insert into the in-memory LRU, evicting the least recently used entries."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _delete(self, key: str):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._disk_entries -= self._db.execute("DELETE FROM completions WHERE key = ?", (key,)).rowcount
+            self._db.commit()
+
+    def _evict_disk(self, now: float):
+        """Once the database grows past its bound, delete expired rows, then least recently used ones."""
+        if self._disk_entries <= self.max_disk_entries:
+            return
+        self._db.execute("DELETE FROM completions WHERE expires_at <= ?", (now,))
+        # Trim 10% below the bound so eviction does not run on every insert
+        self._disk_entries = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        excess = self._disk_entries - int(self.max_disk_entries * 0.9)
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM completions WHERE key IN "
+                "(SELECT key FROM completions ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            self._disk_entries -= excess
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the hit rate since startup."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._entries),
+                'disk_entries': self._disk_entries
+            }
+
+    def clear(self):
+        """Drop all entries and reset statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM completions")
+                self._db.commit()
+                self._disk_entries = 0
+
+
+def parse_ttls(value: str) -> Dict[str, float]:
+    """Parse "call_type:seconds,..." (e.g. "relevance:3600,query_rewrite:600") into a TTL mapping."""
+    ttls = {}
+    for item in value.split(','):
+        if item.strip():
+            call_type, _, seconds = item.partition(':')
+            ttls[call_type.strip()] = float(seconds) if seconds.strip() else 3600.0
+    return ttls
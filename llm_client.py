@@ -2,176 +2,541 @@
 LLM Client for embedding and completion operations using OpenAI API.
 """
 
-from typing import List, Dict, Optional, Any
+from typing import Awaitable, Callable, List, Dict, Optional, Any
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import json
 import os
-import yaml
+import random
+import threading
 import time
 import uuid
 from datetime import datetime
 from pathlib import Path
+import numpy as np
+import openai
 from openai import OpenAI, AsyncOpenAI
+from openai.types.chat import ChatCompletion
 from dotenv import load_dotenv
+from embedding_batcher import EmbeddingBatcher
+from llm_cache import CompletionCache, EmbeddingCache, parse_ttls
+from llm_logger import LLMCallLogger
+from rate_limiter import BACKGROUND, DEFAULT, INTERACTIVE, RateLimiter
 
-# Load environment variables from .env file
-load_dotenv()
+# Admission priority of completion call types when rate limited; user-facing responses go first
+CALL_PRIORITIES = {
+    "respond": INTERACTIVE,
+    "relevance": BACKGROUND,
+    "query_rewrite": BACKGROUND
+}
 
-# Initialize OpenAI clients (both sync and async)
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY")
+# Transient API errors worth retrying
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError
 )
 
-async_client = AsyncOpenAI(
-    api_key=os.getenv("OPENAI_API_KEY")
-)
 
-# Create logs directory if it doesn't exist
-LOG_DIR = Path("logs")
-LOG_DIR.mkdir(exist_ok=True)
-
-# Configure YAML to use literal block scalars for multiline strings (once at module import)
-class SuperAggressiveDumper(yaml.SafeDumper):
-    """Custom YAML dumper that forces literal block scalars for multiline content, even with problematic characters."""
-    
-    def represent_str(self, data):
-        if '\n' in data or len(data) > 80:
-            # Force literal style regardless of content (JSON, quotes, asterisks, etc.)
-            tag = 'tag:yaml.org,2002:str'
-            return self.represent_scalar(tag, data, style='|')
-        return self.represent_scalar('tag:yaml.org,2002:str', data)
-    
-    def choose_scalar_style(self):
-        # Override the style choice mechanism to force literal blocks
-        if self.event.tag == 'tag:yaml.org,2002:str':
-            if self.event.value and ('\n' in self.event.value or len(self.event.value) > 80):
-                return '|'
-        return super().choose_scalar_style()
-
-# Register the custom string representer
-SuperAggressiveDumper.add_representer(str, SuperAggressiveDumper.represent_str)
-
-# Generate a unique session ID when the module is imported
-SESSION_ID = str(uuid.uuid4())[:8]  # Use first 8 chars for readability
-SESSION_START = datetime.now()
-LOG_FILE = LOG_DIR / f"llm_session_{SESSION_START.strftime('%Y%m%d_%H%M%S')}_{SESSION_ID}.yaml"
-
-# Initialize call counter for unique call IDs
-_call_counter = 0
-
-# Initialize session log file with header structure
-with open(LOG_FILE, 'w', encoding='utf-8') as f:
-    session_header = {
-        'session_info': {
-            'session_id': SESSION_ID,
-            'started_at': SESSION_START.isoformat(),
-            'log_file': LOG_FILE.name
-        },
-        'calls': {}
-    }
+class LatencyTracker:
+    """Rolling window of recent completion latencies per (model, call type)."""
+    
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """
+        Initialize the tracker.
+        
+        Args:
+            window: Latencies kept per key
+            min_samples: Samples needed before a percentile is reported
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self._latencies: Dict[tuple, deque] = {}
+    
+    def record(self, key: tuple, seconds: float):
+        self._latencies.setdefault(key, deque(maxlen=self.window)).append(seconds)
     
-    yaml.dump(session_header, f, Dumper=SuperAggressiveDumper, default_flow_style=False, allow_unicode=True, width=120, indent=2)
+    def percentile(self, key: tuple, q: float = 95) -> Optional[float]:
+        """Return the q-th percentile latency, or None until enough samples were recorded."""
+        latencies = self._latencies.get(key)
+        if not latencies or len(latencies) < self.min_samples:
+            return None
+        return float(np.percentile(latencies, q))
 
 
-def log_llm_call(call_type: str, input_data: dict, response_data: dict, duration: float, error: str = None):
-    """
-    Log LLM call as a nested YAML object under a unique call key.
-    Each call becomes a collapsible section in the YAML hierarchy.
+completion_latencies = LatencyTracker()
+
+# Clients, caches, rate limiters, reliability settings and the call log are created
+# by configure(), which runs on first use. Importing this module therefore has no
+# side effects: it does not load .env, construct clients or create a log file.
+client: OpenAI
+async_client: AsyncOpenAI
+embedding_cache: EmbeddingCache
+completion_cache: CompletionCache
+completion_rate_limiter: RateLimiter
+embedding_rate_limiter: RateLimiter
+embedding_batcher: EmbeddingBatcher
+COMPLETION_TIMEOUT: float
+COMPLETION_MAX_RETRIES: int
+COMPLETION_DEADLINE: float
+COMPLETION_HEDGING: bool
+SESSION_ID: str
+LOG_FILE: Path
+call_logger: LLMCallLogger
+
+CONFIGURED_NAMES = (
+    "client", "async_client", "embedding_cache", "completion_cache", "completion_rate_limiter",
+    "embedding_rate_limiter", "embedding_batcher", "COMPLETION_TIMEOUT", "COMPLETION_MAX_RETRIES", "COMPLETION_DEADLINE",
+    "COMPLETION_HEDGING", "SESSION_ID", "LOG_FILE", "call_logger"
+)
+
+_configure_lock = threading.RLock()
+_configured = False
+
+
+def configure(
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    log_dir: str | Path = "logs",
+    load_env: bool = True
+):
     """
-    global _call_counter
-    _call_counter += 1
-    
-    timestamp = datetime.now().isoformat()
-    
-    # Create unique call ID
-    call_id = f"call_{_call_counter:03d}_{timestamp.replace(':', '').replace('-', '').replace('.', '')[:15]}"
-    
-    log_entry = {
-        'timestamp': timestamp,
-        'session_id': SESSION_ID,
-        'call_type': call_type,
-        'duration_seconds': round(duration, 3),
-        'input': input_data,
-        'response': response_data
-    }
+    Create the API clients, caches, rate limiters and call log from settings.
     
-    if error:
-        log_entry['error'] = error
+    Runs automatically on first use of the API functions; call it explicitly to
+    initialize at startup or to override settings. Anything not passed here is
+    read from the environment (see the LLM API Settings in the README). Calling
+    it again replaces the previous configuration.
     
-    # Read existing log file
-    with open(LOG_FILE, 'r', encoding='utf-8') as f:
-        log_data = yaml.safe_load(f) or {'session_info': {}, 'calls': {}}
+    Args:
+        api_key: OpenAI API key (default OPENAI_API_KEY)
+        base_url: API base URL (default OPENAI_BASE_URL, e.g. the local fake_openai_server)
+        log_dir: Directory of the session call logs (created on the first logged call)
+        load_env: Whether to load environment variables from .env first
+    """
+    global client, async_client, embedding_cache, completion_cache, completion_rate_limiter
+    global embedding_rate_limiter, embedding_batcher, COMPLETION_TIMEOUT, COMPLETION_MAX_RETRIES, COMPLETION_DEADLINE
+    global COMPLETION_HEDGING, SESSION_ID, LOG_FILE, call_logger, _configured
     
-    # Add new call to the calls section
-    log_data['calls'][call_id] = log_entry
+    with _configure_lock:
+        if load_env:
+            load_dotenv()
+        
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        base_url = base_url or os.getenv("OPENAI_BASE_URL") or None
+        client = OpenAI(api_key=api_key, base_url=base_url)
+        # Completion retries are handled by get_completion_async (with deadlines and hedging)
+        async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        
+        # Embedding cache shared by query and document embedding paths; set
+        # EMBEDDING_CACHE_PATH to persist it across restarts
+        embedding_cache = EmbeddingCache(
+            max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+            path=os.getenv("EMBEDDING_CACHE_PATH") or None
+        )
+        
+        # Opt-in completion cache: COMPLETION_CACHE_TTLS lists the call types to cache with
+        # their TTL in seconds (e.g. "relevance:3600,query_rewrite:600"); set
+        # COMPLETION_CACHE_PATH to persist it across restarts
+        completion_cache = CompletionCache(
+            ttls=parse_ttls(os.getenv("COMPLETION_CACHE_TTLS", "")),
+            max_entries=int(os.getenv("COMPLETION_CACHE_SIZE", "10000")),
+            path=os.getenv("COMPLETION_CACHE_PATH") or None
+        )
+        
+        # Process-wide rate limits (0 = unlimited), shared by every thread and event loop.
+        # Chat and embedding models have separate provider limits, so each gets its own buckets.
+        completion_rate_limiter = RateLimiter(
+            requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+            tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+        )
+        embedding_rate_limiter = RateLimiter(
+            requests_per_minute=float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "0")),
+            tokens_per_minute=float(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "0"))
+        )
+        
+        # Concurrent async embedding requests are coalesced into batched API calls: a batch
+        # is sent EMBEDDING_BATCH_WAIT_MS after its first text or once it holds EMBEDDING_BATCH_SIZE texts
+        embedding_batcher = EmbeddingBatcher(
+            lambda texts, model, dimensions: _create_embeddings_async(texts, model, dimensions),
+            max_wait=float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5")) / 1000,
+            max_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+        )
+        
+        # Completion reliability defaults: per-attempt deadline (seconds), retries of
+        # transient errors, overall deadline of a call including retries and backoff
+        # (seconds), and whether to hedge attempts slower than the observed p95
+        COMPLETION_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+        COMPLETION_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+        COMPLETION_DEADLINE = float(os.getenv("LLM_DEADLINE", "90"))
+        COMPLETION_HEDGING = os.getenv("LLM_HEDGING", "0") != "0"
+        
+        # Append-only session log of every API call, written by a background thread.
+        # LLM_LOG_FORMAT selects "yaml" or "jsonl", LLM_LOG_MAX_BYTES the rotation size,
+        # and LLM_LOG_PROMPTS=0 omits full messages and embedding inputs.
+        if _configured:
+            call_logger.close()
+        SESSION_ID = str(uuid.uuid4())[:8]  # Use first 8 chars for readability
+        log_format = os.getenv("LLM_LOG_FORMAT", "yaml")
+        LOG_FILE = Path(log_dir) / f"llm_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{SESSION_ID}.{log_format}"
+        call_logger = LLMCallLogger(
+            LOG_FILE,
+            SESSION_ID,
+            log_format=log_format,
+            max_bytes=int(os.getenv("LLM_LOG_MAX_BYTES", "50000000")),
+            log_prompts=os.getenv("LLM_LOG_PROMPTS", "1") != "0"
+        )
+        
+        _configured = True
+
+
+def _ensure_configured():
+    """Run configure() with default settings unless it has already run."""
+    if not _configured:
+        with _configure_lock:
+            if not _configured:
+                configure()
+
+
+def __getattr__(name: str):
+    """Configure on first access to a lazily created attribute (e.g. llm_client.async_client)."""
+    if name in CONFIGURED_NAMES:
+        _ensure_configured()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def log_llm_call(call_type: str, input_data: dict, response_data: dict, duration: float, error: str = None):
+    """
+    Log an LLM call to the session log.
     
-    # Write updated log file
-    with open(LOG_FILE, 'w', encoding='utf-8') as f:
-        yaml.dump(log_data, f, Dumper=SuperAggressiveDumper, default_flow_style=False, allow_unicode=True, width=120, indent=2)
+    The call is queued for the background writer, so the cost is constant and
+    the caller (sync or async) never waits on file I/O.
+    """
+    _ensure_configured()
+    call_logger.log(call_type, input_data, response_data, duration, error)
 
 
 def get_embedding(
     input: str | List[str], 
-    model: str = "text-embedding-3-small"
+    model: str = "text-embedding-3-small",
+    use_cache: bool = True,
+    dimensions: Optional[int] = None
 ) -> List[float]:
     """
     Get embedding for the given text using OpenAI embedding API.
     
+    Texts already in the embedding cache are served from it; only the
+    remaining (deduplicated) texts are sent to the API.
+    
+    Args:
+        input: Text string or list of text strings to embed
+        model: Embedding model to use
+        use_cache: Whether to read from and write to the embedding cache
+        dimensions: Request shortened embeddings of this size (text-embedding-3-* only)
+        
+    Returns:
+        Embedding vector for single input, or list of embedding vectors for multiple inputs
+    """
+    _ensure_configured()
+    cache_model = _embedding_cache_model(model, dimensions)
+    texts, embeddings, missing_texts = _lookup_cached_embeddings(input, cache_model, use_cache)
+    fetched = {}
+    if missing_texts:
+        fetched = dict(zip(missing_texts, _create_embeddings(missing_texts, model, dimensions)))
+    return _merge_fetched_embeddings(input, cache_model, use_cache, texts, embeddings, fetched)
+
+
+async def get_embedding_async(
+    input: str | List[str],
+    model: str = "text-embedding-3-small",
+    use_cache: bool = True,
+    dimensions: Optional[int] = None
+) -> List[float]:
+    """
+    Get embedding for the given text using the async OpenAI client.
+    
+    Same caching and deduplication as get_embedding, without blocking the event loop
+    on the network round trip. Uncached texts go through the embedding batcher, so
+    concurrent callers share batched API calls and identical in-flight texts are
+    requested once.
+    
     Args:
         input: Text string or list of text strings to embed
         model: Embedding model to use
+        use_cache: Whether to read from and write to the embedding cache
+        dimensions: Request shortened embeddings of this size (text-embedding-3-* only)
         
     Returns:
         Embedding vector for single input, or list of embedding vectors for multiple inputs
     """
+    _ensure_configured()
+    cache_model = _embedding_cache_model(model, dimensions)
+    texts, embeddings, missing_texts = _lookup_cached_embeddings(input, cache_model, use_cache)
+    fetched = {}
+    if missing_texts:
+        fetched = dict(zip(missing_texts, await embedding_batcher.embed(missing_texts, model, dimensions)))
+    return _merge_fetched_embeddings(input, cache_model, use_cache, texts, embeddings, fetched)
+
+
+def _embedding_cache_model(model: str, dimensions: Optional[int]) -> str:
+    """Model name used in cache keys, so shortened embeddings never collide with full ones."""
+    return model if dimensions is None else f"{model}@{dimensions}"
+
+
+def _lookup_cached_embeddings(input: str | List[str], model: str, use_cache: bool):
+    """Return (texts, cached embeddings or None per text, distinct texts missing from the cache)."""
+    texts = [input] if isinstance(input, str) else list(input)
+    embeddings = [embedding_cache.get(model, text) if use_cache else None for text in texts]
+    
+    # Embed each distinct missing text once
+    missing_texts = list(dict.fromkeys(
+        text for text, embedding in zip(texts, embeddings) if embedding is None
+    ))
+    return texts, embeddings, missing_texts
+
+
+def _merge_fetched_embeddings(
+    input: str | List[str],
+    model: str,
+    use_cache: bool,
+    texts: List[str],
+    embeddings: List[Optional[List[float]]],
+    fetched: Dict[str, List[float]]
+):
+    """Cache freshly fetched embeddings and fill them into the per-text results."""
+    if use_cache:
+        embedding_cache.put_many(model, fetched)
+    embeddings = [
+        embedding if embedding is not None else fetched[text]
+        for text, embedding in zip(texts, embeddings)
+    ]
+    return embeddings[0] if isinstance(input, str) else embeddings
+
+
+def _create_embeddings(texts: List[str], model: str, dimensions: Optional[int] = None) -> List[List[float]]:
+    """
+    Call the OpenAI embedding API for a list of texts and log the call.
+    
+    Args:
+        texts: Texts to embed
+        model: Embedding model to use
+        dimensions: Optional shortened embedding size
+        
+    Returns:
+        List of embedding vectors in input order
+    """
+    estimated_tokens = sum(estimate_tokens(text) for text in texts)
+    embedding_rate_limiter.acquire(estimated_tokens)
+    
     start_time = time.time()
-    error = None
-    response_data = None
+    try:
+        response = client.embeddings.create(**_embedding_params(texts, model, dimensions))
+    except Exception as e:
+        _log_embedding_call(texts, model, None, time.time() - start_time, e)
+        # Re-raise the original exception so callers can tell transient errors apart
+        raise
+    
+    _log_embedding_call(texts, model, response, time.time() - start_time)
+    _adjust_rate_limit(embedding_rate_limiter, response, estimated_tokens)
+    return [item.embedding for item in response.data]
+
+
+async def _create_embeddings_async(
+    texts: List[str],
+    model: str,
+    dimensions: Optional[int] = None
+) -> List[List[float]]:
+    """Async variant of _create_embeddings using the async OpenAI client."""
+    estimated_tokens = sum(estimate_tokens(text) for text in texts)
+    # Query embeddings sit on the path of a user turn
+    await embedding_rate_limiter.acquire_async(estimated_tokens, INTERACTIVE)
     
+    start_time = time.time()
     try:
-        response = client.embeddings.create(
-            input=input,
-            model=model
-        )
-        
-        # Prepare response data for logging (truncate embeddings for readability)
-        if isinstance(input, str):
-            embedding = response.data[0].embedding
-            response_data = {
-                'embedding_length': len(embedding),
-                'embedding_preview': embedding[:5],  # First 5 values for preview
-                'usage': response.usage.model_dump() if hasattr(response, 'usage') else None
-            }
-            result = embedding
-        else:
-            embeddings = [item.embedding for item in response.data]
-            response_data = {
-                'embeddings_count': len(embeddings),
-                'embedding_length': len(embeddings[0]) if embeddings else 0,
-                'first_embedding_preview': embeddings[0][:5] if embeddings else [],
-                'usage': response.usage.model_dump() if hasattr(response, 'usage') else None
-            }
-            result = embeddings
-            
+        response = await async_client.embeddings.create(**_embedding_params(texts, model, dimensions))
     except Exception as e:
-        error = str(e)
-        result = None
-        response_data = {'error': error}
+        _log_embedding_call(texts, model, None, time.time() - start_time, e)
+        raise
     
-    finally:
-        duration = time.time() - start_time
-        
-        # Log the call
-        input_data = {
-            'input_type': 'string' if isinstance(input, str) else f'list[{len(input)}]',
-            'input': input,
-            'model': model
+    _log_embedding_call(texts, model, response, time.time() - start_time)
+    _adjust_rate_limit(embedding_rate_limiter, response, estimated_tokens)
+    return [item.embedding for item in response.data]
+
+
+def _adjust_rate_limit(limiter: RateLimiter, response: Any, estimated_tokens: int):
+    """Correct the limiter's token bucket with the usage the API reported."""
+    usage = getattr(response, 'usage', None)
+    total_tokens = getattr(usage, 'total_tokens', None)
+    if isinstance(total_tokens, int):
+        limiter.adjust(total_tokens - estimated_tokens)
+
+
+def _embedding_params(texts: List[str], model: str, dimensions: Optional[int]) -> Dict[str, Any]:
+    """Build embedding API parameters; dimensions is only sent when set."""
+    params = {"input": texts, "model": model}
+    if dimensions is not None:
+        params["dimensions"] = dimensions
+    return params
+
+
+def _log_embedding_call(texts: List[str], model: str, response: Any, duration: float, error: Exception = None):
+    """Log an embedding API call (truncating embeddings for readability)."""
+    if error is not None:
+        response_data = {'error': str(error)}
+    else:
+        embeddings = [item.embedding for item in response.data]
+        response_data = {
+            'embeddings_count': len(embeddings),
+            'embedding_length': len(embeddings[0]) if embeddings else 0,
+            'first_embedding_preview': embeddings[0][:5] if embeddings else [],
+            'usage': response.usage.model_dump() if hasattr(response, 'usage') else None
         }
+    
+    input_data = {
+        'input_type': f'list[{len(texts)}]',
+        'input': texts,
+        'model': model,
+        'cache_stats': embedding_cache.stats()
+    }
+    
+    log_llm_call('embedding', input_data, response_data, duration, str(error) if error is not None else None)
+
+
+def estimate_tokens(text: str) -> int:
+    """Conservatively estimate the token count of a text (about 3 UTF-8 bytes per token)."""
+    return len(text.encode('utf-8')) // 3 + 1
+
+
+def make_embedding_batches(
+    texts: List[str],
+    max_batch_tokens: int = 100_000,
+    max_batch_size: int = 512
+) -> List[List[str]]:
+    """
+    Split texts into consecutive batches bounded by estimated tokens and input count.
+    
+    Args:
+        texts: Texts to embed
+        max_batch_tokens: Maximum estimated tokens per request
+        max_batch_size: Maximum number of inputs per request
         
-        log_llm_call('embedding', input_data, response_data, duration, error)
+    Returns:
+        List of batches; concatenating them gives back texts
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if batch and (batch_tokens + tokens > max_batch_tokens or len(batch) >= max_batch_size):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _create_embeddings_with_retry(
+    texts: List[str],
+    model: str,
+    max_retries: int,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0,
+    dimensions: Optional[int] = None
+) -> List[List[float]]:
+    """Call the embedding API, retrying transient errors with jittered exponential backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            return _create_embeddings(texts, model, dimensions)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def get_embeddings_batched(
+    texts: List[str],
+    model: str = "text-embedding-3-small",
+    max_batch_tokens: int = 100_000,
+    max_batch_size: int = 512,
+    max_concurrency: int = 4,
+    max_retries: int = 5,
+    checkpoint_dir: Optional[Path] = None,
+    use_cache: bool = True,
+    dimensions: Optional[int] = None
+) -> List[List[float]]:
+    """
+    Embed many texts in token-bounded batches with a bounded number of concurrent requests.
     
-    if error:
-        raise Exception(error)
+    Texts in the embedding cache are not re-sent. Each completed batch is written
+    to checkpoint_dir (if given), so an interrupted build resumes from the
+    finished batches instead of starting over.
     
-    return result
+    Args:
+        texts: Texts to embed
+        model: Embedding model to use
+        max_batch_tokens: Maximum estimated tokens per request
+        max_batch_size: Maximum number of inputs per request
+        max_concurrency: Maximum number of requests in flight
+        max_retries: Retries per batch for transient errors
+        checkpoint_dir: Optional directory for per-batch checkpoints
+        use_cache: Whether to read from and write to the embedding cache
+        dimensions: Request shortened embeddings of this size (text-embedding-3-* only)
+        
+    Returns:
+        List of embedding vectors in input order
+    """
+    _ensure_configured()
+    cache_model = _embedding_cache_model(model, dimensions)
+    embeddings = [embedding_cache.get(cache_model, text) if use_cache else None for text in texts]
+    missing_texts = list(dict.fromkeys(
+        text for text, embedding in zip(texts, embeddings) if embedding is None
+    ))
+    batches = make_embedding_batches(missing_texts, max_batch_tokens, max_batch_size)
+    
+    if checkpoint_dir is not None:
+        checkpoint_dir = Path(checkpoint_dir)
+        checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    
+    def embed_batch(batch: List[str]) -> List[List[float]]:
+        checkpoint_file = None
+        if checkpoint_dir is not None:
+            batch_hash = hashlib.md5("\0".join([cache_model] + batch).encode('utf-8')).hexdigest()
+            checkpoint_file = checkpoint_dir / f"{batch_hash}.npy"
+            if checkpoint_file.exists():
+                return np.load(checkpoint_file).tolist()
+        
+        batch_embeddings = _create_embeddings_with_retry(batch, model, max_retries, dimensions=dimensions)
+        
+        if checkpoint_file is not None:
+            tmp_file = checkpoint_file.with_name(f"{batch_hash}.{uuid.uuid4().hex}.tmp.npy")
+            np.save(tmp_file, np.asarray(batch_embeddings, dtype=np.float32))
+            os.replace(tmp_file, checkpoint_file)
+        return batch_embeddings
+    
+    fetched = {}
+    if batches:
+        print(f"Embedding {len(missing_texts)} texts in {len(batches)} batches")
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for batch, batch_embeddings in zip(batches, executor.map(embed_batch, batches)):
+                fetched.update(zip(batch, batch_embeddings))
+    
+    if use_cache:
+        embedding_cache.put_many(cache_model, fetched)
+    
+    return [
+        embedding if embedding is not None else fetched[text]
+        for text, embedding in zip(texts, embeddings)
+    ]
 
 
 async def get_completion_async(
@@ -179,25 +544,73 @@ async def get_completion_async(
     model: str = "gpt-4o",
     temperature: float = 0.7,
     tools: Optional[List[Dict[str, Any]]] = None,
-    tool_choice: Optional[str] = None
+    tool_choice: Optional[str] = None,
+    call_type: str = "completion",
+    timeout: Optional[float] = None,
+    max_retries: Optional[int] = None,
+    deadline: Optional[float] = None,
+    hedge: Optional[bool] = None,
+    stream: bool = False,
+    on_token: Optional[Callable[[str], None]] = None,
+    log_fields: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
     Get completion from OpenAI chat completions API (asynchronous).
     
+    Results of call types enabled in the completion cache are served from it
+    when an identical low-temperature request was answered before. Each attempt
+    has a deadline; timeouts and transient errors are retried with jittered
+    exponential backoff, all within an overall deadline for the call. With hedging, an attempt still running after the p95
+    latency observed for this model and call type gets a duplicate request,
+    and whichever finishes first wins.
+    
+    With stream=True the response is streamed and each content delta is passed
+    to on_token as it arrives; the deadline then applies to the wait for each
+    chunk rather than to the whole response. Streamed calls are not hedged, and
+    are not retried once a token has been delivered.
+    
     Args:
         messages: List of message dictionaries with 'role' and 'content' keys
         model: Model to use for completion
         temperature: Sampling temperature (0-2)
         tools: Optional list of tool definitions for function calling
         tool_choice: Optional tool choice strategy ("auto", "none", or specific tool)
+        call_type: Purpose of the call (e.g. "relevance"), used for cache enablement and logging
+        timeout: Per-attempt deadline in seconds (default LLM_TIMEOUT)
+        max_retries: Retries of timeouts and transient errors (default LLM_MAX_RETRIES)
+        deadline: Overall deadline in seconds for all attempts and backoff (default LLM_DEADLINE)
+        hedge: Whether to hedge slow attempts (default LLM_HEDGING)
+        stream: Whether to stream the response
+        on_token: Optional callback receiving each streamed content delta
+        log_fields: Extra fields recorded with the call's input in the LLM log
         
     Returns:
         Dictionary with 'content' (text) and 'tool_calls' (list of tool calls if any)
     """
+    _ensure_configured()
     start_time = time.time()
     error = None
     response_data = None
     
+    cache_key = None
+    if completion_cache.enabled_for(call_type, temperature):
+        cache_key = completion_cache.make_key(model, messages, temperature, tools, tool_choice)
+        cached_result = completion_cache.get(cache_key)
+        if cached_result is not None:
+            log_llm_call(
+                'completion_async',
+                {'call_type': call_type, 'model': model, 'cache': 'hit', 'message_count': len(messages)},
+                {'content': cached_result['content'], 'cached': True},
+                time.time() - start_time
+            )
+            if stream and on_token and cached_result['content']:
+                on_token(cached_result['content'])
+            return cached_result
+    
+    attempts = 0
+    hedges = 0
+    first_token_seconds = None
+    
     try:
         # Build API parameters
         api_params = {
@@ -212,7 +625,70 @@ async def get_completion_async(
             if tool_choice:
                 api_params["tool_choice"] = tool_choice
         
-        response = await async_client.chat.completions.create(**api_params)
+        estimated_tokens = estimate_tokens(json.dumps(messages, default=str)) + (
+            estimate_tokens(json.dumps(tools)) if tools else 0
+        )
+        priority = CALL_PRIORITIES.get(call_type, DEFAULT)
+        latency_key = (model, call_type)
+        timeout = COMPLETION_TIMEOUT if timeout is None else timeout
+        max_retries = COMPLETION_MAX_RETRIES if max_retries is None else max_retries
+        deadline = COMPLETION_DEADLINE if deadline is None else deadline
+        hedge = (COMPLETION_HEDGING if hedge is None else hedge) and not stream
+        
+        def forward_token(token: str):
+            nonlocal first_token_seconds
+            if first_token_seconds is None:
+                first_token_seconds = time.time() - start_time
+            if on_token:
+                on_token(token)
+        
+        async def attempt(duplicate: bool = False):
+            """One rate-limited API call under the per-attempt deadline; hedge duplicates are not timed."""
+            nonlocal attempts
+            attempts += 1
+            await completion_rate_limiter.acquire_async(estimated_tokens, priority)
+            attempt_start = time.monotonic()
+            try:
+                if stream:
+                    response = await _stream_completion(api_params, timeout, forward_token)
+                else:
+                    response = await asyncio.wait_for(async_client.chat.completions.create(**api_params), timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                # Lost a hedge or timed out: it would have taken at least this long, so the
+                # elapsed time is kept as a censored sample instead of leaving only fast winners
+                if not duplicate:
+                    completion_latencies.record(latency_key, time.monotonic() - attempt_start)
+                raise
+            if not duplicate:
+                completion_latencies.record(latency_key, time.monotonic() - attempt_start)
+            _adjust_rate_limit(completion_rate_limiter, response, estimated_tokens)
+            return response
+        
+        async def attempt_with_retries():
+            """Attempts (hedged if enabled) with jittered backoff between retries."""
+            nonlocal hedges
+            for retry in range(max_retries + 1):
+                try:
+                    hedge_delay = completion_latencies.percentile(latency_key) if hedge else None
+                    if hedge_delay is None:
+                        return await attempt()
+                    response, hedged = await _hedged(attempt, hedge_delay)
+                    hedges += hedged
+                    return response
+                except (*RETRYABLE_ERRORS, asyncio.TimeoutError) as e:
+                    if retry == max_retries or first_token_seconds is not None:
+                        raise
+                    delay = min(8.0, 0.5 * 2 ** retry) * random.uniform(0.5, 1.0)
+                    print(f"Completion attempt failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+        
+        retries_start = time.monotonic()
+        try:
+            response = await asyncio.wait_for(attempt_with_retries(), deadline)
+        except asyncio.TimeoutError:
+            if time.monotonic() - retries_start < deadline:
+                raise  # the last attempt timed out, not the call
+            raise asyncio.TimeoutError(f"Completion did not finish within the {deadline}s deadline")
         
         message = response.choices[0].message
         
@@ -222,6 +698,9 @@ async def get_completion_async(
             'tool_calls': [call.model_dump() for call in message.tool_calls] if message.tool_calls else []
         }
         
+        if cache_key is not None:
+            completion_cache.put(cache_key, call_type, result)
+        
         response_data = {
             'content': message.content,
             'finish_reason': response.choices[0].finish_reason,
@@ -231,7 +710,7 @@ async def get_completion_async(
         }
         
     except Exception as e:
-        error = str(e)
+        error = str(e) or type(e).__name__
         result = {'content': None, 'tool_calls': []}
         response_data = {'error': error}
     
@@ -240,14 +719,22 @@ async def get_completion_async(
         
         # Log the call
         input_data = {
+            'call_type': call_type,
+            'cache': 'miss' if cache_key is not None else None,
             'messages': messages,
             'model': model,
             'temperature': temperature,
             'message_count': len(messages),
             'total_input_chars': sum(len(str(msg.get('content', ''))) for msg in messages),
             'tools_provided': len(tools) if tools else 0,
-            'tool_choice': tool_choice
+            'tool_choice': tool_choice,
+            'attempts': attempts,
+            'hedged_attempts': hedges,
+            'stream': stream,
+            **(log_fields or {})
         }
+        if stream and response_data is not None:
+            response_data['time_to_first_token'] = round(first_token_seconds, 3) if first_token_seconds is not None else None
         
         log_llm_call('completion_async', input_data, response_data, duration, error)
     
@@ -255,3 +742,97 @@ async def get_completion_async(
         raise Exception(error)
     
     return result
+
+
+async def _hedged(attempt: Callable[..., Awaitable[Any]], hedge_delay: float):
+    """
+    Run an attempt, and a duplicate if it has not finished after hedge_delay seconds.
+    
+    The duplicate is started with attempt(duplicate=True).
+    
+    Returns:
+        Tuple of (first successful result, number of hedge requests issued); raises
+        the last error if every attempt failed
+    """
+    tasks = {asyncio.ensure_future(attempt())}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if done:
+            return done.pop().result(), 0
+        
+        tasks.add(asyncio.ensure_future(attempt(duplicate=True)))
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), 1
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _stream_completion(api_params: Dict[str, Any], timeout: float, on_token: Callable[[str], None]) -> ChatCompletion:
+    """
+    Run a streaming chat completion and assemble the chunks into one response.
+    
+    Content deltas are passed to on_token as they arrive; tool call deltas are
+    accumulated by index. The deadline applies to the wait for each chunk.
+    
+    Returns:
+        ChatCompletion equivalent to the non-streamed response
+    """
+    stream = await asyncio.wait_for(
+        async_client.chat.completions.create(**api_params, stream=True, stream_options={"include_usage": True}),
+        timeout
+    )
+    chunks = stream.__aiter__()
+    content = []
+    tool_calls: Dict[int, Dict[str, Any]] = {}
+    finish_reason = None
+    usage = None
+    model = api_params['model']
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+            except StopAsyncIteration:
+                break
+            model = chunk.model or model
+            if chunk.usage:
+                usage = chunk.usage.model_dump()
+            for choice in chunk.choices:
+                if choice.delta.content:
+                    content.append(choice.delta.content)
+                    on_token(choice.delta.content)
+                for call in choice.delta.tool_calls or []:
+                    entry = tool_calls.setdefault(call.index, {
+                        'id': '', 'type': 'function', 'function': {'name': '', 'arguments': ''}
+                    })
+                    entry['id'] = call.id or entry['id']
+                    if call.function:
+                        entry['function']['name'] += call.function.name or ''
+                        entry['function']['arguments'] += call.function.arguments or ''
+                finish_reason = choice.finish_reason or finish_reason
+    finally:
+        if hasattr(stream, 'close'):
+            await stream.close()
+    
+    return ChatCompletion.model_validate({
+        'id': '',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'finish_reason': finish_reason or 'stop',
+            'message': {
+                'role': 'assistant',
+                'content': ''.join(content) if content else None,
+                'tool_calls': [tool_calls[index] for index in sorted(tool_calls)] or None
+            }
+        }],
+        'usage': usage
+    })
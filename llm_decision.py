@@ -1,8 +1,16 @@
 #!/usr/bin/env python3
 
 import json
-from typing import List, Dict, Optional, Any, Union
-from llm_client import get_completion_async
+from typing import Callable, List, Dict, Optional, Any, Tuple, Union
+from llm_client import estimate_tokens, get_completion_async
+
+# Token budget for the conversation history sent with each call type (the system
+# prompt and the final instruction message are not counted)
+HISTORY_TOKEN_BUDGETS = {
+    "respond": 4000,
+    "relevance": 1000,
+    "query_rewrite": 1000
+}
 
 
 def _convert_messages_to_openai_format(messages: List[Any]) -> List[Dict[str, Any]]:
@@ -38,10 +46,72 @@ def _convert_messages_to_openai_format(messages: List[Any]) -> List[Dict[str, An
     
     return openai_messages
 
+
+def _message_tokens(message: Dict[str, Any]) -> int:
+    """Estimated prompt tokens of one OpenAI-format message, including per-message overhead."""
+    tokens = 4
+    if message.get("content"):
+        tokens += estimate_tokens(str(message["content"]))
+    if message.get("tool_calls"):
+        tokens += estimate_tokens(json.dumps(message["tool_calls"], default=str))
+    return tokens
+
+
+def budget_history(
+    messages: List[Dict[str, Any]],
+    max_tokens: int,
+    max_messages: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Keep the most recent conversation messages that fit a token budget.
+    
+    An assistant message with tool calls and the tool results answering it are
+    kept or dropped together, and tool results whose call is not in the list
+    are dropped, so the API never sees an orphaned tool message. The newest
+    message (with its tool results) is always kept.
+    
+    Args:
+        messages: Conversation in OpenAI format, oldest first
+        max_tokens: Token budget for the kept messages
+        max_messages: Optional cap on the number of kept messages
+        
+    Returns:
+        Tuple of (kept messages, stats with history_messages, history_messages_sent
+        and history_tokens_saved)
+    """
+    groups = []
+    for message in messages:
+        if message.get("role") != "tool":
+            groups.append([message])
+        elif groups and groups[-1][0].get("tool_calls"):
+            groups[-1].append(message)
+    
+    kept = []
+    kept_tokens = 0
+    for group in reversed(groups):
+        group_tokens = sum(_message_tokens(message) for message in group)
+        if kept and (
+            kept_tokens + group_tokens > max_tokens
+            or (max_messages is not None and len(kept) + len(group) > max_messages)
+        ):
+            break
+        kept[:0] = group
+        kept_tokens += group_tokens
+    
+    total_tokens = sum(_message_tokens(message) for message in messages)
+    return kept, {
+        "history_messages": len(messages),
+        "history_messages_sent": len(kept),
+        "history_tokens_saved": total_tokens - kept_tokens
+    }
+
+
 async def is_relevant(
     messages: List[Any],  # List of Message objects
     snippet: str,
-    model: str = "gpt-4o"
+    model: str = "gpt-4o",
+    max_history_tokens: Optional[int] = None,
+    max_history_messages: Optional[int] = None
 ) -> Dict[str, Union[bool, float, str]]:
     """
     Use LLM to judge if a knowledge base snippet is relevant to the conversation.
@@ -50,6 +120,8 @@ async def is_relevant(
         messages: List of conversation messages (Message objects)
         snippet: Knowledge base snippet to evaluate
         model: LLM model to use for relevance judgment
+        max_history_tokens: History token budget (default HISTORY_TOKEN_BUDGETS["relevance"])
+        max_history_messages: Optional cap on the number of history messages sent
         
     Returns:
         Dict with keys:
@@ -58,8 +130,12 @@ async def is_relevant(
         - "reasoning": String explaining the relevance judgment
     """
     
-    # Convert messages to OpenAI format
-    conversation_messages = _convert_messages_to_openai_format(messages)
+    # Convert messages to OpenAI format, keeping the most recent history within the token budget
+    conversation_messages, history_stats = budget_history(
+        _convert_messages_to_openai_format(messages),
+        HISTORY_TOKEN_BUDGETS["relevance"] if max_history_tokens is None else max_history_tokens,
+        max_history_messages
+    )
     
     # Create the system prompt for relevance judgment
     system_prompt = """You are an expert at evaluating the relevance of knowledge snippets to conversations. Your task is to determine whether a given knowledge base snippet could be useful for answering the user's questions or continuing the conversation meaningfully.
@@ -106,11 +182,13 @@ Please evaluate whether this knowledge snippet is relevant to the conversation a
 
     try:
         # Call OpenAI API via async client
-        llm_response = await get_completion_async(
+        llm_response = (await get_completion_async(
             messages=api_messages,
             model=model,
-            temperature=0.1  # Low temperature for consistent relevance judgments
-        )['content']
+            temperature=0.1,  # Low temperature for consistent relevance judgments
+            call_type="relevance",
+            log_fields=history_stats
+        ))['content']
 
         # Extract and clean the response content
         llm_response = llm_response.strip()
@@ -153,17 +231,123 @@ Please evaluate whether this knowledge snippet is relevant to the conversation a
             "reasoning": f"Error during relevance evaluation: {str(e)}"
         }
 
+JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class StreamingTextExtractor:
+    """
+    Incremental parser that extracts the top-level "text" field of a streamed JSON object.
+    
+    Chunks of the raw response are fed as they arrive and the decoded characters
+    of the "text" string value are returned as soon as they are complete, so the
+    reply can be shown before the rest of the JSON (decision_option, workflow)
+    has been generated. Anything before the first "{" (e.g. a markdown fence)
+    is ignored.
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self._depth = 0
+        self._in_string = False
+        self._escape = ""  # pending escape sequence, starting with a backslash
+        self._high_surrogate = ""
+        self._expect_key = False
+        self._is_key = False
+        self._key_chars: List[str] = []
+        self._key: Optional[str] = None
+        self._emitting = False
+    
+    def feed(self, chunk: str) -> str:
+        """
+        Consume a chunk of the response.
+        
+        Args:
+            chunk: Next piece of the raw response content
+            
+        Returns:
+            Newly decoded characters of the "text" field (may be empty)
+        """
+        output = []
+        for char in chunk:
+            if self._in_string:
+                decoded = self._consume_string_char(char)
+                if decoded is None:
+                    continue
+                if self._emitting:
+                    output.append(decoded)
+                elif self._is_key:
+                    self._key_chars.append(decoded)
+            elif char == '"':
+                self._in_string = True
+                self._is_key = self._depth == 1 and self._expect_key
+                self._emitting = self._depth == 1 and not self._expect_key and self._key == "text"
+                self._key_chars = []
+            elif char in "{[":
+                self._depth += 1
+                self._expect_key = self._depth == 1 and char == "{"
+            elif char in "}]":
+                self._depth -= 1
+            elif char == "," and self._depth == 1:
+                self._expect_key = True
+                self._key = None
+        
+        new_text = "".join(output)
+        self.text += new_text
+        return new_text
+    
+    def _consume_string_char(self, char: str) -> Optional[str]:
+        """Advance through a string literal; returns the decoded character, if one is complete."""
+        if self._escape:
+            self._escape += char
+            if self._escape[1] != "u":
+                decoded = JSON_ESCAPES.get(char, char)
+            elif len(self._escape) == 6:
+                decoded = chr(int(self._escape[2:], 16))
+            else:
+                return None
+            self._escape = ""
+            return self._combine_surrogates(decoded)
+        if char == "\\":
+            self._escape = char
+            return None
+        if char == '"':
+            self._in_string = False
+            if self._is_key:
+                self._key = "".join(self._key_chars)
+                self._expect_key = False
+            self._is_key = False
+            self._emitting = False
+            return None
+        return char
+    
+    def _combine_surrogates(self, decoded: str) -> Optional[str]:
+        """Join a \\uXXXX surrogate pair into one character."""
+        if "\ud800" <= decoded <= "\udbff":
+            self._high_surrogate = decoded
+            return None
+        if self._high_surrogate and "\udc00" <= decoded <= "\udfff":
+            decoded = (self._high_surrogate + decoded).encode("utf-16", "surrogatepass").decode("utf-16")
+        self._high_surrogate = ""
+        return decoded
+
+
 async def respond(
     messages: List[Any],  # List of Message objects
     available_workflows: List[str],
     active_node: Optional[Any],  # WorkflowNode object or None
     context: str,
     model: str = "gpt-4o",
-    tools: Optional[List[Dict]] = None
+    tools: Optional[List[Dict]] = None,
+    on_text: Optional[Callable[[str], None]] = None,
+    max_history_tokens: Optional[int] = None,
+    max_history_messages: Optional[int] = None
 ) -> Dict[str, Optional[str]]:
     """
     Generate LLM response to determine next action.
     
+    With on_text, the completion is streamed and the "text" field of the JSON
+    response is passed to on_text piece by piece as it is generated.
+    
     Args:
         messages: List of Message objects from the conversation
         available_workflows: Available workflow names
@@ -171,6 +355,9 @@ async def respond(
         context: Relevant knowledge base snippets for context
         model: LLM model to use for response generation
         tools: Optional list of tool definitions for function calling
+        on_text: Optional callback receiving the response text as it streams
+        max_history_tokens: History token budget (default HISTORY_TOKEN_BUDGETS["respond"])
+        max_history_messages: Optional cap on the number of history messages sent
     
     Returns:
         Dict with keys:
@@ -180,8 +367,12 @@ async def respond(
         - "tool_calls": List of tool calls if any (optional)
     """
     
-    # Convert messages to OpenAI format and build the message list
-    conversation_messages = _convert_messages_to_openai_format(messages)
+    # Convert messages to OpenAI format, keeping the most recent history within the token budget
+    conversation_messages, history_stats = budget_history(
+        _convert_messages_to_openai_format(messages),
+        HISTORY_TOKEN_BUDGETS["respond"] if max_history_tokens is None else max_history_tokens,
+        max_history_messages
+    )
     
     # Extract available options from active node
     available_options = list(active_node.options.keys()) if active_node else []
@@ -246,13 +437,24 @@ IMPORTANT RULES:
     api_messages.extend(conversation_messages)
     api_messages.append({"role": "user", "content": context_message})
 
+    extractor = StreamingTextExtractor()
+    
+    def forward_text(token: str):
+        text = extractor.feed(token)
+        if text:
+            on_text(text)
+    
     try:
         # Call OpenAI API via async client with tool support
         llm_result = await get_completion_async(
             messages=api_messages,
             model=model,
             temperature=0.3,  # Lower temperature for more consistent responses
-            tools=tools
+            tools=tools,
+            call_type="respond",
+            log_fields=history_stats,
+            stream=on_text is not None,
+            on_token=forward_text if on_text else None
         )
         
         # Check if there are tool calls
@@ -328,7 +530,9 @@ IMPORTANT RULES:
 
 async def rewrite_query_for_search(
     messages: List[Any],  # List of Message objects
-    model: str = "gpt-4o"
+    model: str = "gpt-4o",
+    max_history_tokens: Optional[int] = None,
+    max_history_messages: Optional[int] = None
 ) -> str:
     """
     Rewrite conversation history into an effective search query for knowledge base retrieval.
@@ -342,13 +546,19 @@ async def rewrite_query_for_search(
     Args:
         messages: List of conversation messages (Message objects)
         model: LLM model to use for query rewriting
+        max_history_tokens: History token budget (default HISTORY_TOKEN_BUDGETS["query_rewrite"])
+        max_history_messages: Optional cap on the number of history messages sent
         
     Returns:
         Rewritten search query string (may be multi-line)
     """
     
-    # Convert messages to OpenAI format
-    conversation_messages = _convert_messages_to_openai_format(messages)
+    # Convert messages to OpenAI format, keeping the most recent history within the token budget
+    conversation_messages, history_stats = budget_history(
+        _convert_messages_to_openai_format(messages),
+        HISTORY_TOKEN_BUDGETS["query_rewrite"] if max_history_tokens is None else max_history_tokens,
+        max_history_messages
+    )
     
     # Create the system prompt for query rewriting
     system_prompt = """You are an expert at analyzing conversations and creating effective search queries for knowledge retrieval. Your task is to analyze a conversation and generate a search query that will help find the most relevant information from a knowledge base.
@@ -394,11 +604,13 @@ Analyze the conversation flow, identify the current focus, and create a search q
         query_response = await get_completion_async(
             messages=api_messages,
             model=model,
-            temperature=0.3  # Lower temperature for more focused, consistent queries
+            temperature=0.3,  # Lower temperature for more focused, consistent queries
+            call_type="query_rewrite",
+            log_fields=history_stats
         )
         
         # Clean and return the query
-        return query_response.strip()
+        return query_response['content'].strip()
         
     except Exception as e:
         # Fallback: use the last user message as search query if LLM fails
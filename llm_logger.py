@@ -0,0 +1,215 @@
+"""
+Append-only logger for LLM API calls.
+
+Calls are handed to a background thread through a queue, so logging never
+blocks the caller, and each call is appended to the session log as one YAML
+document (or one JSON line). The log file rotates once it exceeds a size limit.
+The file and the writer thread are only created when the first call is logged.
+"""
+
+import atexit
+import itertools
+import json
+import queue
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+import yaml
+
+
+# Configure YAML to use literal block scalars for multiline strings (once at module import)
+class SuperAggressiveDumper(yaml.SafeDumper):
+    """Custom YAML dumper that forces literal block scalars for multiline content, even with problematic characters."""
+
+    def represent_str(self, data):
+        if '\n' in data or len(data) > 80:
+            # Force literal style regardless of content (JSON, quotes, asterisks, etc.)
+            tag = 'tag:yaml.org,2002:str'
+            return self.represent_scalar(tag, data, style='|')
+        return self.represent_scalar('tag:yaml.org,2002:str', data)
+
+    def choose_scalar_style(self):
+        # Override the style choice mechanism to force literal blocks
+        if self.event.tag == 'tag:yaml.org,2002:str':
+            if self.event.value and ('\n' in self.event.value or len(self.event.value) > 80):
+                return '|'
+        return super().choose_scalar_style()
+
+# Register the custom string representer
+SuperAggressiveDumper.add_representer(str, SuperAggressiveDumper.represent_str)
+
+# Input fields holding full prompt or document text, dropped when prompts are not logged
+PROMPT_FIELDS = ('messages', 'input')
+
+LOG_FORMATS = ("yaml", "jsonl")
+
+
+class LLMCallLogger:
+    """
+    Non-blocking, append-only session log of LLM calls.
+
+    The file starts with a session_info document, followed by one document per
+    call. When the file exceeds max_bytes it is renamed to <name>.1 (older
+    files shift up to backup_count) and a new file is started.
+    """
+
+    def __init__(
+        self,
+        log_file: Path,
+        session_id: str,
+        log_format: str = "yaml",
+        max_bytes: int = 50_000_000,
+        backup_count: int = 5,
+        log_prompts: bool = True,
+        max_queue_size: int = 10_000
+    ):
+        """
+        Initialize the logger; the file and writer thread are created by the first call to log.
+
+        Args:
+            log_file: Path of the session log file
+            session_id: Identifier written with every call
+            log_format: "yaml" (YAML document stream) or "jsonl" (one JSON object per line)
+            max_bytes: Rotate the file once it grows past this size (0 disables rotation)
+            backup_count: Number of rotated files to keep
+            log_prompts: Whether to log full messages and embedding inputs
+            max_queue_size: Calls buffered before new ones are dropped
+        """
+        if log_format not in LOG_FORMATS:
+            raise ValueError(f"Unsupported log_format: {log_format}")
+
+        self.log_file = Path(log_file)
+        self.session_id = session_id
+        self.log_format = log_format
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.log_prompts = log_prompts
+        self.dropped = 0
+        self.session_start = datetime.now()
+
+        self._call_counter = itertools.count(1)
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._file = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._exit_handler_registered = False
+
+    def _start(self):
+        """Open the log file, write the session header and start the writer thread (once)."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self.log_file.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.log_file, 'a', encoding='utf-8')
+            self._write_header()
+
+            self._thread = threading.Thread(target=self._run, name="llm-call-logger", daemon=True)
+            self._thread.start()
+            if not self._exit_handler_registered:
+                atexit.register(self.close)
+                self._exit_handler_registered = True
+
+    def log(
+        self,
+        call_type: str,
+        input_data: Dict[str, Any],
+        response_data: Optional[Dict[str, Any]],
+        duration: float,
+        error: Optional[str] = None
+    ):
+        """Queue one call for writing; never blocks (calls are dropped if the queue is full)."""
+        if self._thread is None:
+            self._start()
+        timestamp = datetime.now().isoformat()
+        entry = {
+            'call_id': f"call_{next(self._call_counter):03d}",
+            'timestamp': timestamp,
+            'session_id': self.session_id,
+            'call_type': call_type,
+            'duration_seconds': round(duration, 3),
+            'input': input_data if self.log_prompts else self._omit_prompts(input_data),
+            'response': response_data
+        }
+        if error:
+            entry['error'] = error
+
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Block until every queued call has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Write remaining calls and stop the writer thread (a later call to log starts it again)."""
+        with self._start_lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            self._thread.join()
+            self._file.close()
+            self._thread = None
+
+    @staticmethod
+    def _omit_prompts(input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Replace full prompt fields by their sizes."""
+        return {
+            key: (f"<omitted: {len(value)} items>" if key in PROMPT_FIELDS and isinstance(value, list) else value)
+            for key, value in input_data.items()
+        }
+
+    def _run(self):
+        """Writer thread: append queued calls to the log file in order."""
+        while True:
+            entry = self._queue.get()
+            try:
+                if entry is None:
+                    return
+                self._write(entry)
+            except Exception as e:
+                print(f"Failed to write LLM call log: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write_header(self):
+        self._append({
+            'session_info': {
+                'session_id': self.session_id,
+                'started_at': self.session_start.isoformat(),
+                'log_file': self.log_file.name
+            }
+        })
+
+    def _write(self, document: Dict[str, Any]):
+        """Append one document and rotate the file if it grew too large."""
+        self._append(document)
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _append(self, document: Dict[str, Any]):
+        if self.log_format == "jsonl":
+            self._file.write(json.dumps(document, ensure_ascii=False, default=str) + "\n")
+        else:
+            yaml.dump(
+                document, self._file, Dumper=SuperAggressiveDumper, explicit_start=True,
+                default_flow_style=False, allow_unicode=True, width=120, indent=2
+            )
+        self._file.flush()
+
+    def _rotate(self):
+        """Shift log.N -> log.N+1, move the current file to log.1 and start a new file."""
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = self.log_file.with_name(f"{self.log_file.name}.{index}")
+            if source.exists():
+                source.replace(self.log_file.with_name(f"{self.log_file.name}.{index + 1}"))
+        if self.backup_count > 0:
+            self.log_file.replace(self.log_file.with_name(f"{self.log_file.name}.1"))
+        else:
+            self.log_file.unlink()
+
+        self._file = open(self.log_file, 'a', encoding='utf-8')
+        self._write_header()
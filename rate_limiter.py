@@ -0,0 +1,142 @@
+"""
+Process-wide rate limiting for outbound API calls.
+
+A RateLimiter holds two token buckets (requests per minute and tokens per
+minute) and a priority queue of waiting callers: a caller is admitted only
+when it is the highest-priority (then oldest) waiter and both buckets can pay
+for it. State is guarded by a threading lock rather than asyncio primitives,
+so one limiter serves threads and any number of event loops (app.py runs each
+request in a fresh loop).
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+# Priorities: lower values are admitted first
+INTERACTIVE = 0
+DEFAULT = 1
+BACKGROUND = 2
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests/min and tokens/min with priority admission.
+
+    Each bucket holds at most one minute of budget and refills continuously.
+    A limit of 0 disables that bucket; with both disabled, acquire returns at once.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0, poll_interval: float = 0.05):
+        """
+        Initialize the limiter with full buckets.
+
+        Args:
+            requests_per_minute: Maximum request rate (0 for unlimited)
+            tokens_per_minute: Maximum token rate (0 for unlimited)
+            poll_interval: Longest time an async waiter sleeps before re-checking its turn
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.poll_interval = poll_interval
+
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._waiters = []  # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.requests_per_minute or self.tokens_per_minute)
+
+    def acquire(self, tokens: int = 0, priority: int = DEFAULT):
+        """Block the calling thread until a request of this many tokens is admitted."""
+        if not self.enabled:
+            return
+        with self._condition:
+            ticket = self._enqueue(priority)
+            try:
+                while True:
+                    wait = self._try_admit(ticket, tokens)
+                    if wait == 0:
+                        return
+                    self._condition.wait(timeout=wait)
+            finally:
+                self._dequeue(ticket)
+
+    async def acquire_async(self, tokens: int = 0, priority: int = DEFAULT):
+        """Wait without blocking the event loop until a request of this many tokens is admitted."""
+        if not self.enabled:
+            return
+        with self._condition:
+            ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_admit(ticket, tokens)
+                if wait == 0:
+                    return
+                await asyncio.sleep(min(wait, self.poll_interval))
+        finally:
+            with self._condition:
+                self._dequeue(ticket)
+
+    def adjust(self, tokens: int):
+        """Charge (or refund, if negative) tokens once a call's actual usage is known."""
+        if not self.tokens_per_minute or not tokens:
+            return
+        with self._condition:
+            self._refill()
+            self._tokens = min(self._tokens - tokens, float(self.tokens_per_minute))
+            self._condition.notify_all()
+
+    def _enqueue(self, priority: int):
+        ticket = (priority, next(self._sequence))
+        heapq.heappush(self._waiters, ticket)
+        return ticket
+
+    def _dequeue(self, ticket):
+        """Remove a ticket (admitted or cancelled) and wake the remaining waiters."""
+        if ticket in self._waiters:
+            self._waiters.remove(ticket)
+            heapq.heapify(self._waiters)
+        self._condition.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed_minutes = (now - self._updated) / 60.0
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(float(self.requests_per_minute), self._requests + elapsed_minutes * self.requests_per_minute)
+        if self.tokens_per_minute:
+            self._tokens = min(float(self.tokens_per_minute), self._tokens + elapsed_minutes * self.tokens_per_minute)
+
+    def _try_admit(self, ticket, tokens: int) -> float:
+        """
+        Admit the ticket if it is first in line and both buckets can pay (lock held).
+
+        Returns:
+            0 if admitted, otherwise seconds to wait before trying again
+        """
+        self._refill()
+        if self._waiters[0] != ticket:
+            return self.poll_interval
+
+        # A request larger than a full bucket is admitted once the bucket is full
+        tokens = min(tokens, self.tokens_per_minute) if self.tokens_per_minute else 0
+        wait = 0.0
+        if self.requests_per_minute and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60.0 / self.requests_per_minute)
+        if tokens and self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60.0 / self.tokens_per_minute)
+        if wait > 0:
+            return wait
+
+        if self.requests_per_minute:
+            self._requests -= 1
+        self._tokens -= tokens
+        return 0
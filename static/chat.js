@@ -71,13 +71,9 @@ class ChatApp {
             // Clear input
             this.messageInput.value = '';
             
-            // Step 2: Process bot response (this may take time with LLM)
-            const botResponse = await fetch('/api/generate_response', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' }
-            });
-            
-            const botData = await botResponse.json();
+            // Step 2: Process bot response (this may take time with LLM),
+            // showing the reply text as it streams in
+            const botData = await this.generateResponse();
             
             if (botData.error) {
                 this.showError(botData.error);
@@ -104,6 +100,56 @@ class ChatApp {
         }
     }
     
+    generateResponse() {
+        // Without EventSource support, wait for the complete response
+        if (!window.EventSource) {
+            return fetch('/api/generate_response', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' }
+            }).then(response => response.json());
+        }
+        
+        return new Promise((resolve, reject) => {
+            const source = new EventSource('/api/generate_response_stream');
+            let streamingDiv = null;
+            
+            const finish = () => {
+                source.close();
+                if (streamingDiv) {
+                    streamingDiv.remove();
+                }
+            };
+            
+            // Grow a temporary bot message as tokens arrive; it is replaced
+            // by the final messages once the response is complete
+            source.addEventListener('token', event => {
+                if (!streamingDiv) {
+                    streamingDiv = document.createElement('div');
+                    streamingDiv.className = 'message bot-message streaming';
+                    this.chatMessages.appendChild(streamingDiv);
+                }
+                streamingDiv.textContent += JSON.parse(event.data).text;
+                this.scrollToBottom();
+            });
+            
+            source.addEventListener('done', event => {
+                finish();
+                resolve(JSON.parse(event.data));
+            });
+            
+            // Named "error" events carry a server-side error; plain error events are
+            // connection failures (closing stops EventSource from reconnecting)
+            source.addEventListener('error', event => {
+                finish();
+                if (event.data) {
+                    resolve(JSON.parse(event.data));
+                } else {
+                    reject(new Error('Response stream failed'));
+                }
+            });
+        });
+    }
+    
     setSendButtonState(enabled) {
         this.sendButton.disabled = !enabled;
         if (enabled) {
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import unittest
+import json
+import tempfile
+from pathlib import Path
+import numpy as np
+from benchmark_retrieval import main, make_corpus, parse_sizes, run_benchmark
+
+
+class TestBenchmarkRetrieval(unittest.TestCase):
+    def test_corpus_is_deterministic_and_normalized(self):
+        """The same seed generates the same unit-norm corpus"""
+        corpus = make_corpus(300, dimension=16, seed=3)
+
+        np.testing.assert_array_equal(corpus, make_corpus(300, dimension=16, seed=3))
+        np.testing.assert_allclose(np.linalg.norm(corpus, axis=1), 1.0, rtol=1e-5)
+
+    def test_parse_sizes(self):
+        self.assertEqual(parse_sizes("1k,100k,1M,500"), [1_000, 100_000, 1_000_000, 500])
+
+    def test_report_covers_every_retriever(self):
+        """Each retriever reports build time, memory, latency percentiles and recall"""
+        report = run_benchmark([2000], dimension=32, num_queries=20, top_k=5)
+
+        result = report['results'][0]
+        self.assertEqual(result['num_rows'], 2000)
+        self.assertEqual(
+            set(result['retrievers']),
+            {'exact', 'float16_rescore', 'int8_rescore', 'coarse', 'ivf'}
+        )
+        for metrics in result['retrievers'].values():
+            self.assertLessEqual(metrics['p50_ms'], metrics['p99_ms'])
+            self.assertGreaterEqual(metrics['recall'], 0.0)
+            self.assertIn('index_bytes', metrics)
+        self.assertEqual(result['retrievers']['exact']['recall'], 1.0)
+        self.assertGreater(result['retrievers']['float16_rescore']['recall'], 0.95)
+
+    def test_cli_writes_json_report(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = Path(temp_dir) / "report.json"
+            main([
+                "--sizes", "500", "--dimension", "16", "--queries", "5",
+                "--retrievers", "int8_rescore", "--output", str(output)
+            ])
+
+            report = json.loads(output.read_text())
+            self.assertEqual(set(report['results'][0]['retrievers']), {'exact', 'int8_rescore'})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,15 +4,42 @@ import unittest
 from unittest.mock import patch, AsyncMock, MagicMock
 import asyncio
 from bot import Bot, Message
+from test_llm_client import configure_for_tests
 
 class TestBotGoBack(unittest.TestCase):
     def setUp(self):
         """Set up test fixtures before each test method."""
+        # Fake API key and temporary call log, so no session logs are left behind
+        configure_for_tests(self)
         # Mock KnowledgeBaseStore to prevent API calls during testing
+        self.kb_store = MagicMock()
+        self.kb_store.retrieve_snippets_async = AsyncMock(return_value=[
+            {"content": "Charmander's flame burns red.", "file_name": "charmander.txt", "score": 0.9}
+        ])
         with patch('bot.KnowledgeBaseStore') as mock_kb_store:
-            mock_kb_store.return_value = MagicMock()
+            mock_kb_store.return_value = self.kb_store
             self.bot = Bot()
         self.bot.load_workflow("test", "test_workflow.yaml")
+        
+        # The bot imports its LLM helpers by name, so they are patched where it uses them
+        for name, return_value in (
+            ('bot.rewrite_query_for_search', "red"),
+            ('bot.is_relevant', {'is_relevant': True, 'confidence': 0.9, 'reasoning': "test"})
+        ):
+            patcher = patch(name, new=AsyncMock(return_value=return_value))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_knowledge_base_options_are_forwarded(self):
+        """Embedding dimensions and extra store options reach the KnowledgeBaseStore"""
+        with patch('bot.KnowledgeBaseStore') as mock_kb_store:
+            Bot(embedding_dimensions=256, kb_options={"retrieval_mode": "vector", "cache_dir": "/tmp/kb-cache"})
+
+        kwargs = mock_kb_store.call_args.kwargs
+        self.assertEqual(kwargs["embedding_dimensions"], 256)
+        self.assertEqual(kwargs["retrieval_mode"], "vector")
+        self.assertEqual(kwargs["cache_dir"], "/tmp/kb-cache")
+        self.assertEqual(kwargs["knowledge_base_dir"], "knowledge_base")
     
     def test_go_back_no_messages(self):
         """Test go_back when no messages exist"""
@@ -31,7 +58,7 @@ class TestBotGoBack(unittest.TestCase):
         
         self.assertEqual(result, [])
     
-    @patch('llm_decision.respond')
+    @patch('bot.respond')
     def test_go_back_successful(self, mock_respond):
         """Test successful go_back operation with mocked LLM"""
         # Mock LLM to select the "red" option
@@ -84,7 +111,7 @@ class TestBotGoBack(unittest.TestCase):
                 self.bot.active_node
             )
     
-    @patch('llm_decision.respond')
+    @patch('bot.respond')
     def test_go_back_multiple_times(self, mock_respond):
         """Test multiple go_back operations with mocked LLM"""
         # Mock LLM to select the "red" option
@@ -115,7 +142,7 @@ class TestBotGoBack(unittest.TestCase):
         result2 = self.bot.go_back()
         self.assertEqual(result2, [])
     
-    @patch('llm_decision.respond')
+    @patch('bot.respond')
     def test_go_back_message_id_tracking(self, mock_respond):
         """Test that go_back correctly tracks and returns message IDs"""
         # Mock LLM response
@@ -152,6 +179,23 @@ class TestBotGoBack(unittest.TestCase):
         for removed_id in actual_removed_ids:
             self.assertNotIn(removed_id, current_message_ids)
     
+    @patch('bot.respond')
+    def test_knowledge_snippets_reach_the_decision_prompt(self, mock_respond):
+        """Snippets retrieved for the conversation are passed to the LLM as context"""
+        mock_respond.return_value = {"text": None, "decision_option": "red", "workflow": None}
+        self.bot.start_workflow("test")
+        
+        async def async_test():
+            return [response async for response in self.bot.process_user_input("red")]
+        
+        asyncio.run(async_test())
+        
+        self.kb_store.retrieve_snippets_async.assert_awaited_once()
+        context = mock_respond.call_args.args[3]
+        self.assertIn("[From: charmander.txt]", context)
+        self.assertIn("Charmander's flame burns red.", context)
+        self.assertEqual(self.bot.last_knowledge_snippets[0]["file_name"], "charmander.txt")
+    
     def test_can_go_back_logic(self):
         """Test the can_go_back method logic"""
         # Initially no messages
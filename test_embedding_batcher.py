@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import unittest
+import asyncio
+from embedding_batcher import EmbeddingBatcher
+
+
+class TestEmbeddingBatcher(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.error = None
+
+    async def create(self, texts, model, dimensions):
+        """Fake API: embeds each text as [len(text)] after a short delay"""
+        self.calls.append((list(texts), model, dimensions))
+        await asyncio.sleep(0.01)
+        if self.error:
+            raise self.error
+        return [[float(len(text))] for text in texts]
+
+    def test_concurrent_requests_share_one_call(self):
+        batcher = EmbeddingBatcher(self.create, max_wait=0.01)
+
+        async def run():
+            return await asyncio.gather(
+                batcher.embed(["a"], "model"),
+                batcher.embed(["bb", "ccc"], "model"),
+                batcher.embed(["dddd"], "model")
+            )
+
+        results = asyncio.run(run())
+
+        self.assertEqual(results, [[[1.0]], [[2.0], [3.0]], [[4.0]]])
+        self.assertEqual(self.calls, [(["a", "bb", "ccc", "dddd"], "model", None)])
+
+    def test_identical_in_flight_texts_are_requested_once(self):
+        """A text already waiting or in flight is not sent again"""
+        batcher = EmbeddingBatcher(self.create, max_wait=0.001)
+
+        async def run():
+            started, release = asyncio.Event(), asyncio.Event()
+
+            async def gated_create(texts, model, dimensions):
+                started.set()
+                await release.wait()
+                return await self.create(texts, model, dimensions)
+
+            batcher.create_embeddings = gated_create
+            first = asyncio.ensure_future(batcher.embed(["pikachu"], "model"))
+            await started.wait()  # first batch is now in flight
+            waiting = asyncio.ensure_future(batcher.embed(["pikachu"], "model"))
+            also_waiting = asyncio.ensure_future(batcher.embed(["pikachu"], "model"))
+            await asyncio.sleep(0)
+            release.set()
+            return await asyncio.gather(first, waiting, also_waiting)
+
+        results = asyncio.run(run())
+
+        self.assertEqual(results, [[[7.0]]] * 3)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(batcher.stats(), {'texts_requested': 3, 'texts_sent': 1, 'batches_sent': 1})
+
+    def test_batches_split_by_size_and_model(self):
+        batcher = EmbeddingBatcher(self.create, max_wait=0.01, max_batch_size=2)
+
+        async def run():
+            return await asyncio.gather(
+                batcher.embed(["a", "b", "c"], "model"),
+                batcher.embed(["a"], "model", dimensions=8)
+            )
+
+        asyncio.run(run())
+
+        self.assertEqual(sorted(self.calls, key=str), sorted([
+            (["a", "b"], "model", None),
+            (["c"], "model", None),
+            (["a"], "model", 8)
+        ], key=str))
+
+    def test_failure_reaches_every_caller_and_is_not_cached(self):
+        batcher = EmbeddingBatcher(self.create, max_wait=0.001)
+        self.error = RuntimeError("API down")
+
+        async def run():
+            return await asyncio.gather(
+                batcher.embed(["a"], "model"), batcher.embed(["b"], "model"), return_exceptions=True
+            )
+
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in asyncio.run(run())))
+
+        self.error = None
+        self.assertEqual(asyncio.run(batcher.embed(["a"], "model")), [[1.0]])
+
+    def test_short_response_fails_every_caller(self):
+        """An API response with fewer vectors than texts is an error, not a silent truncation"""
+        async def short_create(texts, model, dimensions):
+            return [[1.0]]
+
+        batcher = EmbeddingBatcher(short_create, max_wait=0.001)
+
+        async def run():
+            return await asyncio.wait_for(asyncio.gather(
+                batcher.embed(["a"], "model"), batcher.embed(["b"], "model"), return_exceptions=True
+            ), 1)
+
+        self.assertTrue(all(isinstance(result, ValueError) for result in asyncio.run(run())))
+
+    def test_cancelled_batch_releases_its_callers(self):
+        """Callers coalesced onto a cancelled batch get an error instead of hanging, and can retry"""
+        batcher = EmbeddingBatcher(self.create, max_wait=0.001)
+
+        async def run():
+            started = asyncio.Event()
+
+            async def hanging_create(texts, model, dimensions):
+                started.set()
+                await asyncio.Event().wait()
+
+            batcher.create_embeddings = hanging_create
+            caller = asyncio.ensure_future(batcher.embed(["a"], "model"))
+            await started.wait()
+            for task in list(batcher._states[asyncio.get_running_loop()].tasks):
+                task.cancel()
+            with self.assertRaises(RuntimeError):
+                await asyncio.wait_for(caller, 1)
+
+            batcher.create_embeddings = self.create
+            return await batcher.embed(["a"], "model")
+
+        self.assertEqual(asyncio.run(run()), [[1.0]])
+
+    def test_each_event_loop_gets_its_own_state(self):
+        """Sequential asyncio.run calls (as in app.py) reuse one batcher"""
+        batcher = EmbeddingBatcher(self.create, max_wait=0.001)
+
+        self.assertEqual(asyncio.run(batcher.embed(["a"], "model")), [[1.0]])
+        self.assertEqual(asyncio.run(batcher.embed(["a"], "model")), [[1.0]])
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
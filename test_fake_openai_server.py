@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import unittest
+import json
+import httpx
+import numpy as np
+import openai
+from openai import OpenAI
+from fake_openai_server import FakeServerConfig, create_app, fake_json_content
+from tools import TOOL_REGISTRY
+
+
+def make_client(**config):
+    """OpenAI SDK client talking to the fake server in-process"""
+    app = create_app(FakeServerConfig(latency_ms=0, token_latency_ms=0, embedding_latency_ms=0, **config))
+    return OpenAI(
+        api_key="fake",
+        base_url="http://fake/v1",
+        max_retries=0,
+        http_client=httpx.Client(transport=httpx.WSGITransport(app=app))
+    )
+
+
+class TestFakeOpenAIServer(unittest.TestCase):
+    messages = [{"role": "user", "content": "Is Pikachu edible?"}]
+
+    def test_completion_is_deterministic(self):
+        client = make_client()
+
+        first = client.chat.completions.create(model="gpt-4o", messages=self.messages)
+        second = client.chat.completions.create(model="gpt-4o", messages=self.messages)
+
+        self.assertIn("Is Pikachu edible?", first.choices[0].message.content)
+        self.assertEqual(first.choices[0].message.content, second.choices[0].message.content)
+        self.assertGreater(first.usage.total_tokens, 0)
+
+    def test_json_prompts_get_their_template_filled(self):
+        prompt = '''Respond with JSON:
+{
+    "is_relevant": true/false,
+    "confidence": 0.0-1.0,
+    "workflow": "exact_workflow_name" or null,
+    "reasoning": "Brief explanation"
+}'''
+        result = json.loads(fake_json_content(prompt, "because"))
+
+        self.assertEqual(result, {"is_relevant": True, "confidence": 0.5, "workflow": None, "reasoning": "because"})
+
+    def test_tool_call_then_answer(self):
+        client = make_client(tool_call_rate=1.0)
+        tools = [TOOL_REGISTRY["pokemon_health_check"]["definition"]]
+
+        response = client.chat.completions.create(model="gpt-4o", messages=self.messages, tools=tools)
+        call = response.choices[0].message.tool_calls[0]
+        self.assertEqual(call.function.name, "pokemon_health_check")
+        self.assertEqual(json.loads(call.function.arguments), {"pokemon_id": "1"})
+
+        # Once the tool result is in, the fake answers with text
+        messages = self.messages + [
+            {"role": "assistant", "content": None, "tool_calls": [call.model_dump()]},
+            {"role": "tool", "tool_call_id": call.id, "content": "healthy"}
+        ]
+        response = client.chat.completions.create(model="gpt-4o", messages=messages, tools=tools)
+        self.assertIsNone(response.choices[0].message.tool_calls)
+        self.assertTrue(response.choices[0].message.content)
+
+    def test_streamed_content_matches_non_streamed(self):
+        client = make_client()
+        expected = client.chat.completions.create(model="gpt-4o", messages=self.messages).choices[0].message.content
+
+        chunks = list(client.chat.completions.create(
+            model="gpt-4o", messages=self.messages, stream=True, stream_options={"include_usage": True}
+        ))
+
+        self.assertEqual("".join(c.choices[0].delta.content or "" for c in chunks if c.choices), expected)
+        self.assertGreater(len(chunks), 3)
+        self.assertIsNotNone(chunks[-1].usage)
+
+    def test_embeddings_are_deterministic_unit_vectors(self):
+        client = make_client()
+
+        response = client.embeddings.create(model="text-embedding-3-small", input=["pikachu", "eevee"])
+        again = client.embeddings.create(model="text-embedding-3-small", input="pikachu", encoding_format="float")
+        short = client.embeddings.create(model="text-embedding-3-small", input="pikachu", dimensions=256)
+
+        vectors = np.array([item.embedding for item in response.data])
+        self.assertEqual(vectors.shape, (2, 1536))
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+        np.testing.assert_allclose(again.data[0].embedding, vectors[0], rtol=1e-6)
+        self.assertEqual(len(short.data[0].embedding), 256)
+
+    def test_injected_errors(self):
+        with self.assertRaises(openai.RateLimitError):
+            make_client(rate_limit_rate=1.0).embeddings.create(model="text-embedding-3-small", input="x")
+        with self.assertRaises(openai.InternalServerError):
+            make_client(error_rate=1.0).chat.completions.create(model="gpt-4o", messages=self.messages)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,803 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+import numpy as np
+from pathlib import Path
+from knowledge_base_store import (
+    BM25Index, ChunkTable, IVFIndex, KnowledgeBaseStore, NumpyEmbeddingRetriever, QuantizedEmbeddings,
+    chunk_text, hash_file, knowledge_base_settings, main, normalize_rows, parse_namespaces, recall_at_k,
+    reciprocal_rank_fusion, tokenize
+)
+
+
+def fake_embedding(input, model="text-embedding-3-small", **kwargs):
+    """Deterministic bag-of-words embedding so tests never call the API"""
+    def embed(text):
+        vector = [0.0] * 64
+        for word in text.lower().split():
+            digest = hashlib.md5(word.encode()).digest()
+            vector[digest[0] % 64] += 1.0
+        return vector
+
+    if isinstance(input, str):
+        return embed(input)
+    return [embed(text) for text in input]
+
+
+def chunk_records(store):
+    """Decode every chunk of a store's chunk table into a record dict"""
+    return [store.chunks.record(row) for row in range(len(store.chunks))]
+
+
+def make_legacy_cache(store):
+    """Remove a store's chunk table cache and the index_id from its manifest, as before they existed"""
+    for path in (*store._cache_files(store.index_id), store.chunk_sources_file):
+        path.unlink()
+    manifest = json.loads(store.manifest_file.read_text())
+    del manifest['index_id']
+    store.manifest_file.write_text(json.dumps(manifest))
+
+
+class TestChunkText(unittest.TestCase):
+    def test_short_text_is_single_chunk(self):
+        """Text shorter than chunk_size becomes one chunk with exact offsets"""
+        text = "  Slowpoke is slow.\n"
+        chunks = chunk_text(text, chunk_size=100, chunk_overlap=10)
+
+        self.assertEqual(len(chunks), 1)
+        start, end, chunk = chunks[0]
+        self.assertEqual(chunk, "Slowpoke is slow.")
+        self.assertEqual(text[start:end], chunk)
+
+    def test_long_text_is_split_with_overlap(self):
+        """Long text is split into bounded, overlapping chunks that cover it"""
+        text = " ".join(f"word{i}" for i in range(500))
+        chunks = chunk_text(text, chunk_size=200, chunk_overlap=50)
+
+        self.assertGreater(len(chunks), 1)
+        for (start, end, chunk) in chunks:
+            self.assertLessEqual(len(chunk), 200)
+            self.assertEqual(text[start:end], chunk)
+
+        # Consecutive chunks overlap and together cover the whole text
+        for (_, prev_end, _), (next_start, _, _) in zip(chunks, chunks[1:]):
+            self.assertLess(next_start, prev_end)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], len(text))
+
+    def test_chunks_start_on_word_boundaries(self):
+        """Overlapping chunks after the first never start in the middle of a word"""
+        words = ["Slowpoke", "is", "a", "remarkably", "slow", "Pokemon,", "gathering", "of", "Stars"]
+        text = "\n".join(" ".join(words[(i + j) % len(words)] for j in range(12)) for i in range(60))
+        for chunk_size, chunk_overlap in [(100, 30), (200, 50), (333, 77)]:
+            chunks = chunk_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+            for start, _, _ in chunks[1:]:
+                self.assertTrue(text[start - 1].isspace(), f"chunk starts mid-word: {text[start:start + 20]!r}")
+            for (_, prev_end, _), (next_start, _, _) in zip(chunks, chunks[1:]):
+                self.assertLessEqual(next_start, prev_end + 1)
+
+    def test_invalid_overlap(self):
+        """Overlap must be smaller than the chunk size"""
+        with self.assertRaises(ValueError):
+            chunk_text("text", chunk_size=10, chunk_overlap=10)
+
+
+class TestNumpyEmbeddingRetriever(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.normal(size=(500, 32)).astype(np.float32)
+        self.queries = rng.normal(size=(8, 32)).astype(np.float32)
+        self.retriever = NumpyEmbeddingRetriever(self.embeddings)
+
+    def test_search_matches_brute_force(self):
+        """Top-k rows and scores match a full cosine-similarity sort"""
+        indices, scores = self.retriever.search(self.queries[0], top_k=10)
+
+        normalized = self.embeddings / np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+        query = self.queries[0] / np.linalg.norm(self.queries[0])
+        expected = np.argsort(-(normalized @ query))[:10]
+
+        np.testing.assert_array_equal(indices, expected)
+        np.testing.assert_allclose(scores, (normalized @ query)[expected], rtol=1e-5)
+
+    def test_batch_matches_single_queries(self):
+        """Batched search returns the same results as one search per query"""
+        batch_indices, batch_scores = self.retriever.search_batch(self.queries, top_k=5)
+
+        for query, indices, scores in zip(self.queries, batch_indices, batch_scores):
+            single_indices, single_scores = self.retriever.search(query, top_k=5)
+            np.testing.assert_array_equal(indices, single_indices)
+            np.testing.assert_allclose(scores, single_scores, rtol=1e-5)
+
+    def test_coarse_search_reranks_with_full_vectors(self):
+        """Truncated first-pass candidates are reranked to exact full-vector scores"""
+        rng = np.random.default_rng(1)
+        # Correlated dimensions, so the prefix carries most of the signal like Matryoshka embeddings
+        embeddings = normalize_rows(rng.normal(size=(2000, 64)).astype(np.float32) * np.linspace(3, 0.2, 64))
+        queries = embeddings[:20] + rng.normal(scale=0.05, size=(20, 64)).astype(np.float32)
+        coarse = NumpyEmbeddingRetriever(embeddings, normalized=True, coarse_dimensions=16, rescore_candidates=100)
+
+        indices, scores = coarse.search_batch(queries, top_k=5)
+        exact_indices, exact_scores = NumpyEmbeddingRetriever(embeddings, normalized=True).search_batch(queries, top_k=5)
+
+        self.assertEqual(coarse.coarse.shape, (2000, 16))
+        self.assertGreaterEqual(recall_at_k(indices, exact_indices), 0.9)
+        np.testing.assert_allclose(scores[:, 0], exact_scores[:, 0], rtol=1e-5)
+
+    def test_subset_searches_only_its_rows_without_copying(self):
+        """A subset retriever matches a retriever over a copy of its rows and returns positions in rows"""
+        embeddings = normalize_rows(self.embeddings)
+        rows = np.arange(3, 500, 4)
+        quantized = QuantizedEmbeddings.quantize(embeddings, "int8")
+        for kwargs in ({}, {"quantized": quantized, "rescore_candidates": 40}, {"coarse_dimensions": 16}):
+            full = NumpyEmbeddingRetriever(embeddings, normalized=True, **kwargs)
+            subset = full.subset(rows)
+            expected = NumpyEmbeddingRetriever(
+                embeddings[rows], normalized=True,
+                quantized=QuantizedEmbeddings.quantize(embeddings[rows], "int8") if kwargs.get("quantized") else None,
+                rescore_candidates=kwargs.get("rescore_candidates", 0),
+                coarse_dimensions=kwargs.get("coarse_dimensions", 0)
+            )
+
+            indices, scores = subset.search_batch(self.queries, top_k=5)
+            expected_indices, expected_scores = expected.search_batch(self.queries, top_k=5)
+
+            self.assertEqual(len(subset), len(rows))
+            self.assertIs(subset.embeddings, full.embeddings)
+            np.testing.assert_array_equal(indices, expected_indices)
+            np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+    def test_top_k_larger_than_index(self):
+        """Asking for more rows than exist returns every row"""
+        retriever = NumpyEmbeddingRetriever(self.embeddings[:3])
+        indices, _ = retriever.search(self.queries[0], top_k=10)
+
+        self.assertEqual(sorted(indices.tolist()), [0, 1, 2])
+
+
+class TestQuantizedEmbeddings(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.embeddings = normalize_rows(rng.normal(size=(1000, 64)))
+        self.queries = rng.normal(size=(10, 64)).astype(np.float32)
+        self.exact = NumpyEmbeddingRetriever(self.embeddings, normalized=True)
+
+    def test_quantized_scores_approximate_exact_scores(self):
+        """float16 and int8 dot products stay close to float32"""
+        queries = normalize_rows(self.queries)
+        exact_scores = queries @ self.embeddings.T
+        for dtype, tolerance in (("float16", 1e-2), ("int8", 5e-2)):
+            quantized = QuantizedEmbeddings.quantize(self.embeddings, dtype, block_size=128)
+            self.assertEqual(quantized.dtype, dtype)
+            np.testing.assert_allclose(quantized.dot(queries), exact_scores, atol=tolerance)
+
+    def test_rescoring_restores_exact_ranking(self):
+        """int8 candidate search with exact rescoring matches exact top-k and scores"""
+        quantized = QuantizedEmbeddings.quantize(self.embeddings, "int8")
+        retriever = NumpyEmbeddingRetriever(
+            self.embeddings, normalized=True, quantized=quantized, rescore_candidates=50
+        )
+
+        indices, scores = retriever.search_batch(self.queries, top_k=5)
+        exact_indices, exact_scores = self.exact.search_batch(self.queries, top_k=5)
+
+        np.testing.assert_array_equal(indices, exact_indices)
+        np.testing.assert_allclose(scores, exact_scores, rtol=1e-5)
+
+
+class TestIVFIndex(unittest.TestCase):
+    def setUp(self):
+        # Clustered data, as real embeddings are
+        rng = np.random.default_rng(1)
+        centers = rng.normal(size=(20, 32))
+        self.embeddings = normalize_rows(
+            centers[rng.integers(0, 20, size=2000)] + 0.3 * rng.normal(size=(2000, 32))
+        )
+        self.queries = rng.normal(size=(20, 32)).astype(np.float32)
+        self.exact = NumpyEmbeddingRetriever(self.embeddings, normalized=True)
+
+    def test_probing_every_cluster_is_exact(self):
+        """With nprobe == nlist the IVF index returns the exact top-k"""
+        ivf = IVFIndex.build(self.embeddings, nlist=16, nprobe=16)
+
+        approximate, _ = ivf.search_batch(self.queries, top_k=10)
+        exact, _ = self.exact.search_batch(self.queries, top_k=10)
+
+        self.assertEqual(recall_at_k(approximate, exact), 1.0)
+
+    def test_partial_probe_has_high_recall(self):
+        """Scanning a fraction of the clusters still finds most true neighbours"""
+        ivf = IVFIndex.build(self.embeddings, nlist=32, nprobe=8)
+
+        approximate, _ = ivf.search_batch(self.queries, top_k=10)
+        exact, _ = self.exact.search_batch(self.queries, top_k=10)
+
+        self.assertGreater(recall_at_k(approximate, exact), 0.8)
+
+    def test_save_and_load(self):
+        """A saved index loads back only for the embeddings it was built from"""
+        ivf = IVFIndex.build(self.embeddings, nlist=16, nprobe=4)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "ivf_index.npz"
+            ivf.save(path, index_id="abc")
+
+            loaded = IVFIndex.load(path, self.embeddings, index_id="abc", nprobe=4)
+            self.assertIsNotNone(loaded)
+            np.testing.assert_array_equal(
+                loaded.search_batch(self.queries, top_k=5)[0],
+                ivf.search_batch(self.queries, top_k=5)[0]
+            )
+            self.assertIsNone(IVFIndex.load(path, self.embeddings, index_id="other"))
+
+    def test_index_over_rows(self):
+        """An index over some rows searches only them, returns positions in rows and reloads only for them"""
+        rows = np.arange(0, 2000, 3)
+        ivf = IVFIndex.build(self.embeddings, nlist=8, nprobe=8, rows=rows)
+
+        approximate, _ = ivf.search_batch(self.queries, top_k=10)
+        exact, _ = NumpyEmbeddingRetriever(self.embeddings[rows], normalized=True).search_batch(self.queries, top_k=10)
+
+        self.assertEqual(len(ivf), len(rows))
+        self.assertEqual(recall_at_k(approximate, exact), 1.0)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "ivf_index.npz"
+            ivf.save(path, index_id="abc")
+
+            self.assertIsNotNone(IVFIndex.load(path, self.embeddings, index_id="abc", rows=rows))
+            self.assertIsNone(IVFIndex.load(path, self.embeddings, index_id="abc", rows=rows[1:]))
+            self.assertIsNone(IVFIndex.load(path, self.embeddings, index_id="abc"))
+
+
+class TestBM25Index(unittest.TestCase):
+    def setUp(self):
+        self.texts = [
+            "Pikachu is an electric mouse.",
+            "Xalrons live in the deep caves of the Zebrarbez mountains.",
+            "The mouse ate cheese, the mouse slept.",
+            "Slowpoke tail soup recipe."
+        ]
+        self.index = BM25Index.build(self.texts)
+
+    def test_rare_term_ranks_its_chunk_first(self):
+        """A term occurring in a single chunk retrieves exactly that chunk"""
+        rows, scores = self.index.search("Tell me about xalrons", top_k=3)
+
+        self.assertEqual(rows.tolist(), [1])
+        self.assertGreater(scores[0], 0)
+
+    def test_term_frequency_raises_score(self):
+        """The chunk repeating a query term outranks one mentioning it once"""
+        rows, _ = self.index.search("mouse", top_k=5)
+
+        self.assertEqual(rows.tolist(), [2, 0])
+
+    def test_save_and_load(self):
+        """Postings reload only for the cache they were built from"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "bm25_index.npz"
+            self.index.save(path, index_id="abc")
+
+            loaded = BM25Index.load(path, index_id="abc", num_rows=len(self.texts))
+            np.testing.assert_array_equal(
+                loaded.search("mouse cheese")[0], self.index.search("mouse cheese")[0]
+            )
+            self.assertIsNone(BM25Index.load(path, index_id="other", num_rows=len(self.texts)))
+
+    def test_vocabulary_is_a_compact_byte_blob(self):
+        """One long token does not widen the stored vocabulary, and non-ASCII terms still match after reload"""
+        texts = self.texts + ["Café au lait for Pokémon " + "q" * 2000]
+        index = BM25Index.build(texts)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "bm25_index.npz"
+            index.save(path, index_id="abc")
+            loaded = BM25Index.load(path, index_id="abc", num_rows=len(texts))
+
+        terms = {term for text in texts for term in tokenize(text)}
+        self.assertEqual(loaded.vocabulary.dtype, np.uint8)
+        self.assertEqual(loaded.vocabulary.size, sum(len(term.encode("utf-8")) for term in terms))
+        self.assertEqual(loaded.search("pokémon café")[0].tolist(), [4])
+        for term in terms:
+            self.assertEqual(len(loaded._postings(term)[0]), len(index._postings(term)[0]))
+        self.assertEqual(len(loaded._postings("pikachuu")[0]), 0)
+
+    def test_reciprocal_rank_fusion(self):
+        """Rows ranked well by both rankings come first"""
+        rows, _ = reciprocal_rank_fusion([np.array([3, 1, 2]), np.array([1, 4, 3])])
+
+        self.assertEqual(rows.tolist()[:2], [1, 3])
+
+
+class TestKnowledgeBaseStore(unittest.TestCase):
+    def setUp(self):
+        """Create a small knowledge base in a temporary directory"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        root = Path(self.temp_dir.name)
+        self.kb_dir = root / "knowledge_base"
+        self.cache_dir = root / ".cache"
+        self.kb_dir.mkdir()
+
+        (self.kb_dir / "slowpoke_recipe.txt").write_text(
+            "Slowpoke tail soup. Simmer the slowpoke tail for hours.", encoding="utf-8"
+        )
+        (self.kb_dir / "large_article.txt").write_text(
+            "\n\n".join(f"Paragraph {i} about pikachu electric mouse habits." for i in range(100)),
+            encoding="utf-8"
+        )
+
+        patcher = patch("knowledge_base_store.get_embedding", side_effect=fake_embedding)
+        self.mock_get_embedding = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = patch("knowledge_base_store.get_embeddings_batched", side_effect=fake_embedding)
+        self.mock_get_embeddings_batched = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def create_store(self, **kwargs):
+        return KnowledgeBaseStore(
+            knowledge_base_dir=str(self.kb_dir),
+            cache_dir=str(self.cache_dir),
+            **kwargs
+        )
+
+    def test_large_files_are_chunked(self):
+        """Snippets are bounded chunks with offsets into the source file"""
+        store = self.create_store(chunk_size=300, chunk_overlap=50)
+        snippets = store.retrieve_snippets("pikachu electric mouse", top_k=3)
+
+        self.assertEqual(len(snippets), 3)
+        source = (self.kb_dir / "large_article.txt").read_text(encoding="utf-8")
+        for snippet in snippets:
+            self.assertEqual(snippet["file_name"], "large_article.txt")
+            self.assertLessEqual(len(snippet["content"]), 300)
+            self.assertEqual(
+                source[snippet["start_offset"]:snippet["end_offset"]],
+                snippet["content"]
+            )
+
+    def test_unreadable_file_does_not_rewrite_the_cache(self):
+        """A file that keeps failing to load leaves the cache and its index_id untouched"""
+        (self.kb_dir / "broken.txt").write_bytes(b"\xff\xfe invalid utf-8 \x80")
+        first = self.create_store()
+
+        second = self.create_store()
+
+        self.assertTrue(first.index_id)
+        self.assertEqual(second.index_id, first.index_id)
+        self.assertEqual(list(self.cache_dir.glob("*.tmp*")), [])
+
+    def test_cache_is_reused_and_invalidated_by_chunk_settings(self):
+        """A second store loads from cache; changing chunk settings re-embeds"""
+        self.create_store(chunk_size=300, chunk_overlap=50)
+        calls_after_build = self.mock_get_embeddings_batched.call_count
+
+        self.create_store(chunk_size=300, chunk_overlap=50)
+        self.assertEqual(self.mock_get_embeddings_batched.call_count, calls_after_build)
+
+        self.create_store(chunk_size=500, chunk_overlap=50)
+        self.assertGreater(self.mock_get_embeddings_batched.call_count, calls_after_build)
+
+    def test_only_changed_files_are_re_embedded(self):
+        """Editing one file embeds only its chunks; deleting a file drops its chunks"""
+        self.create_store(chunk_size=300, chunk_overlap=50)
+        self.mock_get_embeddings_batched.reset_mock()
+
+        (self.kb_dir / "slowpoke_recipe.txt").write_text(
+            "Slowpoke tail stew. Braise the slowpoke tail gently.", encoding="utf-8"
+        )
+        (self.kb_dir / "large_article.txt").unlink()
+        store = self.create_store(chunk_size=300, chunk_overlap=50)
+
+        self.mock_get_embeddings_batched.assert_called_once()
+        self.assertEqual(
+            self.mock_get_embeddings_batched.call_args[0][0],
+            ["Slowpoke tail stew. Braise the slowpoke tail gently."]
+        )
+
+        snippets = store.retrieve_snippets("slowpoke tail", top_k=10)
+        self.assertEqual([snippet["file_name"] for snippet in snippets], ["slowpoke_recipe.txt"])
+        self.assertIn("stew", snippets[0]["content"])
+
+    def test_cache_is_memory_mapped(self):
+        """A cached index is loaded as a memory-mapped float32 matrix"""
+        built = self.create_store(chunk_size=300, chunk_overlap=50)
+        loaded = self.create_store(chunk_size=300, chunk_overlap=50)
+
+        self.assertIsInstance(loaded.embeddings, np.memmap)
+        self.assertEqual(loaded.embeddings.dtype, np.float32)
+        self.assertEqual(loaded.embeddings.shape[0], len(loaded.chunks))
+        self.assertEqual(chunk_records(loaded), chunk_records(built))
+
+    def test_chunk_table_is_memory_mapped(self):
+        """Chunk metadata and text are loaded memory-mapped, without decoding any chunk"""
+        built = self.create_store(chunk_size=300, chunk_overlap=50)
+        self.assertFalse(built.records_file.exists())
+
+        with patch.object(ChunkTable, 'content', autospec=True, side_effect=ChunkTable.content) as mock_content:
+            loaded = self.create_store(chunk_size=300, chunk_overlap=50)
+            mock_content.assert_not_called()
+
+            snippets = loaded.retrieve_snippets("slowpoke tail", top_k=2, mode="vector")
+            self.assertEqual(mock_content.call_count, len(snippets))
+
+        self.assertIsInstance(loaded.chunks.rows, np.memmap)
+        self.assertIsInstance(loaded.chunks.text, np.memmap)
+        self.assertEqual(loaded.chunks.text.dtype, np.uint8)
+
+    def test_json_cache_is_migrated(self):
+        """A legacy documents.json cache is rewritten as a chunk table without re-embedding"""
+        built = self.create_store(chunk_size=300, chunk_overlap=50)
+        records = chunk_records(built)
+        with open(built.records_file, 'w', encoding='utf-8') as f:
+            json.dump({'model': built.model_name, 'index_id': built.index_id, 'records': records}, f)
+        np.save(built.embeddings_file, np.asarray(built.embeddings))
+        make_legacy_cache(built)
+        self.mock_get_embeddings_batched.reset_mock()
+
+        migrated = self.create_store(chunk_size=300, chunk_overlap=50)
+
+        self.mock_get_embeddings_batched.assert_not_called()
+        self.assertFalse(migrated.records_file.exists())
+        self.assertFalse(migrated.embeddings_file.exists())
+        self.assertTrue(migrated.chunk_sources_file.exists())
+        self.assertEqual(chunk_records(migrated), records)
+
+    def test_pickle_cache_is_migrated(self):
+        """A legacy pickle cache is read and rewritten without re-embedding"""
+        built = self.create_store(chunk_size=300, chunk_overlap=50)
+        documents = [
+            {'content': record['content'], 'meta': record['meta'], 'embedding': embedding.tolist()}
+            for record, embedding in zip(chunk_records(built), built.embeddings)
+        ]
+        with open(built.document_store_file, 'wb') as f:
+            pickle.dump({'documents': documents, 'model': built.model_name}, f)
+        make_legacy_cache(built)
+        self.mock_get_embeddings_batched.reset_mock()
+
+        migrated = self.create_store(chunk_size=300, chunk_overlap=50)
+
+        self.mock_get_embeddings_batched.assert_not_called()
+        self.assertTrue(migrated.chunk_sources_file.exists())
+        self.assertEqual(chunk_records(migrated), chunk_records(built))
+
+    def test_failed_cache_save_keeps_the_previous_build(self):
+        """A save that fails before switching builds leaves the old embeddings, chunks and manifest in place"""
+        built = self.create_store(chunk_size=300, chunk_overlap=50)
+        (self.kb_dir / "psyduck_recipe.txt").write_text("Psyduck headache broth.", encoding="utf-8")
+
+        replace = os.replace
+        def failing_replace(src, dst):
+            if Path(dst) == built.chunk_sources_file:
+                raise OSError("disk full")
+            return replace(src, dst)
+
+        with patch('knowledge_base_store.os.replace', side_effect=failing_replace):
+            unsaved = self.create_store(chunk_size=300, chunk_overlap=50)
+        self.assertEqual(unsaved.index_id, '')
+        self.assertEqual(len(unsaved.retrieve_snippets("psyduck headache broth", top_k=1)), 1)
+
+        prebuilt = self.create_store(chunk_size=300, chunk_overlap=50, auto_build=False)
+        self.assertEqual(prebuilt.index_id, built.index_id)
+        self.assertEqual(chunk_records(prebuilt), chunk_records(built))
+
+        # The next start embeds the new file again and removes the orphaned files
+        rebuilt = self.create_store(chunk_size=300, chunk_overlap=50)
+        file_names = [record["meta"]["file_name"] for record in chunk_records(rebuilt)]
+        self.assertEqual(file_names.count("psyduck_recipe.txt"), 1)
+        self.assertEqual(rebuilt.embeddings.shape[0], len(rebuilt.chunks))
+        self.assertEqual(len(list(self.cache_dir.rglob("embeddings.*.npy"))), 1)
+
+    def test_manifest_of_another_build_is_a_cache_miss(self):
+        """A manifest written for a different index_id than the cache is not trusted"""
+        built = self.create_store(chunk_size=300, chunk_overlap=50)
+        manifest = json.loads(built.manifest_file.read_text())
+        manifest['index_id'] = 'another-build'
+        built.manifest_file.write_text(json.dumps(manifest))
+        self.mock_get_embeddings_batched.reset_mock()
+
+        rebuilt = self.create_store(chunk_size=300, chunk_overlap=50)
+
+        self.mock_get_embeddings_batched.assert_called_once()
+        self.assertNotEqual(rebuilt.index_id, built.index_id)
+        self.assertEqual(chunk_records(rebuilt), chunk_records(built))
+
+        built.manifest_file.write_text(json.dumps(manifest))
+        with self.assertRaises(RuntimeError):
+            self.create_store(chunk_size=300, chunk_overlap=50, auto_build=False)
+
+    def test_ivf_index_is_persisted_next_to_cache(self):
+        """An IVF-backed store saves its index and reloads it on the next start"""
+        store = self.create_store(chunk_size=300, chunk_overlap=50, ann_index="ivf", ann_min_rows=0)
+
+        self.assertIsInstance(store.retriever, IVFIndex)
+        self.assertTrue(store.ivf_file.exists())
+
+        reloaded = self.create_store(chunk_size=300, chunk_overlap=50, ann_index="ivf", ann_min_rows=0)
+        np.testing.assert_array_equal(reloaded.retriever.centroids, store.retriever.centroids)
+
+        snippets = reloaded.retrieve_snippets("slowpoke tail soup", top_k=1, exact=True)
+        self.assertEqual(snippets[0]["file_name"], "slowpoke_recipe.txt")
+
+    def test_refresh_picks_up_new_files(self):
+        """refresh() indexes files added after startup"""
+        store = self.create_store(chunk_size=300, chunk_overlap=50)
+        (self.kb_dir / "psyduck_recipe.txt").write_text("Psyduck headache broth.", encoding="utf-8")
+
+        store.refresh()
+
+        snippets = store.retrieve_snippets("psyduck headache broth", top_k=1)
+        self.assertEqual(snippets[0]["file_name"], "psyduck_recipe.txt")
+
+    def test_watcher_swaps_index_in_background(self):
+        """The watcher publishes a new index while the old one keeps serving"""
+        store = self.create_store(chunk_size=300, chunk_overlap=50)
+        old_retriever = store.retriever
+        store.start_watcher(interval=0.05)
+        self.addCleanup(store.stop_watcher)
+
+        (self.kb_dir / "psyduck_recipe.txt").write_text("Psyduck headache broth.", encoding="utf-8")
+        deadline = time.time() + 5
+        while store.retriever is old_retriever and time.time() < deadline:
+            # Reads during the rebuild still see a complete index
+            self.assertTrue(store.retrieve_snippets("slowpoke tail", top_k=1))
+            time.sleep(0.01)
+
+        self.assertIsNot(store.retriever, old_retriever)
+        file_names = {snippet["file_name"] for snippet in store.retrieve_snippets("psyduck", top_k=50)}
+        self.assertIn("psyduck_recipe.txt", file_names)
+
+    def test_quantized_store_persists_codes(self):
+        """A store with int8 embeddings saves the codes and retrieves as before"""
+        store = self.create_store(chunk_size=300, chunk_overlap=50, embedding_dtype="int8", rescore_candidates=10)
+
+        self.assertTrue(store.quantized_file.exists())
+        self.assertEqual(store.retriever.quantized.dtype, "int8")
+        snippets = store.retrieve_snippets("slowpoke tail soup", top_k=1)
+        self.assertEqual(snippets[0]["file_name"], "slowpoke_recipe.txt")
+
+    def test_process_pool_ingestion_matches_in_process(self):
+        """Reading and chunking in worker processes yields the same records"""
+        in_process = self.create_store(chunk_size=300, chunk_overlap=50)
+        pooled = KnowledgeBaseStore(
+            knowledge_base_dir=str(self.kb_dir),
+            cache_dir=str(self.cache_dir / "pooled"),
+            chunk_size=300,
+            chunk_overlap=50,
+            ingest_workers=2
+        )
+
+        self.assertEqual(
+            sorted(record["meta"]["start_offset"] for record in chunk_records(pooled)),
+            sorted(record["meta"]["start_offset"] for record in chunk_records(in_process))
+        )
+        self.assertEqual(len(pooled.chunks), len(in_process.chunks))
+
+    def test_prebuilt_index_is_served_without_embedding(self):
+        """With auto_build=False the store loads the CLI-built index and never embeds"""
+        with self.assertRaises(RuntimeError):
+            self.create_store(auto_build=False)
+
+        main([
+            "build",
+            "--knowledge-base-dir", str(self.kb_dir),
+            "--cache-dir", str(self.cache_dir),
+            "--workers", "2"
+        ])
+        (self.kb_dir / "psyduck_recipe.txt").write_text("Psyduck headache broth.", encoding="utf-8")
+        self.mock_get_embeddings_batched.reset_mock()
+
+        store = self.create_store(auto_build=False)
+
+        self.mock_get_embeddings_batched.assert_not_called()
+        file_names = {record["meta"]["file_name"] for record in chunk_records(store)}
+        self.assertEqual(file_names, {"slowpoke_recipe.txt", "large_article.txt"})
+
+    def test_build_cli_and_server_share_settings(self):
+        """The build CLI defaults to the KB_* settings, so the server can load what it built"""
+        environment = {
+            "KB_DIR": str(self.kb_dir),
+            "KB_CACHE_DIR": str(self.cache_dir),
+            "KB_EMBEDDING_DIMENSIONS": "64",
+            "KB_NAMESPACES": "recipes=*_recipe.txt,articles=*_article.txt",
+            "KB_RETRIEVAL_MODE": "vector"
+        }
+        with patch.dict(os.environ, environment), \
+                patch("knowledge_base_store.KnowledgeBaseStore", wraps=KnowledgeBaseStore) as mock_store:
+            main(["build", "--workers", "1"])
+            built = mock_store.call_args.kwargs
+
+            self.assertEqual(built["embedding_dimensions"], 64)
+            self.assertEqual(built["namespaces"], {"recipes": ["*_recipe.txt"], "articles": ["*_article.txt"]})
+            self.assertEqual(built["retrieval_mode"], "vector")
+
+            self.mock_get_embeddings_batched.reset_mock()
+            store = KnowledgeBaseStore(**{**knowledge_base_settings(), "auto_build": False})
+            self.mock_get_embeddings_batched.assert_not_called()
+            self.assertEqual(store.get_namespace("large_article.txt"), "articles")
+
+            # Options on the command line override the shared settings
+            main([
+                "build", "--workers", "1",
+                "--namespace", "recipes=*_recipe.txt", "--namespace", "recipes=*_stew.txt",
+                "--retrieval-mode", "hybrid", "--coarse-search", "--coarse-dimensions", "16"
+            ])
+            built = mock_store.call_args.kwargs
+            self.assertEqual(built["namespaces"], {"recipes": ["*_recipe.txt", "*_stew.txt"]})
+            self.assertEqual(built["retrieval_mode"], "hybrid")
+            self.assertTrue(built["coarse_search"])
+            self.assertEqual(built["coarse_dimensions"], 16)
+
+            with self.assertRaises(SystemExit):
+                main(["build", "--namespace", "recipes"])
+
+    def test_parse_namespaces(self):
+        """NAME=GLOB entries are grouped by name; blank entries are skipped"""
+        self.assertEqual(
+            parse_namespaces(["recipes=*_recipe.txt", "", " recipes = *_stew.txt ", "general=*"]),
+            {"recipes": ["*_recipe.txt", "*_stew.txt"], "general": ["*"]}
+        )
+        with self.assertRaises(ValueError):
+            parse_namespaces(["=*.txt"])
+
+
+    def test_exact_term_query_skips_embedding(self):
+        """A query naming a rare term is answered lexically without an embedding call"""
+        (self.kb_dir / "xalrons.txt").write_text(
+            "Xalrons are a made-up species of cave dwelling birds.", encoding="utf-8"
+        )
+        store = self.create_store(chunk_size=300, chunk_overlap=50)
+        self.mock_get_embedding.reset_mock()
+
+        snippets = store.retrieve_snippets("xalrons", top_k=3)
+
+        self.mock_get_embedding.assert_not_called()
+        self.assertEqual(snippets[0]["file_name"], "xalrons.txt")
+        self.assertEqual(snippets[0]["retrieval"], "lexical")
+        self.assertIsNone(snippets[0]["score"])
+        self.assertEqual(store.lexical_fast_path_hits, 1)
+
+    def test_hybrid_query_fuses_vector_and_lexical_results(self):
+        """Queries without a confident lexical match are embedded and fused"""
+        store = self.create_store(chunk_size=300, chunk_overlap=50)
+        self.mock_get_embedding.reset_mock()
+
+        snippets = store.retrieve_snippets("how to cook a tail", top_k=3)
+
+        self.mock_get_embedding.assert_called_once()
+        self.assertEqual(snippets[0]["file_name"], "slowpoke_recipe.txt")
+        self.assertEqual(snippets[0]["retrieval"], "hybrid")
+
+        vector_snippets = store.retrieve_snippets("slowpoke", top_k=3, mode="vector")
+        self.assertEqual(vector_snippets[0]["retrieval"], "vector")
+        self.assertIsNone(vector_snippets[0]["bm25_score"])
+
+
+    def test_namespace_filter_searches_only_its_partition(self):
+        """A namespace filter returns only chunks of files tagged with that namespace"""
+        store = self.create_store(
+            chunk_size=300, chunk_overlap=50, namespaces={"recipes": ["*_recipe.txt"]}
+        )
+
+        recipes = store.retrieve_snippets("pikachu electric mouse", top_k=5, namespace="recipes")
+        self.assertEqual([snippet["file_name"] for snippet in recipes], ["slowpoke_recipe.txt"])
+        self.assertEqual(recipes[0]["namespace"], "recipes")
+
+        general = store.retrieve_snippets("slowpoke tail soup", top_k=50, namespace="general", mode="vector")
+        self.assertTrue(general)
+        self.assertEqual({snippet["file_name"] for snippet in general}, {"large_article.txt"})
+
+        both = store.retrieve_snippets("slowpoke tail", top_k=50, namespace=["recipes", "general"], mode="vector")
+        self.assertEqual(len(both), len(store.chunks))
+        self.assertEqual(store.retrieve_snippets("slowpoke", namespace="missing"), [])
+
+    def test_partitions_share_the_cached_matrices_and_persist_their_indexes(self):
+        """Namespace sub-indexes read the memory-mapped embeddings and codes, and reload their BM25 postings"""
+        options = dict(
+            chunk_size=300, chunk_overlap=50, namespaces={"recipes": ["*_recipe.txt"]},
+            embedding_dtype="int8", rescore_candidates=10
+        )
+        store = self.create_store(**options)
+        partition = store._snapshot.partitions[("general",)]
+
+        self.assertIsInstance(store.embeddings, np.memmap)
+        self.assertIs(partition.retriever.embeddings, store.embeddings)
+        self.assertIs(partition.retriever.quantized, store._snapshot.quantized)
+        self.assertTrue((store.cache_dir / "bm25_index.general.npz").exists())
+        self.assertTrue((store.cache_dir / "bm25_index.recipes.npz").exists())
+
+        with patch("knowledge_base_store.BM25Index.build", side_effect=AssertionError("rebuilt")):
+            reloaded = self.create_store(**options)
+
+        general = reloaded.retrieve_snippets("slowpoke tail soup", top_k=50, namespace="general")
+        self.assertEqual({snippet["file_name"] for snippet in general}, {"large_article.txt"})
+
+
+    def test_async_retrieval_matches_sync_and_overlaps(self):
+        """Async retrieval returns the sync results, and concurrent calls share the loop"""
+        store = self.create_store(chunk_size=300, chunk_overlap=50)
+
+        async def slow_embedding(input, model="text-embedding-3-small", **kwargs):
+            await asyncio.sleep(0.2)
+            return fake_embedding(input, model)
+
+        async def retrieve_concurrently():
+            start_time = time.perf_counter()
+            results = await asyncio.gather(
+                store.retrieve_snippets_async("how to cook a tail", top_k=3),
+                store.retrieve_snippets_async("what do mice eat", top_k=3, mode="vector")
+            )
+            return results, time.perf_counter() - start_time
+
+        with patch("knowledge_base_store.get_embedding_async", side_effect=slow_embedding):
+            (hybrid, vector), elapsed = asyncio.run(retrieve_concurrently())
+
+        self.assertEqual(hybrid, store.retrieve_snippets("how to cook a tail", top_k=3))
+        self.assertEqual(vector, store.retrieve_snippets("what do mice eat", top_k=3, mode="vector"))
+        self.assertLess(elapsed, 0.35)
+
+
+    def test_unchanged_files_are_not_reread_on_startup(self):
+        """Files whose size and mtime match the manifest are not hashed again"""
+        self.create_store(chunk_size=300, chunk_overlap=50)
+
+        with patch("knowledge_base_store.hash_file", wraps=hash_file) as mock_hash_file:
+            self.create_store(chunk_size=300, chunk_overlap=50)
+            mock_hash_file.assert_not_called()
+
+            # Touching a file without changing it costs one hash and no embedding
+            path = self.kb_dir / "slowpoke_recipe.txt"
+            path.write_text(path.read_text(encoding="utf-8"), encoding="utf-8")
+            self.mock_get_embeddings_batched.reset_mock()
+            self.create_store(chunk_size=300, chunk_overlap=50)
+            self.assertEqual([call.args[0] for call in mock_hash_file.call_args_list], [str(path)])
+            self.mock_get_embeddings_batched.assert_not_called()
+
+            mock_hash_file.reset_mock()
+            self.create_store(chunk_size=300, chunk_overlap=50)
+            mock_hash_file.assert_not_called()
+
+    def test_racily_clean_files_are_hashed_once(self):
+        """A file modified in the same tick as the manifest is hashed, and the rewritten manifest trusts it"""
+        store = self.create_store(chunk_size=300, chunk_overlap=50)
+        paths = sorted(self.kb_dir.iterdir())
+        tick_ns = store.manifest_file.stat().st_mtime_ns - 10**9
+        for path in paths:
+            os.utime(path, ns=(tick_ns, tick_ns))
+        self.create_store(chunk_size=300, chunk_overlap=50)
+        os.utime(store.manifest_file, ns=(tick_ns, tick_ns))
+
+        with patch("knowledge_base_store.hash_file", wraps=hash_file) as mock_hash_file:
+            self.create_store(chunk_size=300, chunk_overlap=50)
+            self.assertEqual([call.args[0] for call in mock_hash_file.call_args_list], [str(path) for path in paths])
+
+            mock_hash_file.reset_mock()
+            self.create_store(chunk_size=300, chunk_overlap=50)
+            mock_hash_file.assert_not_called()
+        self.mock_get_embeddings_batched.assert_called_once()
+
+
+    def test_coarse_search_store_reports_recall(self):
+        """A coarse-search store defaults to the model's truncated size and reports recall"""
+        store = self.create_store(chunk_size=300, chunk_overlap=50, coarse_search=True, coarse_dimensions=32)
+
+        self.assertEqual(store.retriever.coarse.shape[1], 32)
+        report = store.measure_recall(["pikachu habits", "slowpoke tail"], top_k=3)
+        self.assertGreaterEqual(report["recall"], 0.5)
+        self.assertIn("approximate_ms", report)
+
+        with self.assertRaises(ValueError):
+            self.create_store(model_name="text-embedding-ada-002", coarse_search=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
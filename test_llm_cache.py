@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+import tempfile
+from pathlib import Path
+import llm_client
+from llm_cache import CompletionCache, EmbeddingCache, parse_ttls
+from test_llm_client import configure_for_tests
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def test_lookup_ignores_case_and_whitespace(self):
+        """Texts differing only in case and spacing share an entry"""
+        cache = EmbeddingCache(max_entries=10)
+        cache.put("model", "is slowpoke edible", [0.5, 0.25])
+
+        self.assertEqual(cache.get("model", "  Is  Slowpoke edible\n"), [0.5, 0.25])
+        self.assertIsNone(cache.get("other-model", "is slowpoke edible"))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """The in-memory tier never holds more than max_entries"""
+        cache = EmbeddingCache(max_entries=2)
+        cache.put("model", "a", [1.0])
+        cache.put("model", "b", [2.0])
+        cache.get("model", "a")
+        cache.put("model", "c", [3.0])
+
+        self.assertIsNone(cache.get("model", "b"))
+        self.assertEqual(cache.get("model", "a"), [1.0])
+        self.assertEqual(cache.get("model", "c"), [3.0])
+
+    def test_disk_tier_survives_restart(self):
+        """Entries written to the SQLite tier are visible to a new cache instance"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = str(Path(temp_dir) / "embeddings.sqlite")
+            EmbeddingCache(path=path).put("model", "psyduck", [0.125, 0.5])
+
+            reopened = EmbeddingCache(path=path)
+            self.assertEqual(reopened.get("model", "psyduck"), [0.125, 0.5])
+
+    def test_disk_tier_is_bounded(self):
+        """The SQLite tier evicts old rows once it exceeds max_disk_entries"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = EmbeddingCache(path=str(Path(temp_dir) / "embeddings.sqlite"), max_disk_entries=10)
+            for i in range(25):
+                cache.put("model", f"text {i}", [float(i)])
+
+            self.assertLessEqual(cache.stats()['disk_entries'], 10)
+
+    def test_overwriting_a_key_does_not_evict_live_entries(self):
+        """Replacing an existing row leaves the disk entry count, and the other rows, unchanged"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = str(Path(temp_dir) / "embeddings.sqlite")
+            cache = EmbeddingCache(max_entries=1, path=path, max_disk_entries=3)
+            cache.put_many("model", {"a": [1.0], "b": [2.0], "c": [3.0]})
+            for i in range(10):
+                cache.put("model", "a", [float(i)])
+
+            self.assertEqual(cache.stats()['disk_entries'], 3)
+            reopened = EmbeddingCache(path=path)
+            self.assertEqual(reopened.get("model", "a"), [9.0])
+            self.assertEqual(reopened.get("model", "b"), [2.0])
+            self.assertEqual(reopened.get("model", "c"), [3.0])
+
+
+class TestGetEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        configure_for_tests(self)
+        llm_client.embedding_cache.clear()
+        self.addCleanup(llm_client.embedding_cache.clear)
+
+    @patch('llm_client._create_embeddings')
+    def test_only_uncached_texts_reach_the_api(self, mock_create_embeddings):
+        """Cached and duplicate texts are not sent to the embedding API"""
+        mock_create_embeddings.side_effect = lambda texts, model, dimensions=None: [[float(len(t))] for t in texts]
+
+        self.assertEqual(llm_client.get_embedding("slowpoke"), [8.0])
+        result = llm_client.get_embedding(["Slowpoke", "magikarp", "magikarp"])
+
+        self.assertEqual(result, [[8.0], [8.0], [8.0]])
+        self.assertEqual(mock_create_embeddings.call_count, 2)
+        self.assertEqual(mock_create_embeddings.call_args[0][0], ["magikarp"])
+
+
+    @patch('llm_client._create_embeddings_async')
+    def test_async_embedding_shares_the_cache(self, mock_create_embeddings_async):
+        """The async path serves and fills the same cache as the sync path"""
+        async def fake_create(texts, model, dimensions=None):
+            return [[float(len(t))] for t in texts]
+        mock_create_embeddings_async.side_effect = fake_create
+
+        with patch('llm_client._create_embeddings', side_effect=lambda texts, model, dimensions=None: [[1.0] for _ in texts]):
+            llm_client.get_embedding("slowpoke")
+        result = asyncio.run(llm_client.get_embedding_async(["Slowpoke", "psyduck"]))
+
+        self.assertEqual(result, [[1.0], [7.0]])
+        self.assertEqual(mock_create_embeddings_async.call_args[0][0], ["psyduck"])
+
+
+class TestCompletionCache(unittest.TestCase):
+    def test_key_is_stable_across_dict_order(self):
+        """Equivalent requests hash to the same key"""
+        first = CompletionCache.make_key("model", [{"role": "user", "content": "hi"}], 0.1)
+        second = CompletionCache.make_key("model", [{"content": "hi", "role": "user"}], 0.1)
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, CompletionCache.make_key("model", [{"role": "user", "content": "hi"}], 0.2))
+
+    def test_only_enabled_low_temperature_call_types_are_cached(self):
+        cache = CompletionCache(ttls=parse_ttls("relevance:60,query_rewrite"))
+
+        self.assertTrue(cache.enabled_for("relevance", 0.1))
+        self.assertFalse(cache.enabled_for("relevance", 0.9))
+        self.assertFalse(cache.enabled_for("respond", 0.1))
+        self.assertEqual(cache.ttls["query_rewrite"], 3600.0)
+
+    def test_entries_expire_after_ttl(self):
+        cache = CompletionCache(ttls={"relevance": 60})
+        with patch('llm_cache.time.time', return_value=1000.0):
+            cache.put("key", "relevance", {"content": "yes", "tool_calls": []})
+            self.assertEqual(cache.get("key")["content"], "yes")
+        with patch('llm_cache.time.time', return_value=1061.0):
+            self.assertIsNone(cache.get("key"))
+
+    def test_disk_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = str(Path(temp_dir) / "completions.sqlite")
+            CompletionCache(ttls={"relevance": 60}, path=path).put("key", "relevance", {"content": "yes"})
+
+            self.assertEqual(CompletionCache(ttls={"relevance": 60}, path=path).get("key"), {"content": "yes"})
+
+    def test_overwriting_a_key_does_not_grow_the_disk_count(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = CompletionCache(ttls={"relevance": 60}, path=str(Path(temp_dir) / "completions.sqlite"))
+            for i in range(5):
+                cache.put("key", "relevance", {"content": str(i)})
+
+            self.assertEqual(cache.stats()['disk_entries'], 1)
+
+
+class TestGetCompletionCache(unittest.TestCase):
+    def setUp(self):
+        configure_for_tests(self)
+
+        patcher = patch.object(llm_client, 'completion_cache', CompletionCache(ttls={"relevance": 60}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_response(self):
+        message = MagicMock(content="yes", tool_calls=None)
+        response = MagicMock(model="model", usage=None)
+        response.choices = [MagicMock(message=message, finish_reason="stop")]
+        return response
+
+    def test_repeated_relevance_call_skips_the_api(self):
+        """An identical cached call type request is answered from the cache"""
+        messages = [{"role": "user", "content": "is slowpoke edible?"}]
+        with patch.object(llm_client.async_client.chat.completions, 'create',
+                          new=AsyncMock(return_value=self.fake_response())) as mock_create:
+            for _ in range(3):
+                result = asyncio.run(llm_client.get_completion_async(
+                    messages, model="model", temperature=0.1, call_type="relevance"
+                ))
+            asyncio.run(llm_client.get_completion_async(messages, model="model", temperature=0.1))
+
+        self.assertEqual(result, {"content": "yes", "tool_calls": []})
+        self.assertEqual(mock_create.await_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import MagicMock, patch
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import httpx
+import openai
+from openai.types.chat import ChatCompletionChunk
+import llm_client
+
+
+def configure_for_tests(test_case):
+    """
+    Configure llm_client with a fake API key and a temporary log directory.
+
+    The previous configuration (or unconfigured state) is restored on cleanup
+    without reading the environment or .env.
+    """
+    saved = {name: vars(llm_client)[name] for name in llm_client.CONFIGURED_NAMES if name in vars(llm_client)}
+    saved_configured = llm_client._configured
+    temp_dir = tempfile.TemporaryDirectory()
+    llm_client.configure(api_key="test", log_dir=temp_dir.name, load_env=False)
+
+    def restore():
+        llm_client.call_logger.close()
+        for name in llm_client.CONFIGURED_NAMES:
+            vars(llm_client).pop(name, None)
+        vars(llm_client).update(saved)
+        llm_client._configured = saved_configured
+        temp_dir.cleanup()
+
+    test_case.addCleanup(restore)
+    return Path(temp_dir.name)
+
+
+def fake_create_embeddings(texts, model, dimensions=None):
+    return [[float(len(text))] for text in texts]
+
+
+class TestLazyConfiguration(unittest.TestCase):
+    def test_import_has_no_side_effects(self):
+        """Importing bot (and with it llm_client) needs no API key and creates no log file"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            env = {key: value for key, value in os.environ.items() if key != "OPENAI_API_KEY"}
+            env["PYTHONPATH"] = str(Path(__file__).parent)
+            subprocess.run(
+                [sys.executable, "-c", "import bot, llm_client; assert not llm_client._configured"],
+                cwd=temp_dir, env=env, check=True
+            )
+            self.assertEqual(list(Path(temp_dir).iterdir()), [])
+
+    def test_first_use_configures_with_explicit_settings(self):
+        log_dir = configure_for_tests(self)
+        llm_client.configure(api_key="test-key", base_url="http://localhost:1/v1", log_dir=log_dir, load_env=False)
+
+        self.assertEqual(llm_client.async_client.api_key, "test-key")
+        self.assertEqual(str(llm_client.client.base_url), "http://localhost:1/v1/")
+        self.assertEqual(llm_client.LOG_FILE.parent, log_dir)
+        self.assertFalse(llm_client.LOG_FILE.exists())
+
+        llm_client.log_llm_call("embedding", {"input": ["x"]}, {"embeddings_count": 1}, 0.1)
+        llm_client.call_logger.flush()
+        self.assertTrue(llm_client.LOG_FILE.exists())
+
+
+class TestEmbeddingBatches(unittest.TestCase):
+    def test_batches_respect_token_and_size_limits(self):
+        """Batches stay under both limits and preserve input order"""
+        texts = [f"text number {i} " * 20 for i in range(50)]
+        batches = llm_client.make_embedding_batches(texts, max_batch_tokens=500, max_batch_size=8)
+
+        self.assertEqual([text for batch in batches for text in batch], texts)
+        for batch in batches:
+            self.assertLessEqual(len(batch), 8)
+            if len(batch) > 1:
+                self.assertLessEqual(sum(llm_client.estimate_tokens(text) for text in batch), 500)
+
+
+class TestGetEmbeddingsBatched(unittest.TestCase):
+    def setUp(self):
+        configure_for_tests(self)
+        llm_client.embedding_cache.clear()
+        self.addCleanup(llm_client.embedding_cache.clear)
+
+        patcher = patch('llm_client.time.sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('llm_client._create_embeddings', side_effect=fake_create_embeddings)
+    def test_results_are_in_input_order(self, mock_create_embeddings):
+        """Concurrent batches are reassembled in input order"""
+        texts = [f"{'x' * i}" for i in range(1, 40)]
+        result = llm_client.get_embeddings_batched(texts, max_batch_size=5, max_concurrency=3)
+
+        self.assertEqual(result, [[float(i)] for i in range(1, 40)])
+        self.assertEqual(mock_create_embeddings.call_count, 8)
+
+    @patch('llm_client._create_embeddings')
+    def test_transient_errors_are_retried(self, mock_create_embeddings):
+        """A batch that hits a transient error is retried"""
+        request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+        mock_create_embeddings.side_effect = [
+            openai.APIConnectionError(request=request),
+            [[1.0], [2.0]]
+        ]
+
+        result = llm_client.get_embeddings_batched(["a", "bb"], use_cache=False)
+
+        self.assertEqual(result, [[1.0], [2.0]])
+        self.assertEqual(mock_create_embeddings.call_count, 2)
+
+    @patch('llm_client._create_embeddings', side_effect=fake_create_embeddings)
+    def test_checkpoint_resumes_finished_batches(self, mock_create_embeddings):
+        """Batches saved to the checkpoint directory are not embedded again"""
+        texts = ["a", "bb", "ccc", "dddd"]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            checkpoint_dir = Path(temp_dir)
+            llm_client.get_embeddings_batched(
+                texts, max_batch_size=2, checkpoint_dir=checkpoint_dir, use_cache=False
+            )
+            mock_create_embeddings.reset_mock()
+
+            result = llm_client.get_embeddings_batched(
+                texts, max_batch_size=2, checkpoint_dir=checkpoint_dir, use_cache=False
+            )
+
+            mock_create_embeddings.assert_not_called()
+            self.assertEqual(result, [[1.0], [2.0], [3.0], [4.0]])
+
+
+def fake_completion(content):
+    message = MagicMock(content=content, tool_calls=None)
+    response = MagicMock(model="model", usage=None)
+    response.choices = [MagicMock(message=message, finish_reason="stop")]
+    return response
+
+
+class TestCompletionReliability(unittest.TestCase):
+    def setUp(self):
+        configure_for_tests(self)
+
+        # No backoff delay between retries
+        patcher = patch('llm_client.random.uniform', return_value=0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = patch.object(llm_client, 'completion_latencies', llm_client.LatencyTracker(min_samples=1))
+        self.latencies = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.calls = []
+        patcher = patch.object(llm_client.async_client.chat.completions, 'create', new=self.create)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def create(self, **kwargs):
+        """Fake API: behaviour of the n-th call is taken from self.behaviours"""
+        behaviour = self.behaviours[len(self.calls)]
+        self.calls.append(kwargs)
+        if isinstance(behaviour, Exception):
+            raise behaviour
+        delay, content = behaviour
+        await asyncio.sleep(delay)
+        return fake_completion(content)
+
+    def complete(self, **kwargs):
+        messages = [{"role": "user", "content": "hi"}]
+        return asyncio.run(llm_client.get_completion_async(messages, model="model", **kwargs))
+
+    def test_transient_errors_are_retried(self):
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        self.behaviours = [openai.APIConnectionError(request=request), (0, "hello")]
+
+        self.assertEqual(self.complete(max_retries=2)["content"], "hello")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_attempt_past_deadline_is_retried_then_fails(self):
+        """A slow attempt times out; once retries are exhausted the error is raised"""
+        self.behaviours = [(1.0, "late"), (0, "hello")]
+        self.assertEqual(self.complete(timeout=0.05, max_retries=1)["content"], "hello")
+
+        self.calls = []
+        self.behaviours = [(1.0, "late"), (1.0, "late")]
+        with self.assertRaises(Exception):
+            self.complete(timeout=0.05, max_retries=1)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_overall_deadline_caps_retries_and_backoff(self):
+        """Slow attempts are retried only until the call's overall deadline"""
+        self.behaviours = [(1.0, "late")] * 4
+
+        start_time = time.monotonic()
+        with self.assertRaises(Exception) as raised:
+            self.complete(timeout=0.2, max_retries=3, deadline=0.3)
+
+        self.assertLess(time.monotonic() - start_time, 0.6)
+        self.assertIn("deadline", str(raised.exception))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_slow_attempt_is_hedged(self):
+        """An attempt slower than the observed p95 gets a duplicate; the faster one wins"""
+        self.latencies.record(("model", "completion"), 0.05)
+        self.behaviours = [(1.0, "slow"), (0, "hedge")]
+
+        result = self.complete(hedge=True, max_retries=0)
+
+        self.assertEqual(result["content"], "hedge")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_lost_and_timed_out_attempts_are_censored_latency_samples(self):
+        """A primary attempt that loses a hedge or times out still enters the window with its elapsed time"""
+        key = ("model", "completion")
+        self.latencies.record(key, 0.05)
+        self.behaviours = [(1.0, "slow"), (0.05, "hedge")]
+        self.complete(hedge=True, max_retries=0)
+
+        # Only the cancelled primary is recorded; the duplicate started late and is not
+        samples = list(self.latencies._latencies[key])
+        self.assertEqual(len(samples), 2)
+        self.assertGreaterEqual(samples[1], 0.09)
+
+        self.calls = []
+        self.behaviours = [(1.0, "late"), (0, "hello")]
+        self.complete(timeout=0.1, max_retries=1)
+        self.assertGreaterEqual(list(self.latencies._latencies[key])[2], 0.09)
+
+
+def fake_stream(deltas, stall_after=None):
+    """Async chunk iterator yielding one ChatCompletionChunk per delta dict, then a usage chunk"""
+    async def chunks():
+        for index, delta in enumerate(deltas):
+            if index == stall_after:
+                await asyncio.sleep(1.0)
+            yield ChatCompletionChunk.model_validate({
+                'id': 'chunk', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'model',
+                'choices': [{
+                    'index': 0, 'delta': delta,
+                    'finish_reason': 'stop' if index == len(deltas) - 1 else None
+                }]
+            })
+        yield ChatCompletionChunk.model_validate({
+            'id': 'chunk', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'model', 'choices': [],
+            'usage': {'prompt_tokens': 5, 'completion_tokens': 3, 'total_tokens': 8}
+        })
+    return chunks()
+
+
+class TestCompletionStreaming(unittest.TestCase):
+    def setUp(self):
+        configure_for_tests(self)
+
+    def complete(self, create, **kwargs):
+        messages = [{"role": "user", "content": "hi"}]
+        with patch.object(llm_client.async_client.chat.completions, 'create', new=create):
+            return asyncio.run(llm_client.get_completion_async(messages, model="model", stream=True, **kwargs))
+
+    def test_content_deltas_reach_callback_and_result(self):
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs)
+            return fake_stream([{'content': 'Hel'}, {'content': 'lo'}, {}])
+
+        tokens = []
+        result = self.complete(create, on_token=tokens.append)
+
+        self.assertEqual(tokens, ['Hel', 'lo'])
+        self.assertEqual(result, {'content': 'Hello', 'tool_calls': []})
+        self.assertTrue(calls[0]['stream'])
+
+    def test_tool_call_deltas_are_assembled(self):
+        async def create(**kwargs):
+            return fake_stream([
+                {'tool_calls': [{'index': 0, 'id': 'call_1', 'type': 'function',
+                                 'function': {'name': 'lookup', 'arguments': '{"na'}}]},
+                {'tool_calls': [{'index': 0, 'function': {'arguments': 'me": "x"}'}}]}
+            ])
+
+        result = self.complete(create)
+
+        self.assertIsNone(result['content'])
+        self.assertEqual(result['tool_calls'][0]['id'], 'call_1')
+        self.assertEqual(result['tool_calls'][0]['function'], {'name': 'lookup', 'arguments': '{"name": "x"}'})
+
+    def test_stalled_stream_is_not_retried_after_first_token(self):
+        """The deadline applies per chunk; a stream that already produced tokens is not restarted"""
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs)
+            return fake_stream([{'content': 'a'}, {'content': 'b'}], stall_after=1)
+
+        with self.assertRaises(Exception):
+            self.complete(create, timeout=0.05, max_retries=2, on_token=lambda token: None)
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import asyncio
+import json
+from llm_decision import StreamingTextExtractor, budget_history, respond
+
+
+def feed_in_chunks(raw, size):
+    extractor = StreamingTextExtractor()
+    pieces = [extractor.feed(raw[i:i + size]) for i in range(0, len(raw), size)]
+    return extractor, pieces
+
+
+class TestStreamingTextExtractor(unittest.TestCase):
+    def test_text_field_is_decoded_across_chunk_boundaries(self):
+        """Escapes, unicode escapes and surrogate pairs split over chunks decode correctly"""
+        raw = json.dumps({"text": 'Say "hi"\nto café \U0001F600', "workflow": None})
+        for size in (1, 2, 3, 7, len(raw)):
+            extractor, _ = feed_in_chunks(raw, size)
+            self.assertEqual(extractor.text, 'Say "hi"\nto café \U0001F600')
+
+    def test_text_is_emitted_before_the_object_is_complete(self):
+        extractor = StreamingTextExtractor()
+        self.assertEqual(extractor.feed('```json\n{"text": "Hel'), "Hel")
+        self.assertEqual(extractor.feed('lo", "decision_option'), "lo")
+        self.assertEqual(extractor.feed('": null}\n```'), "")
+
+    def test_only_the_top_level_text_value_is_emitted(self):
+        """A "text" string used as another field's value or in a nested object is ignored"""
+        raw = '{"decision_option": "text", "meta": {"text": "nested"}, "workflow": null, "text": "top"}'
+        extractor, _ = feed_in_chunks(raw, 4)
+        self.assertEqual(extractor.text, "top")
+
+    def test_null_text_emits_nothing(self):
+        extractor, pieces = feed_in_chunks('{"text": null, "decision_option": "yes"}', 5)
+        self.assertEqual(extractor.text, "")
+        self.assertEqual("".join(pieces), "")
+
+
+def conversation_with_tool_call():
+    return [
+        {"role": "user", "content": "old question " * 50},
+        {"role": "assistant", "content": "old answer " * 50},
+        {"role": "user", "content": "How is Pokemon 25?"},
+        {"role": "assistant", "content": "I'll look that up for you.", "tool_calls": [
+            {"id": "call_1", "type": "function", "function": {"name": "pokemon_health_check", "arguments": "{}"}}
+        ]},
+        {"role": "tool", "tool_call_id": "call_1", "content": "Healthy"},
+        {"role": "assistant", "content": "Pikachu is healthy."},
+        {"role": "user", "content": "Great, thanks"}
+    ]
+
+
+class TestBudgetHistory(unittest.TestCase):
+    def test_history_within_budget_is_unchanged(self):
+        messages = conversation_with_tool_call()
+        kept, stats = budget_history(messages, max_tokens=100_000)
+
+        self.assertEqual(kept, messages)
+        self.assertEqual(stats["history_tokens_saved"], 0)
+
+    def test_oldest_messages_are_dropped_first(self):
+        messages = conversation_with_tool_call()
+        kept, stats = budget_history(messages, max_tokens=120)
+
+        self.assertEqual(kept, messages[2:])
+        self.assertEqual(stats["history_messages_sent"], 5)
+        self.assertGreater(stats["history_tokens_saved"], 200)
+
+    def test_tool_call_and_result_stay_together(self):
+        """A message cap that would split a tool call from its result drops both"""
+        messages = conversation_with_tool_call()
+
+        kept, _ = budget_history(messages, max_tokens=100_000, max_messages=3)
+        self.assertEqual(kept, messages[5:])
+
+        kept, _ = budget_history(messages, max_tokens=100_000, max_messages=4)
+        self.assertEqual(kept, messages[3:])
+
+    def test_orphaned_tool_results_are_dropped(self):
+        messages = conversation_with_tool_call()[4:]
+        kept, _ = budget_history(messages, max_tokens=100_000)
+
+        self.assertEqual([m["role"] for m in kept], ["assistant", "user"])
+
+    def test_newest_message_is_kept_over_budget(self):
+        messages = [{"role": "user", "content": "long " * 1000}]
+        kept, _ = budget_history(messages, max_tokens=10)
+
+        self.assertEqual(kept, messages)
+
+
+class TestRespondStreaming(unittest.TestCase):
+    def test_on_text_receives_text_while_streaming(self):
+        content = '{"text": "Pikachu is not edible.", "decision_option": null, "workflow": null}'
+
+        async def fake_completion(**kwargs):
+            self.assertTrue(kwargs['stream'])
+            for i in range(0, len(content), 6):
+                kwargs['on_token'](content[i:i + 6])
+            return {'content': content, 'tool_calls': []}
+
+        streamed = []
+        with patch('llm_decision.get_completion_async', new=fake_completion):
+            decision = asyncio.run(respond([], ["edibility_determination"], None, "", on_text=streamed.append))
+
+        self.assertEqual("".join(streamed), "Pikachu is not edible.")
+        self.assertEqual(decision["text"], "Pikachu is not edible.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import unittest
+import json
+import tempfile
+from pathlib import Path
+import yaml
+from llm_logger import LLMCallLogger
+
+
+class TestLLMCallLogger(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.log_dir = Path(self.temp_dir.name)
+
+    def create_logger(self, name="session.yaml", **kwargs):
+        logger = LLMCallLogger(self.log_dir / name, "abc123", **kwargs)
+        self.addCleanup(logger.close)
+        return logger
+
+    def test_calls_are_appended_as_yaml_documents(self):
+        """The log is a YAML stream: a session header followed by one document per call"""
+        logger = self.create_logger()
+        for i in range(3):
+            logger.log("completion_async", {"messages": [{"role": "user", "content": f"hi {i}\nthere"}]},
+                       {"content": "hello"}, 0.25)
+        logger.flush()
+
+        documents = list(yaml.safe_load_all(logger.log_file.read_text(encoding="utf-8")))
+        self.assertEqual(documents[0]["session_info"]["session_id"], "abc123")
+        self.assertEqual([doc["call_id"] for doc in documents[1:]], ["call_001", "call_002", "call_003"])
+        self.assertEqual(documents[3]["input"]["messages"][0]["content"], "hi 2\nthere")
+
+    def test_file_is_created_by_the_first_call(self):
+        logger = self.create_logger()
+        self.assertFalse(logger.log_file.exists())
+
+        logger.log("embedding", {"input": ["text"]}, {"embeddings_count": 1}, 0.1)
+        logger.flush()
+        self.assertTrue(logger.log_file.exists())
+
+    def test_jsonl_format_without_prompts(self):
+        """JSONL logs one object per line; prompts can be omitted"""
+        logger = self.create_logger("session.jsonl", log_format="jsonl", log_prompts=False)
+        logger.log("embedding", {"input": ["secret text"], "model": "m"}, {"embeddings_count": 1}, 0.1)
+        logger.flush()
+
+        lines = logger.log_file.read_text(encoding="utf-8").splitlines()
+        call = json.loads(lines[1])
+        self.assertEqual(call["input"]["model"], "m")
+        self.assertNotIn("secret text", lines[1])
+
+    def test_file_rotates_past_max_bytes(self):
+        """Rotation keeps at most backup_count old files"""
+        logger = self.create_logger(max_bytes=500, backup_count=2)
+        for i in range(30):
+            logger.log("embedding", {"input": ["x" * 100]}, {"embeddings_count": 1}, 0.1)
+        logger.flush()
+
+        self.assertEqual(
+            sorted(path.name for path in self.log_dir.iterdir()),
+            ["session.yaml", "session.yaml.1", "session.yaml.2"]
+        )
+        self.assertLess(logger.log_file.stat().st_size, 1000)
+        header = next(yaml.safe_load_all(logger.log_file.read_text(encoding="utf-8")))
+        self.assertIn("session_info", header)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import unittest
+import asyncio
+import threading
+import time
+from rate_limiter import BACKGROUND, INTERACTIVE, RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    def drained_limiter(self, **kwargs):
+        limiter = RateLimiter(**kwargs)
+        limiter._requests = 0.0
+        limiter._tokens = 0.0
+        return limiter
+
+    def test_unlimited_limiter_never_waits(self):
+        limiter = RateLimiter()
+        start_time = time.perf_counter()
+        for _ in range(1000):
+            limiter.acquire(tokens=10_000)
+        self.assertLess(time.perf_counter() - start_time, 0.1)
+
+    def test_request_bucket_paces_requests(self):
+        """Once the bucket is empty, requests are admitted at the configured rate"""
+        limiter = self.drained_limiter(requests_per_minute=1200)  # one per 50ms
+        start_time = time.perf_counter()
+        for _ in range(3):
+            limiter.acquire()
+        self.assertGreaterEqual(time.perf_counter() - start_time, 0.14)
+
+    def test_token_bucket_paces_by_tokens(self):
+        limiter = self.drained_limiter(tokens_per_minute=60_000)  # 1000 tokens/s
+        start_time = time.perf_counter()
+        asyncio.run(limiter.acquire_async(tokens=200))
+        self.assertGreaterEqual(time.perf_counter() - start_time, 0.19)
+
+    def test_interactive_calls_go_before_background_calls(self):
+        """A later interactive waiter is admitted before earlier background waiters"""
+        limiter = self.drained_limiter(requests_per_minute=600)  # one per 100ms
+        order = []
+
+        async def call(name, priority, delay):
+            await asyncio.sleep(delay)
+            await limiter.acquire_async(priority=priority)
+            order.append(name)
+
+        async def run():
+            await asyncio.gather(
+                call("relevance-1", BACKGROUND, 0),
+                call("relevance-2", BACKGROUND, 0),
+                call("respond", INTERACTIVE, 0.02)
+            )
+
+        asyncio.run(run())
+        self.assertEqual(order[0], "respond")
+
+    def test_shared_across_threads_and_loops(self):
+        """Waiters on different threads and event loops share one budget"""
+        limiter = self.drained_limiter(requests_per_minute=1200)
+        threads = [
+            threading.Thread(target=lambda: asyncio.run(limiter.acquire_async())),
+            threading.Thread(target=limiter.acquire),
+            threading.Thread(target=lambda: asyncio.run(limiter.acquire_async()))
+        ]
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.perf_counter() - start_time, 0.14)
+        self.assertEqual(limiter._waiters, [])
+
+
+if __name__ == "__main__":
+    unittest.main()